@@ -2,7 +2,7 @@
 #
 # analyze_rounds.sh - Analyze consensus_rounds.csv and validate against paper statistics
 #
-# Usage: ./analyze_rounds.sh <path_to_consensus_rounds.csv>
+# Usage: ./analyze_rounds.sh <path_to_consensus_rounds.csv> [stake_snapshot.csv]
 #
 # Outputs statistics comparing observed data to theoretical model:
 # - Vote counts per round (soft, cert, next)
@@ -13,7 +13,7 @@
 set -e
 
 if [ -z "$1" ]; then
-    echo "Usage: $0 <path_to_consensus_rounds.csv>"
+    echo "Usage: $0 <path_to_consensus_rounds.csv> [stake_snapshot.csv]"
     exit 1
 fi
 
@@ -28,6 +28,12 @@ fi
 SOFT_THEORY=354
 CERT_THEORY=233
 NEXT_THEORY=477
+if [ -n "$2" ]; then
+    # Expected unique voters for this snapshot (cached by sortition_cache.py);
+    # captured first because set -e does not see failures in process substitution
+    THEORY=$(python3 "$(dirname "$0")/sortition_cache.py" "$2" --print) || exit 1
+    read SOFT_THEORY CERT_THEORY NEXT_THEORY <<< "$THEORY"
+fi
 CERT_THRESHOLD=1112
 SOFT_THRESHOLD=2267
 
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Fit stake-conditioned vote arrival-delay distributions from consensus_votes_detail.csv.
+
+derive_voters.py assumes votes arrive in uniformly random order, which
+under-predicts soft voters and over-predicts cert voters (learnings.md §3):
+whale votes arrive early. This script fits, per consensus step and per
+credential-weight bucket, a histogram of arrival delay measured from the first
+vote of that (round, step). It also fits the "late span" - how long votes keep
+arriving after the threshold is crossed - which drives overshoot, and the
+"advance lag" - how long after the threshold the node left the step - which
+splits that overshoot into on-time and late votes.
+
+The fit is a single streaming pass over the log; only the rounds still being
+written are buffered. The fitted model is saved as JSON and can be passed to
+derive_voters.py so the simulator samples arrival order instead of shuffling.
+"""
+
+import bisect
+import csv
+import json
+import math
+import random
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from consensus_logs import ROUND_LOOKBACK
+
+# Thresholds per step (soft=1, cert=2, next>=3), go-algorand v8+
+STEP_THRESHOLDS = {1: 2267, 2: 1112, 3: 3838}
+STEP_NAMES = {1: "Soft", 2: "Cert", 3: "Next"}
+
+# Weight buckets are powers of two: 1, 2-3, 4-7, ..., 128+
+MAX_WEIGHT_BUCKET = 7
+
+# Delay histogram: log2-spaced bins, BINS_PER_OCTAVE per doubling of (ms + 1)
+BINS_PER_OCTAVE = 4
+NUM_DELAY_BINS = 72  # covers up to ~2^18 ms
+
+MODEL_VERSION = 2
+
+
+def step_key(step: int) -> int:
+    """Collapse all next-vote steps (3, 4, ...) onto step 3."""
+    return step if step < 3 else 3
+
+
+def weight_bucket(weight: int) -> int:
+    """Return the power-of-two bucket for a credential weight."""
+    return min(max(weight, 1).bit_length() - 1, MAX_WEIGHT_BUCKET)
+
+
+def delay_bin(delay_ms: float) -> int:
+    """Return the log-spaced histogram bin for a delay in milliseconds."""
+    b = int(math.log2(delay_ms + 1.0) * BINS_PER_OCTAVE)
+    return min(max(b, 0), NUM_DELAY_BINS - 1)
+
+
+def bin_bounds(b: int):
+    """Return (low, high) delay in ms covered by histogram bin b."""
+    lo = 2.0 ** (b / BINS_PER_OCTAVE) - 1.0
+    hi = 2.0 ** ((b + 1) / BINS_PER_OCTAVE) - 1.0
+    return lo, hi
+
+
+class DelayHistogram:
+    """Log-spaced delay histogram with inverse-CDF sampling."""
+
+    def __init__(self, counts: Optional[List[int]] = None):
+        self.counts = counts if counts is not None else [0] * NUM_DELAY_BINS
+        self._cdf = None
+
+    def add(self, delay_ms: float):
+        self.counts[delay_bin(delay_ms)] += 1
+        self._cdf = None
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def _cumulative(self) -> List[int]:
+        if self._cdf is None:
+            cdf = []
+            running = 0
+            for c in self.counts:
+                running += c
+                cdf.append(running)
+            self._cdf = cdf
+        return self._cdf
+
+    def sample(self) -> float:
+        """Draw a delay (ms): pick a bin by count, then uniform within the bin."""
+        cdf = self._cumulative()
+        total = cdf[-1]
+        if total == 0:
+            return 0.0
+        b = bisect.bisect_right(cdf, random.random() * total)
+        b = min(b, NUM_DELAY_BINS - 1)
+        lo, hi = bin_bounds(b)
+        return lo + (hi - lo) * random.random()
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile (ms), using the bin midpoint."""
+        cdf = self._cumulative()
+        total = cdf[-1]
+        if total == 0:
+            return 0.0
+        b = bisect.bisect_left(cdf, q * total)
+        lo, hi = bin_bounds(min(b, NUM_DELAY_BINS - 1))
+        return (lo + hi) / 2
+
+
+class StepArrivalModel:
+    """Arrival-delay model for one consensus step."""
+
+    def __init__(self, step: int):
+        self.step = step
+        self.delays: Dict[int, DelayHistogram] = defaultdict(DelayHistogram)
+        self.late_span = DelayHistogram()
+        self.advance_lag = DelayHistogram()
+        # Observed per-round aggregates, used to validate the simulator
+        self.rounds = 0
+        self.sum_voters_to_threshold = 0
+        self.sum_total_voters = 0
+        self.sum_late_voters = 0
+
+    def sample_delay(self, weight: int) -> float:
+        """Sample an arrival delay (ms) for a vote of the given weight."""
+        bucket = weight_bucket(weight)
+        hist = self.delays.get(bucket)
+        # Fall back to the nearest populated bucket below, then above
+        if hist is None or hist.total == 0:
+            for b in list(range(bucket - 1, -1, -1)) + list(range(bucket + 1, MAX_WEIGHT_BUCKET + 1)):
+                hist = self.delays.get(b)
+                if hist is not None and hist.total > 0:
+                    break
+            else:
+                return 0.0
+        return hist.sample()
+
+    def sample_late_span(self) -> float:
+        """Sample how long (ms) votes keep arriving after the threshold is crossed."""
+        return self.late_span.sample()
+
+    def sample_advance_lag(self) -> float:
+        """Sample how long (ms) after the threshold the node advanced; later votes are late."""
+        return self.advance_lag.sample()
+
+    def observed(self) -> Dict[str, float]:
+        """Mean observed per-round counts."""
+        n = max(self.rounds, 1)
+        return {
+            'rounds': self.rounds,
+            'voters_to_threshold': self.sum_voters_to_threshold / n,
+            'total_voters': self.sum_total_voters / n,
+            'late_voters': self.sum_late_voters / n,
+            'overshoot': (self.sum_total_voters - self.sum_voters_to_threshold) / n,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            'delays': {str(b): h.counts for b, h in self.delays.items()},
+            'late_span': self.late_span.counts,
+            'advance_lag': self.advance_lag.counts,
+            'rounds': self.rounds,
+            'sum_voters_to_threshold': self.sum_voters_to_threshold,
+            'sum_total_voters': self.sum_total_voters,
+            'sum_late_voters': self.sum_late_voters,
+        }
+
+    @classmethod
+    def from_dict(cls, step: int, d: dict) -> 'StepArrivalModel':
+        m = cls(step)
+        for b, counts in d['delays'].items():
+            m.delays[int(b)] = DelayHistogram(counts)
+        m.late_span = DelayHistogram(d['late_span'])
+        m.advance_lag = DelayHistogram(d['advance_lag'])
+        m.rounds = d['rounds']
+        m.sum_voters_to_threshold = d['sum_voters_to_threshold']
+        m.sum_total_voters = d['sum_total_voters']
+        m.sum_late_voters = d['sum_late_voters']
+        return m
+
+
+class ArrivalModel:
+    """Per-step arrival models, fitted from a vote-detail log."""
+
+    def __init__(self):
+        self.steps: Dict[int, StepArrivalModel] = {}
+        # Fit diagnostics (not saved): rows for rounds already flushed
+        self.dropped_rows = 0
+        self.dropped_rounds = 0
+
+    def for_step(self, step: int) -> Optional[StepArrivalModel]:
+        return self.steps.get(step_key(step))
+
+    def _step_model(self, step: int) -> StepArrivalModel:
+        key = step_key(step)
+        if key not in self.steps:
+            self.steps[key] = StepArrivalModel(key)
+        return self.steps[key]
+
+    def add_round_step(self, step: int, votes: List[tuple]):
+        """Fold one (round, step) group of (weight, timestamp_ns, is_late) into the model."""
+        if not votes:
+            return
+        model = self._step_model(step)
+        threshold = STEP_THRESHOLDS[model.step]
+        votes.sort(key=lambda v: v[1])
+        t0 = votes[0][1]
+
+        cumulative = 0
+        t_threshold = None
+        voters_to_threshold = len(votes)
+        late = 0
+        last_on_time = None
+        first_late = None
+        for i, (weight, ts, is_late) in enumerate(votes):
+            model.delays[weight_bucket(weight)].add((ts - t0) / 1e6)
+            if is_late:
+                late += 1
+                if first_late is None:
+                    first_late = ts
+            else:
+                last_on_time = ts
+            if t_threshold is None:
+                cumulative += weight
+                if cumulative >= threshold:
+                    t_threshold = ts
+                    voters_to_threshold = i + 1
+
+        # Rounds that never reached threshold locally say nothing about overshoot
+        if t_threshold is None:
+            return
+        model.late_span.add((votes[-1][1] - t_threshold) / 1e6)
+        # The node advanced after its last on-time vote and before its first
+        # late one; take the midpoint when both bound it
+        advance = max(t_threshold, last_on_time or t_threshold)
+        if first_late is not None and first_late > advance:
+            advance = (advance + first_late) / 2
+        model.advance_lag.add((advance - t_threshold) / 1e6)
+        model.rounds += 1
+        model.sum_voters_to_threshold += voters_to_threshold
+        model.sum_total_voters += len(votes)
+        model.sum_late_voters += late
+
+    def save(self, filepath: str):
+        data = {
+            'version': MODEL_VERSION,
+            'bins_per_octave': BINS_PER_OCTAVE,
+            'steps': {str(s): m.to_dict() for s, m in self.steps.items()},
+        }
+        with open(filepath, 'w') as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'ArrivalModel':
+        with open(filepath, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != MODEL_VERSION or data.get('bins_per_octave') != BINS_PER_OCTAVE:
+            raise ValueError(f"Incompatible arrival model file: {filepath}")
+        model = cls()
+        for s, d in data['steps'].items():
+            model.steps[int(s)] = StepArrivalModel.from_dict(int(s), d)
+        return model
+
+
+def fit_arrival_model(votes_file: str) -> ArrivalModel:
+    """
+    Fit an ArrivalModel in one streaming pass over consensus_votes_detail.csv.
+    Rows are appended per round, so only the last few rounds are kept open.
+
+    A row for a round that was already flushed (more than ROUND_LOOKBACK rounds
+    behind the newest) cannot be folded in after the fact; it is dropped and
+    counted in model.dropped_rows / model.dropped_rounds rather than starting
+    a second, partial group for that round.
+    """
+    model = ArrivalModel()
+    open_rounds = defaultdict(lambda: defaultdict(list))  # round -> step -> votes
+    newest = -1
+    dropped_rounds = set()
+
+    with open(votes_file, 'r') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        col = {name: i for i, name in enumerate(header)}
+        i_round = col['round']
+        i_step = col['step']
+        i_weight = col['credential_weight']
+        i_ts = col['timestamp_unix_ns']
+        i_late = col['is_late']
+
+        for row in reader:
+            rnd = int(row[i_round])
+            if rnd < newest - ROUND_LOOKBACK:
+                model.dropped_rows += 1
+                dropped_rounds.add(rnd)
+                continue
+            open_rounds[rnd][int(row[i_step])].append(
+                (int(row[i_weight]), int(row[i_ts]), row[i_late] == 'true')
+            )
+            if rnd > newest:
+                newest = rnd
+                for done in [r for r in open_rounds if r < newest - ROUND_LOOKBACK]:
+                    for step, votes in open_rounds.pop(done).items():
+                        model.add_round_step(step, votes)
+
+    for rnd in sorted(open_rounds):
+        for step, votes in open_rounds[rnd].items():
+            model.add_round_step(step, votes)
+
+    model.dropped_rounds = len(dropped_rounds)
+    return model
+
+
+def print_model(model: ArrivalModel):
+    """Print median/p90 delay per weight bucket for each step."""
+    for step in sorted(model.steps):
+        m = model.steps[step]
+        obs = m.observed()
+        print(f"\n{'='*60}")
+        print(f"{STEP_NAMES[step].upper()} VOTES (step={step}, {obs['rounds']} rounds reaching threshold)")
+        print(f"{'='*60}")
+        print(f"{'Weight':<10} {'Votes':>10} {'p50 ms':>10} {'p90 ms':>10}")
+        print("-" * 44)
+        for b in sorted(m.delays):
+            h = m.delays[b]
+            lo = 1 << b
+            label = f"{lo}+" if b == MAX_WEIGHT_BUCKET else f"{lo}-{(lo << 1) - 1}"
+            print(f"{label:<10} {h.total:>10,} {h.quantile(0.5):>10.0f} {h.quantile(0.9):>10.0f}")
+        print(f"\nLate span after threshold: p50 {m.late_span.quantile(0.5):.0f} ms, "
+              f"p90 {m.late_span.quantile(0.9):.0f} ms")
+        print(f"Advance lag after threshold: p50 {m.advance_lag.quantile(0.5):.0f} ms, "
+              f"p90 {m.advance_lag.quantile(0.9):.0f} ms")
+        print(f"Observed: {obs['voters_to_threshold']:.1f} voters to threshold, "
+              f"{obs['total_voters']:.1f} total, {obs['late_voters']:.1f} late")
+
+
+def simulate_step(selection_probs, tau_over_W: float, threshold: int, trials: int,
+                  arrival_model: Optional[StepArrivalModel] = None):
+    """
+    Mean (voters to threshold, overshoot, late) over `trials` sortition draws.
+    Calls derive_voters.simulate_trial directly, so no progress lines are printed.
+    """
+    from derive_voters import simulate_trial
+
+    voters, overshoot, late = [], [], []
+    for _ in range(trials):
+        result = simulate_trial(selection_probs, tau_over_W, threshold, arrival_model)
+        if result is None:
+            continue
+        voters.append(result[0])
+        if result[1] is not None:
+            overshoot.append(result[1])
+            late.append(result[2])
+
+    def mean(xs):
+        return sum(xs) / len(xs) if xs else 0.0
+    return mean(voters), mean(overshoot), mean(late)
+
+
+def validate(model: ArrivalModel, stake_file: str, trials: int = 200):
+    """Compare simulated (shuffled vs fitted arrival) against observed counts."""
+    from derive_voters import ConsensusParams, load_stakes, selection_table
+
+    params = ConsensusParams()
+    committees = {
+        1: (params.soft_committee_size, params.soft_threshold),
+        2: (params.cert_committee_size, params.cert_threshold),
+        3: (params.next_committee_size, params.next_threshold),
+    }
+    stakes, total_stake = load_stakes(stake_file)
+
+    print(f"\n{'='*60}")
+    print(f"SIMULATION VS OBSERVED ({trials} trials each)")
+    print(f"{'='*60}")
+    print(f"{'Step':<6} {'Shuffled':>10} {'Fitted':>10} {'Observed':>10} {'Overshoot':>10} {'Obs over':>10} "
+          f"{'Late':>10} {'Obs late':>10}")
+    print(f"{'-'*6} {'-'*10} {'-'*10} {'-'*10} {'-'*10} {'-'*10} {'-'*10} {'-'*10}")
+    for step in sorted(model.steps):
+        m = model.steps[step]
+        if m.rounds == 0:
+            continue
+        committee, threshold = committees[step]
+        tau_over_W = committee / total_stake
+        selection_probs = selection_table(stakes, tau_over_W)
+        shuffled, _, _ = simulate_step(selection_probs, tau_over_W, threshold, trials)
+        fitted, mean_over, mean_late = simulate_step(selection_probs, tau_over_W, threshold, trials, m)
+        obs = m.observed()
+        print(f"{STEP_NAMES[step]:<6} {shuffled:>10.1f} {fitted:>10.1f} {obs['voters_to_threshold']:>10.1f} "
+              f"{mean_over:>10.1f} {obs['overshoot']:>10.1f} {mean_late:>10.1f} {obs['late_voters']:>10.1f}")
+
+
+def main():
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: arrival_model.py <consensus_votes_detail.csv> [model.json] [stake_file.csv]")
+        sys.exit(1)
+
+    votes_file = sys.argv[1]
+    model_file = sys.argv[2] if len(sys.argv) > 2 else "arrival_model.json"
+
+    print(f"Fitting arrival model from: {votes_file}")
+    model = fit_arrival_model(votes_file)
+    model.save(model_file)
+    print(f"Saved model to: {model_file}")
+    if model.dropped_rows:
+        print(f"Dropped {model.dropped_rows:,} row(s) for {model.dropped_rounds:,} round(s) arriving more than "
+              f"{ROUND_LOOKBACK} rounds behind the newest (already flushed)")
+
+    print_model(model)
+
+    if len(sys.argv) > 3:
+        validate(model, sys.argv[3])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Benchmark the analysis entry points against fixed synthetic inputs.
+
+Each entry point (analyze_rounds.sh, quantify_whale_impact*.py,
+profile_votes_by_stake.py, derive_voters.py) is run as a subprocess against
+logs from synthetic_logs.py at several sizes (default 1k, 10k, 100k rounds).
+Inputs are generated once per (size, seed) under --data-dir and reused, so
+runs are comparable. They take about INPUT_BYTES_PER_ROUND of disk per round,
+almost all of it consensus_votes_detail.csv: ~6.3 GB for the default sizes,
+5.7 GB of it for the 100k-round input.
+
+Per run we record wall time, peak RSS (from wait4, so it covers the script
+and the awk/bash children it waits for) and input rows per second. Linux
+carries ru_maxrss across exec, so a child never reports less than this
+process's RSS at spawn; the generator therefore runs as a subprocess to keep
+that floor at a bare interpreter, and the floor is printed with the results. Results
+are compared with a baseline JSON (bench_baselines.json by default); wall
+time or RSS more than --tolerance above baseline is flagged, and the exit
+status is 1 if anything regressed. No baseline is committed, since wall times
+are machine-specific: record one on the machine being tracked with
+
+    ./bench_analysis.py --save-baseline
+
+(same --sizes and --seed as later runs), then rerun without --save-baseline
+to compare. Without a baseline nothing can be flagged, and the run says so.
+
+The scaling table gives, between consecutive sizes, the exponent
+log(t2 / t1) / log(n2 / n1) for time and RSS. Linear scaling is 1.0; an
+exponent above 1 + SCALING_SLACK marks where a script stops scaling linearly.
+derive_voters.py depends only on the stake snapshot, so it runs once, with a
+fixed trial count and the --seed so its adaptive stopping cannot vary the work.
+"""
+
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from consensus_logs import DEFAULT_STAKE_FILE
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_TOLERANCE = 0.20
+MIN_REGRESSION_S = 0.25  # ignore slowdowns smaller than this (process startup noise)
+SCALING_SLACK = 0.15
+INPUT_BYTES_PER_ROUND = 57_000  # synthetic_logs.py output, ~350 vote-detail rows per round
+DERIVE_TRIALS = 2000  # trials per step for derive_voters.py
+
+# name -> (command template, input rows counted: 'rounds', 'votes' or None)
+ENTRY_POINTS = {
+    'analyze_rounds': (['bash', 'analyze_rounds.sh', '{rounds_file}', '{stake_file}'], 'rounds'),
+    'quantify_whale_impact': ([sys.executable, 'quantify_whale_impact.py', '{votes_file}', '{stake_file}'], 'votes'),
+    'quantify_whale_impact_soft': ([sys.executable, 'quantify_whale_impact_soft.py', '{votes_file}', '{stake_file}'], 'votes'),
+    'profile_votes_by_stake': ([sys.executable, 'profile_votes_by_stake.py', '{votes_file}', '{stake_file}'], 'votes'),
+    # Fixed, seeded workload: tolerance 0 never converges, so every step runs DERIVE_TRIALS
+    'derive_voters': ([sys.executable, 'derive_voters.py', '{stake_file}', '--tolerance=0',
+                       f'--max-trials={DERIVE_TRIALS}', '--seed={seed}'], None),
+}
+
+
+def count_rows(path: str) -> int:
+    """Data rows in a CSV (lines minus the header)."""
+    lines = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            lines += chunk.count(b'\n')
+    return lines - 1
+
+
+def ensure_inputs(stake_file: str, data_dir: str, rounds: int, seed: int, workers: Optional[int]) -> dict:
+    """Generate (or reuse) synthetic logs for one size; returns the manifest."""
+    out_dir = os.path.join(data_dir, f"r{rounds}-s{seed}")
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+
+    print(f"  Generating {rounds:,} rounds into {out_dir}/...")
+    cmd = [sys.executable, 'synthetic_logs.py', os.path.abspath(stake_file), '--out-dir', os.path.abspath(out_dir),
+           '--rounds', str(rounds), '--seed', str(seed)]
+    if workers:
+        cmd += ['--workers', str(workers)]
+    subprocess.run(cmd, cwd=SCRIPT_DIR, stdout=subprocess.DEVNULL, check=True)
+    rounds_file = os.path.abspath(os.path.join(out_dir, 'consensus_rounds.csv'))
+    votes_file = os.path.abspath(os.path.join(out_dir, 'consensus_votes_detail.csv'))
+    manifest = {
+        'rounds': count_rows(rounds_file),
+        'votes': count_rows(votes_file),
+        'seed': seed,
+        'stake_file': os.path.abspath(stake_file),
+        'rounds_file': rounds_file,
+        'votes_file': votes_file,
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def run_once(cmd: List[str]) -> dict:
+    """Run a command from SCRIPT_DIR; returns wall time, peak RSS and exit code."""
+    with tempfile.TemporaryFile() as err:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=SCRIPT_DIR, stdout=subprocess.DEVNULL, stderr=err)
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - t0
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        err.seek(0)
+        stderr = err.read().decode(errors='replace')
+    return {
+        'wall_s': elapsed,
+        'peak_rss_mb': usage.ru_maxrss / 1024,
+        'exit': proc.returncode,
+        'stderr': stderr.strip().splitlines()[-1:] if proc.returncode else [],
+    }
+
+
+def measure(name: str, manifest: dict, repeat: int) -> dict:
+    """Best-of-`repeat` wall time and worst peak RSS for one entry point and size."""
+    template, rows_key = ENTRY_POINTS[name]
+    cmd = [arg.format(**manifest) for arg in template]
+    runs = [run_once(cmd) for _ in range(repeat)]
+    failed = [r for r in runs if r['exit']]
+    result = {
+        'wall_s': min(r['wall_s'] for r in runs),
+        'peak_rss_mb': max(r['peak_rss_mb'] for r in runs),
+        'rows': manifest[rows_key] if rows_key else None,
+        'error': f"exit {failed[0]['exit']}: {' '.join(failed[0]['stderr'])}" if failed else None,
+    }
+    result['rows_per_s'] = result['rows'] / result['wall_s'] if result['rows'] else None
+    return result
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> Dict[str, List[str]]:
+    """Return key -> regression flags against the baseline."""
+    flags = {}
+    for key, r in results.items():
+        base = baseline.get(key)
+        if not base or r['error']:
+            continue
+        found = []
+        if r['wall_s'] > base['wall_s'] * (1 + tolerance) and r['wall_s'] - base['wall_s'] > MIN_REGRESSION_S:
+            found.append(f"time +{(r['wall_s'] / base['wall_s'] - 1) * 100:.0f}%")
+        if r['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            found.append(f"RSS +{(r['peak_rss_mb'] / base['peak_rss_mb'] - 1) * 100:.0f}%")
+        if found:
+            flags[key] = found
+    return flags
+
+
+def scaling_exponents(points: List[tuple]) -> List[tuple]:
+    """For (rows, wall_s, rss_mb) sorted by rows, exponents between consecutive sizes."""
+    out = []
+    for (n1, t1, m1), (n2, t2, m2) in zip(points, points[1:]):
+        ratio = math.log(n2 / n1)
+        out.append((n1, n2, math.log(t2 / t1) / ratio, math.log(m2 / m1) / ratio))
+    return out
+
+
+def print_results(results: Dict[str, dict], flags: Dict[str, List[str]], baseline: Dict[str, dict]):
+    print(f"\n{'='*96}")
+    print("ANALYSIS BENCHMARKS")
+    print(f"{'='*96}")
+    floor = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"RSS floor (harness RSS inherited at spawn): {floor:.1f} MB")
+    print(f"\n{'Entry point':<28} {'Rounds':>8} {'Rows':>12} {'Wall s':>9} {'RSS MB':>8} "
+          f"{'Rows/s':>12} {'Baseline s':>11}  Flags")
+    print("-" * 96)
+    for key, r in results.items():
+        name, rounds = key.rsplit('@', 1)
+        base = baseline.get(key)
+        rows = f"{r['rows']:,}" if r['rows'] else '-'
+        rate = f"{r['rows_per_s']:,.0f}" if r['rows_per_s'] else '-'
+        base_s = f"{base['wall_s']:.2f}" if base else '-'
+        note = r['error'] or ', '.join(flags.get(key, []))
+        print(f"{name:<28} {rounds:>8} {rows:>12} {r['wall_s']:>9.2f} {r['peak_rss_mb']:>8.1f} "
+              f"{rate:>12} {base_s:>11}  {note}")
+
+    # Scaling curves per entry point that reads round or vote rows
+    curves = {}
+    for key, r in results.items():
+        if r['rows'] and not r['error']:
+            name = key.rsplit('@', 1)[0]
+            curves.setdefault(name, []).append((r['rows'], r['wall_s'], r['peak_rss_mb']))
+    if not any(len(points) > 1 for points in curves.values()):
+        return
+
+    print(f"\n{'='*96}")
+    print("SCALING (exponent between consecutive sizes; 1.0 = linear)")
+    print(f"{'='*96}")
+    print(f"\n{'Entry point':<28} {'Rows':>25} {'Time exp':>9} {'RSS exp':>9} {'us/row':>9}")
+    print("-" * 84)
+    for name, points in curves.items():
+        points.sort()
+        for n1, n2, t_exp, m_exp in scaling_exponents(points):
+            t2 = next(t for n, t, _ in points if n == n2)
+            mark = "  <- superlinear" if t_exp > 1 + SCALING_SLACK else ""
+            print(f"{name:<28} {f'{n1:,} -> {n2:,}':>25} {t_exp:>9.2f} {m_exp:>9.2f} "
+                  f"{t2 / n2 * 1e6:>9.2f}{mark}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark analysis scripts on synthetic logs against baselines")
+    parser.add_argument("--stake-file", default=DEFAULT_STAKE_FILE)
+    parser.add_argument("--sizes", default=','.join(str(n) for n in DEFAULT_SIZES),
+                        help=f"comma-separated round counts; inputs need ~{INPUT_BYTES_PER_ROUND // 1000} KB of "
+                             f"disk per round (~{sum(DEFAULT_SIZES) * INPUT_BYTES_PER_ROUND / 1e9:.1f} GB for the default)")
+    parser.add_argument("--entries", default=','.join(ENTRY_POINTS), help="comma-separated entry points")
+    parser.add_argument("--data-dir", default=os.path.join(SCRIPT_DIR, 'bench_data'),
+                        help="where synthetic inputs are generated and reused")
+    parser.add_argument("--baseline", default=os.path.join(SCRIPT_DIR, 'bench_baselines.json'))
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown / RSS growth over baseline")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per measurement (best wall time kept)")
+    parser.add_argument("--csv", help="also write results as CSV for plotting scaling curves")
+    parser.add_argument("--workers", type=int, default=0, help="generator processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    sizes = sorted(int(n) for n in args.sizes.split(','))
+    entries = args.entries.split(',')
+    for name in entries:
+        if name not in ENTRY_POINTS:
+            parser.error(f"unknown entry point {name!r} (choose from {', '.join(ENTRY_POINTS)})")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    results = {}
+    for rounds in sizes:
+        manifest = ensure_inputs(args.stake_file, args.data_dir, rounds, args.seed, args.workers or None)
+        for name in entries:
+            if ENTRY_POINTS[name][1] is None and rounds != sizes[0]:
+                continue  # input does not depend on the round count
+            print(f"  {name} @ {rounds:,} rounds...")
+            results[f"{name}@{rounds}"] = measure(name, manifest, args.repeat)
+
+    flags = compare(results, baseline, args.tolerance)
+    print_results(results, flags, baseline)
+    unbased = [key for key, r in results.items() if key not in baseline and not r['error']]
+    if unbased and not args.save_baseline:
+        print(f"\nNo baseline for {len(unbased)} of {len(results)} measurement(s) in {args.baseline}; "
+              f"these cannot be flagged. Record one with --save-baseline.")
+
+    if args.csv:
+        with open(args.csv, 'w') as f:
+            f.write("entry,rounds,rows,wall_s,peak_rss_mb,rows_per_s\n")
+            for key, r in results.items():
+                name, rounds = key.rsplit('@', 1)
+                rate = f"{r['rows_per_s']:.0f}" if r['rows_per_s'] else ''
+                f.write(f"{name},{rounds},{r['rows'] or ''},{r['wall_s']:.4f},{r['peak_rss_mb']:.1f},{rate}\n")
+        print(f"\nResults written to {args.csv}")
+
+    if args.save_baseline:
+        baseline.update({key: {k: r[k] for k in ('wall_s', 'peak_rss_mb', 'rows_per_s')}
+                         for key, r in results.items() if not r['error']})
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if flags:
+        print(f"\n{len(flags)} regression(s) over {args.tolerance * 100:.0f}% tolerance")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Measure how fast a node can serve recent-round Falcon envelopes to catchup peers.
+
+falcon_envelopes.md §8.4 claims envelopes for rounds since the last State Proof
+are "served from in-memory cache (fast, ~50-100ms)". This is a local stand-in:
+
+- EnvelopeCache holds one contiguous blob per round for the last
+  --cache-rounds rounds, sized from a real round log, or the stake
+  snapshot's theoretical messages per round (x envelope size).
+- An asyncio server answers range requests (start_round, count <= 256) over
+  loopback TCP. Each round goes out as a (round, length) header plus its blob.
+- Many concurrent clients request random ranges and time each full response.
+  They run in a separate process with its own event loop, so their parsing
+  neither shares the server's loop nor counts toward its memory.
+
+Two switches are compared, giving four modes:
+- batched:   one request per range, answered with coalesced writes, vs one
+             request (and round trip) per round
+- zero-copy: the header and a memoryview of the cached blob are passed to
+             sendmsg() as separate buffers, vs concatenating header + blob
+             into a fresh bytes object per round
+
+Every response is written with scatter/gather sendmsg(), gathering up to
+IOV_MAX buffers or SEND_WINDOW_BYTES per call, so a batched response takes a
+few syscalls for the whole range rather than two per round. The server uses
+raw non-blocking sockets rather than asyncio streams: on Python 3.11
+StreamWriter.writelines() joins its buffers and the transport copies any
+unsent tail into its own bytearray, so a memoryview only stays uncopied
+through the stream API on 3.12+.
+
+Reported: latency percentiles per range request, throughput, cache size, and
+per mode the server's peak resident memory above the level before the mode
+started (sampled from /proc/self/statm, so the cache itself is excluded).
+"""
+
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import struct
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from consensus_logs import DEFAULT_STAKE_FILE, ENVELOPE_BYTES, percentile
+from dedup_filter import round_message_counts
+from sortition_cache import theoretical_messages
+
+REQUEST = struct.Struct('!QH')  # start_round, count
+FRAME = struct.Struct('!QI')  # round, length
+MAX_RANGE = 256
+
+DEFAULT_CACHE_ROUNDS = 256
+RSS_SAMPLE_INTERVAL = 0.005  # seconds between /proc/self/statm samples
+IOV_MAX = 1024  # buffers per sendmsg() call (Linux UIO_MAXIOV)
+SEND_WINDOW_BYTES = 4 << 20  # bytes gathered into one sendmsg() call
+
+
+class EnvelopeCache:
+    """Round-windowed envelope cache: round -> concatenated envelope blob."""
+
+    def __init__(self, per_round: Dict[int, int], envelope_bytes: int = ENVELOPE_BYTES, seed: int = 1):
+        if not per_round:
+            raise ValueError("EnvelopeCache needs at least one round")
+        rng = random.Random(seed)
+        # One random pool; each round gets its own copy so memory is real
+        pool = rng.randbytes(max(per_round.values(), default=0) * envelope_bytes + envelope_bytes)
+        self.blobs: Dict[int, bytes] = {}
+        for rnd, n in per_round.items():
+            offset = rng.randrange(envelope_bytes)
+            self.blobs[rnd] = bytes(pool[offset:offset + n * envelope_bytes])
+        self.first = min(self.blobs)
+        self.last = max(self.blobs)
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(len(b) for b in self.blobs.values())
+
+
+def current_rss_kb() -> Optional[int]:
+    """Current resident set size in KB, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return None
+
+
+async def sample_rss(peak: List[int]):
+    """Keep peak[0] at the highest current RSS seen until cancelled."""
+    while True:
+        rss = current_rss_kb()
+        if rss is not None and rss > peak[0]:
+            peak[0] = rss
+        await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+
+
+async def recv_exactly(loop: asyncio.AbstractEventLoop, sock: socket.socket, n: int) -> bytes:
+    """Read exactly n bytes from a non-blocking socket."""
+    buf = b''
+    while len(buf) < n:
+        chunk = await loop.sock_recv(sock, n - len(buf))
+        if not chunk:
+            raise asyncio.IncompleteReadError(buf, n)
+        buf += chunk
+    return buf
+
+
+async def wait_writable(loop: asyncio.AbstractEventLoop, sock: socket.socket):
+    """Wait until a non-blocking socket has send buffer space."""
+    ready = loop.create_future()
+    loop.add_writer(sock.fileno(), lambda: ready.done() or ready.set_result(None))
+    try:
+        await ready
+    finally:
+        loop.remove_writer(sock.fileno())
+
+
+async def send_buffers(loop: asyncio.AbstractEventLoop, sock: socket.socket, buffers: Iterator[bytes]):
+    """
+    Write buffers in order with scatter/gather sendmsg(), never joining them:
+    each call gathers up to IOV_MAX buffers or SEND_WINDOW_BYTES.
+    """
+    pending: List[memoryview] = []
+    size = 0
+    more = True
+    while True:
+        while more and len(pending) < IOV_MAX and size < SEND_WINDOW_BYTES:
+            buf = next(buffers, None)
+            if buf is None:
+                more = False
+            elif len(buf):
+                pending.append(memoryview(buf))
+                size += len(buf)
+        if not pending:
+            return
+        try:
+            sent = sock.sendmsg(pending)
+        except (BlockingIOError, InterruptedError):
+            await wait_writable(loop, sock)
+            continue
+        size -= sent
+        done = 0
+        while done < len(pending) and sent >= len(pending[done]):
+            sent -= len(pending[done])
+            done += 1
+        del pending[:done]
+        if sent:
+            pending[0] = pending[0][sent:]
+
+
+def response_buffers(cache: EnvelopeCache, start: int, count: int, zero_copy: bool) -> Iterator[bytes]:
+    """(round, length) header and blob for each round of a range request."""
+    empty = b''
+    for rnd in range(start, start + count):
+        blob = cache.blobs.get(rnd, empty)
+        header = FRAME.pack(rnd, len(blob))
+        if zero_copy:
+            yield header
+            yield memoryview(blob)
+        else:
+            yield header + blob
+
+
+async def serve(cache: EnvelopeCache, zero_copy: bool, host: str = '127.0.0.1',
+                port: int = 0) -> Tuple[socket.socket, asyncio.Task]:
+    """Start the catchup server; returns (listening socket, accept task to cancel)."""
+    loop = asyncio.get_running_loop()
+    listener = socket.create_server((host, port))
+    listener.setblocking(False)
+
+    async def handle(conn: socket.socket):
+        try:
+            while True:
+                start, count = REQUEST.unpack(await recv_exactly(loop, conn, REQUEST.size))
+                count = min(count, MAX_RANGE)
+                await send_buffers(loop, conn, response_buffers(cache, start, count, zero_copy))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            conn.close()
+
+    async def accept():
+        handlers = set()
+        try:
+            while True:
+                conn, _ = await loop.sock_accept(listener)
+                conn.setblocking(False)
+                # Match asyncio transports, which disable Nagle
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                task = loop.create_task(handle(conn))
+                handlers.add(task)
+                task.add_done_callback(handlers.discard)
+        finally:
+            listener.close()
+            for task in handlers:
+                task.cancel()
+
+    return listener, loop.create_task(accept())
+
+
+async def fetch_range(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                      start: int, count: int, batched: bool) -> int:
+    """Fetch rounds [start, start + count); returns bytes received."""
+    received = 0
+    if batched:
+        writer.write(REQUEST.pack(start, count))
+        await writer.drain()
+        for _ in range(count):
+            _, length = FRAME.unpack(await reader.readexactly(FRAME.size))
+            received += len(await reader.readexactly(length))
+    else:
+        for rnd in range(start, start + count):
+            writer.write(REQUEST.pack(rnd, 1))
+            await writer.drain()
+            _, length = FRAME.unpack(await reader.readexactly(FRAME.size))
+            received += len(await reader.readexactly(length))
+    return received
+
+
+async def catchup_client(port: int, first: int, last: int, requests: int, batched: bool,
+                         latencies: List[float], rng: random.Random) -> int:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=1 << 22)
+    total = 0
+    try:
+        for _ in range(requests):
+            count = rng.randint(1, min(MAX_RANGE, last - first + 1))
+            start = rng.randint(first, last - count + 1)
+            t0 = time.perf_counter()
+            total += await fetch_range(reader, writer, start, count, batched)
+            latencies.append(time.perf_counter() - t0)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return total
+
+
+def run_clients(port: int, first: int, last: int, clients: int, requests: int, batched: bool,
+                seed: int, results) -> None:
+    """Client process: run all clients on one loop, send (latencies, bytes, elapsed) to `results`."""
+    latencies: List[float] = []
+
+    async def run_all():
+        return await asyncio.gather(*[
+            catchup_client(port, first, last, requests, batched, latencies, random.Random(seed + i))
+            for i in range(clients)
+        ])
+
+    t0 = time.perf_counter()
+    totals = asyncio.run(run_all())
+    results.send((latencies, sum(totals), time.perf_counter() - t0))
+    results.close()
+
+
+async def run_mode(cache: EnvelopeCache, clients: int, requests: int, batched: bool,
+                   zero_copy: bool, seed: int) -> dict:
+    loop = asyncio.get_running_loop()
+    listener, server = await serve(cache, zero_copy)
+    port = listener.getsockname()[1]
+    baseline = current_rss_kb()
+    peak = [baseline or 0]
+    sampler = asyncio.create_task(sample_rss(peak))
+
+    # Spawn, not fork: the client process must not inherit the cache or this loop
+    ctx = multiprocessing.get_context('spawn')
+    receiver, sender = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=run_clients,
+                       args=(port, cache.first, cache.last, clients, requests, batched, seed, sender))
+    proc.start()
+    sender.close()
+    try:
+        latencies, received, elapsed = await loop.run_in_executor(None, receiver.recv)
+    finally:
+        await loop.run_in_executor(None, proc.join)
+        receiver.close()
+        sampler.cancel()
+        server.cancel()
+        await asyncio.gather(sampler, server, return_exceptions=True)
+    return {
+        'latencies': sorted(latencies),
+        'bytes': received,
+        'elapsed': elapsed,
+        'requests': len(latencies),
+        'rss_delta_kb': None if baseline is None else peak[0] - baseline,
+    }
+
+
+def load_per_round(rounds_file: Optional[str], cache_rounds: int, stake_file: str = DEFAULT_STAKE_FILE) -> Dict[int, int]:
+    """Messages per round for the last cache_rounds rounds of a log (or theoretical)."""
+    if rounds_file is None:
+        per_round = round(theoretical_messages(stake_file))
+        return {55000000 + i: per_round for i in range(cache_rounds)}
+    window = deque(round_message_counts(rounds_file, float('inf')), maxlen=cache_rounds)
+    return dict(window)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark serving cached envelopes to catchup clients")
+    parser.add_argument("--rounds-log", help="round log (consensus_messages.csv) to size the cache from")
+    parser.add_argument("--stake-file", default=DEFAULT_STAKE_FILE,
+                        help="stake snapshot for theoretical messages/round without --rounds-log")
+    parser.add_argument("--cache-rounds", type=int, default=DEFAULT_CACHE_ROUNDS)
+    parser.add_argument("--envelope-bytes", type=int, default=ENVELOPE_BYTES)
+    parser.add_argument("--clients", type=int, default=32, help="concurrent catchup clients")
+    parser.add_argument("--requests", type=int, default=4, help="range requests per client")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.clients < 1 or args.requests < 1:
+        parser.error("--clients and --requests must be at least 1")
+
+    per_round = load_per_round(args.rounds_log, args.cache_rounds, args.stake_file)
+    if not per_round:
+        parser.error(f"no rounds in {args.rounds_log}")
+    print(f"Building cache: {len(per_round)} rounds, "
+          f"{sum(per_round.values()) / len(per_round):.0f} envelopes/round, {args.envelope_bytes} B each")
+    cache = EnvelopeCache(per_round, args.envelope_bytes, args.seed)
+    print(f"Cache size: {cache.size_bytes / 1e6:.1f} MB")
+    print(f"Clients: {args.clients} concurrent x {args.requests} requests (ranges of 1-{MAX_RANGE} rounds)")
+
+    print(f"\n{'='*86}")
+    print("CATCHUP SERVING LATENCY (per range request)")
+    print(f"{'='*86}")
+    print(f"\n{'Mode':<26} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'Req/s':>8} {'MB/s':>8} {'+RSS MB':>8}")
+    print("-" * 86)
+    for batched in (False, True):
+        for zero_copy in (False, True):
+            r = asyncio.run(run_mode(cache, args.clients, args.requests, batched, zero_copy, args.seed))
+            lat = r['latencies']
+            name = ("batched" if batched else "per-round") + (" + memoryview" if zero_copy else " + copy")
+            rss = "-" if r['rss_delta_kb'] is None else f"{r['rss_delta_kb'] / 1024:.1f}"
+            print(f"{name:<26} {percentile(lat, 50) * 1000:>8.1f} {percentile(lat, 90) * 1000:>8.1f} "
+                  f"{percentile(lat, 99) * 1000:>8.1f} {lat[-1] * 1000:>8.1f} "
+                  f"{r['requests'] / r['elapsed']:>8.1f} {r['bytes'] / r['elapsed'] / 1e6:>8.1f} "
+                  f"{rss:>8}")
+    print("\nLatency covers the whole range request, timed in the client process; +RSS is the "
+          "server's peak resident memory above the level before the mode started.")
+
+
+if __name__ == "__main__":
+    main()
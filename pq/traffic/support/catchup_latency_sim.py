@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Monte Carlo model of short-range catchup latency when peers' envelope caches
+may not reach back to the last State Proof.
+
+falcon_envelopes.md §8.4 adds a degraded mode: a catchup node verifies blocks
+since the last State Proof with envelopes served from peers' RAM caches, and
+if no peer holds them it waits for the next State Proof (up to 256 rounds,
+~12 minutes). §9.5 then fixes the cache at 256-400 rounds. This simulates
+catchup attempts against a population of serving nodes to show how the
+retention window, churn and population size drive that wait.
+
+Per attempt:
+- the node arrives at a uniform phase of the State Proof interval, so after
+  long-range catchup it needs envelopes for need = lag + phase rounds
+- each serving node keeps the last W rounds (or, for policy "sp", everything
+  since the last State Proof), but only since it last (re)started: caches are
+  RAM-only, so a restart empties them
+- the population is finite: of N serving nodes exactly round(share x N) run
+  each retention policy, and an upgrade wave, last seen Exp(wave interval)
+  rounds ago, restarted exactly round(fraction x N) of them at once and kept
+  them down for a while
+- the node asks up to min(N, max peers) peers drawn from the population
+  without replacement, one at a time, until one covers the range. Each is
+  online with probability up / (up + down) and restarted Exp(up) rounds ago
+  (or at the wave, if it was hit)
+- no covering peer means degraded mode: fetch what the asked peers have, wait
+  for the State Proof covering the rest, then draw a fresh peer set from the
+  new tip
+
+Population size matters through that finite draw: a small population in which
+few nodes keep a long window gives each catchup node a larger share of them
+than a large one does. With a single fixed window every node is alike, so
+there the population changes little beyond N < max peers.
+
+Delay = misses x miss cost + range requests x serve time (§8.4's 50-100 ms)
++ transfer at --bandwidth-mbps, plus any State Proof waits. Envelopes per
+round are the snapshot's theoretical messages (sortition_cache.py). Attempts
+run in chunks over a process pool, one grid cell per (population, policy).
+"""
+
+import math
+import os
+import random
+from dataclasses import dataclass, replace
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+from consensus_logs import DEFAULT_STAKE_FILE, ENVELOPE_BYTES, percentile
+from sortition_cache import theoretical_messages
+
+ROUND_SECONDS = 2.85  # falcon_envelopes.md §9.3
+STATE_PROOF_INTERVAL = 256  # rounds (config/consensus.go StateProofInterval)
+SP_POLICY = 'sp'  # retain everything since the last State Proof
+MAX_SP_WAITS = 8
+MAX_RANGE = 256  # rounds per range request
+
+SERVE_MS_LOW = 50.0  # per range request, falcon_envelopes.md §8.4
+SERVE_MS_HIGH = 100.0
+DEFAULT_MISS_MS = 200.0  # connect + ask a peer that lacks the range
+DEFAULT_BANDWIDTH_MBPS = 100.0
+DEFAULT_MAX_PEERS = 32  # peers tried before falling back to the State Proof
+
+DEFAULT_POPULATIONS = (10, 30, 100, 300, 1000)
+DEFAULT_POLICIES = ('128', '192', '256', '320', '400', '512', SP_POLICY, '128@0.9,sp@0.1')
+DEFAULT_TRIALS = 20000
+CHUNK_TRIALS = 2000
+
+
+@dataclass
+class Scenario:
+    """Churn, State Proof and network assumptions (rounds unless noted)."""
+    mean_uptime: float = 72 * 3600 / ROUND_SECONDS
+    mean_downtime: float = 10 * 60 / ROUND_SECONDS
+    wave_interval: float = 14 * 86400 / ROUND_SECONDS
+    wave_fraction: float = 0.5
+    wave_downtime: float = 5 * 60 / ROUND_SECONDS
+    sp_lag: int = 0  # rounds from interval end until its State Proof is usable
+    max_peers: int = DEFAULT_MAX_PEERS  # peers a catchup node will try
+    miss_ms: float = DEFAULT_MISS_MS
+    bandwidth_mbps: float = DEFAULT_BANDWIDTH_MBPS
+    envelopes_per_round: float = 0.0  # main() sets it from the stake snapshot
+    envelope_bytes: int = ENVELOPE_BYTES
+
+
+def parse_policies(spec: str) -> List[Tuple[float, float]]:
+    """
+    "256" -> [(256, 1.0)]; "256@0.7,sp@0.3" -> a mixed population.
+    Windows are rounds; "sp" is an unbounded window (prune on State Proof).
+    """
+    policies = []
+    for part in spec.split(','):
+        name, _, share = part.partition('@')
+        window = math.inf if name == SP_POLICY else float(name)
+        policies.append((window, float(share) if share else 1.0))
+    total = sum(s for _, s in policies)
+    return [(w, s / total) for w, s in policies]
+
+
+def sp_round_covering(x: int, lag: int) -> int:
+    """Round at which a State Proof covering round x becomes usable."""
+    return math.ceil(x / STATE_PROOF_INTERVAL) * STATE_PROOF_INTERVAL + lag
+
+
+def policy_counts(policies, population: int) -> List[int]:
+    """Nodes per policy in a population: shares rounded by largest remainder."""
+    exact = [share * population for _, share in policies]
+    counts = [int(x) for x in exact]
+    by_remainder = sorted(range(len(exact)), key=lambda i: exact[i] - counts[i], reverse=True)
+    for i in by_remainder[:population - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def draw_without_replacement(rng: random.Random, remaining: List[int]) -> int:
+    """Index i drawn with probability remaining[i] / sum(remaining); decrements it."""
+    x = rng.randrange(sum(remaining))
+    for i, n in enumerate(remaining):
+        if x < n:
+            remaining[i] -= 1
+            return i
+        x -= n
+    raise ValueError("empty population")
+
+
+def held_rounds(rng: random.Random, window: float, wave_hit: bool, wave_age: float, sc: Scenario) -> int:
+    """Most recent rounds a peer can serve: 0 if offline, else min(window, time since restart)."""
+    online = sc.mean_uptime / (sc.mean_uptime + sc.mean_downtime)
+    if rng.random() >= online or (wave_hit and wave_age < sc.wave_downtime):
+        return 0
+    age = rng.expovariate(1.0 / sc.mean_uptime)
+    if wave_hit:
+        age = min(age, wave_age)
+    return int(min(window, age))
+
+
+def fetch_seconds(rng: random.Random, rounds: int, sc: Scenario) -> float:
+    requests = math.ceil(rounds / MAX_RANGE)
+    serve = sum(rng.uniform(SERVE_MS_LOW, SERVE_MS_HIGH) for _ in range(requests)) / 1000
+    transfer = rounds * sc.envelopes_per_round * sc.envelope_bytes * 8 / (sc.bandwidth_mbps * 1e6)
+    return serve + transfer
+
+
+def catchup_attempt(rng: random.Random, policies, population: int, sc: Scenario) -> Tuple[float, int]:
+    """One catchup; returns (delay seconds, State Proof waits)."""
+    windows = [w for w, _ in policies]
+    counts = policy_counts(policies, population)
+    wave_hits = round(sc.wave_fraction * population)
+    reachable = min(population, sc.max_peers)
+    wave_age = rng.expovariate(1.0 / sc.wave_interval) if math.isfinite(sc.wave_interval) else math.inf
+    covered = 0  # last round covered by a State Proof
+    now = sc.sp_lag + rng.randrange(STATE_PROOF_INTERVAL)
+    delay = 0.0
+    waits = 0
+
+    while True:
+        need = now - covered
+        remaining = list(counts)
+        hits_left, nodes_left = wave_hits, population
+        most_held = 0
+        for misses in range(reachable):
+            window = windows[draw_without_replacement(rng, remaining)]
+            hit = rng.random() * nodes_left < hits_left
+            hits_left -= hit
+            nodes_left -= 1
+            held = held_rounds(rng, window, hit, wave_age, sc)
+            if held >= need:
+                return delay + misses * sc.miss_ms / 1000 + fetch_seconds(rng, need, sc), waits
+            most_held = max(most_held, held)
+        if waits == MAX_SP_WAITS:
+            return math.inf, waits
+
+        # Degraded: every reachable peer was asked; the union of their caches
+        # is the most_held newest rounds, the rounds below wait for a State Proof
+        delay += reachable * sc.miss_ms / 1000
+        start = now - most_held + 1
+        sp_round = sp_round_covering(start - 1, sc.sp_lag)
+        wait = sp_round - now
+        delay += wait * ROUND_SECONDS
+        wave_age += wait
+        covered = sp_round - sc.sp_lag
+        now = sp_round
+        waits += 1
+
+
+def run_chunk(args) -> dict:
+    """Run trials for one (population, policy) cell; returns delays and wait counts."""
+    population, policy_spec, trials, seed, sc = args
+    rng = random.Random(seed)
+    policies = parse_policies(policy_spec)
+    delays = []
+    degraded = 0
+    for _ in range(trials):
+        delay, waits = catchup_attempt(rng, policies, population, sc)
+        delays.append(delay)
+        degraded += waits > 0
+    return {'population': population, 'policy': policy_spec, 'delays': delays, 'degraded': degraded}
+
+
+def simulate(populations, policy_specs, trials: int, sc: Scenario, workers: Optional[int] = None,
+             seed: int = 1) -> Dict[Tuple[int, str], dict]:
+    """Run the grid over a process pool; returns per-cell sorted delays and degraded counts."""
+    chunks = []
+    for population in populations:
+        for spec in policy_specs:
+            for offset in range(0, trials, CHUNK_TRIALS):
+                n = min(CHUNK_TRIALS, trials - offset)
+                chunks.append((population, spec, n, seed * 1000003 + len(chunks), sc))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = list(map(run_chunk, chunks))
+    else:
+        with Pool(workers) as pool:
+            results = pool.map(run_chunk, chunks)
+
+    cells: Dict[Tuple[int, str], dict] = {}
+    for r in results:
+        cell = cells.setdefault((r['population'], r['policy']), {'delays': [], 'degraded': 0})
+        cell['delays'] += r['delays']
+        cell['degraded'] += r['degraded']
+    for cell in cells.values():
+        cell['delays'].sort()
+    return cells
+
+
+def wilson_interval(k: int, n: int, z: float = 1.96) -> Tuple[float, float]:
+    """95% Wilson score interval for a binomial proportion."""
+    if n == 0:
+        return 0.0, 1.0
+    p = k / n
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def main():
+    import argparse
+    import time
+
+    defaults = Scenario()
+    parser = argparse.ArgumentParser(description="Catchup latency under envelope cache loss")
+    parser.add_argument('--stake-file', default=DEFAULT_STAKE_FILE,
+                        help="stake snapshot for theoretical envelopes per round (default: %(default)s)")
+    parser.add_argument('--populations', default=','.join(map(str, DEFAULT_POPULATIONS)),
+                        help="serving-node population sizes (default: %(default)s)")
+    parser.add_argument('--policies', nargs='+', default=list(DEFAULT_POLICIES),
+                        help="retention policies: rounds, 'sp', or a mix like 256@0.7,sp@0.3")
+    parser.add_argument('--trials', type=int, default=DEFAULT_TRIALS, help="catchup attempts per cell")
+    parser.add_argument('--uptime-hours', type=float, default=defaults.mean_uptime * ROUND_SECONDS / 3600)
+    parser.add_argument('--downtime-min', type=float, default=defaults.mean_downtime * ROUND_SECONDS / 60)
+    parser.add_argument('--wave-days', type=float, default=defaults.wave_interval * ROUND_SECONDS / 86400,
+                        help="mean days between coordinated restarts (upgrades); 0 disables")
+    parser.add_argument('--wave-fraction', type=float, default=defaults.wave_fraction)
+    parser.add_argument('--wave-down-min', type=float, default=defaults.wave_downtime * ROUND_SECONDS / 60)
+    parser.add_argument('--sp-lag', type=int, default=defaults.sp_lag,
+                        help="rounds after an interval ends before its State Proof is usable")
+    parser.add_argument('--max-peers', type=int, default=defaults.max_peers,
+                        help="peers a catchup node tries before waiting for a State Proof (default: %(default)s)")
+    parser.add_argument('--miss-ms', type=float, default=defaults.miss_ms)
+    parser.add_argument('--bandwidth-mbps', type=float, default=defaults.bandwidth_mbps)
+    parser.add_argument('--target', type=float, default=1e-3,
+                        help="degraded-mode probability to size the window for (default: %(default)s)")
+    parser.add_argument('--workers', type=int, help="processes (default: all CPUs)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    populations = [int(p) for p in args.populations.split(',')]
+    sc = replace(
+        defaults,
+        mean_uptime=args.uptime_hours * 3600 / ROUND_SECONDS,
+        mean_downtime=args.downtime_min * 60 / ROUND_SECONDS,
+        wave_interval=args.wave_days * 86400 / ROUND_SECONDS if args.wave_days > 0 else math.inf,
+        wave_fraction=args.wave_fraction if args.wave_days > 0 else 0.0,
+        wave_downtime=args.wave_down_min * 60 / ROUND_SECONDS,
+        sp_lag=args.sp_lag,
+        max_peers=args.max_peers,
+        miss_ms=args.miss_ms,
+        bandwidth_mbps=args.bandwidth_mbps,
+        envelopes_per_round=theoretical_messages(args.stake_file),
+    )
+
+    print(f"State Proof interval {STATE_PROOF_INTERVAL} rounds (+{sc.sp_lag} lag), {ROUND_SECONDS} s/round")
+    print(f"Churn: up {args.uptime_hours:.0f} h / down {args.downtime_min:.0f} min; "
+          f"waves every {args.wave_days:.0f} d hit {sc.wave_fraction:.0%} for {args.wave_down_min:.0f} min")
+    print(f"Fetch: {sc.envelopes_per_round:.0f} x {sc.envelope_bytes} B envelopes/round at {sc.bandwidth_mbps:.0f} Mbps, "
+          f"{sc.miss_ms:.0f} ms per peer miss; {args.trials} attempts per cell")
+
+    t0 = time.perf_counter()
+    cells = simulate(populations, args.policies, args.trials, sc, args.workers, args.seed)
+    elapsed = time.perf_counter() - t0
+
+    print(f"\n{'='*100}")
+    print("CATCHUP DELAY (seconds) AND DEGRADED-MODE PROBABILITY")
+    print(f"{'='*100}")
+    print(f"{'Population':>10} {'Policy':<14} {'P(degraded)':>11} {'95% CI':>17} {'mean':>7} {'p50':>7} "
+          f"{'p90':>7} {'p99':>7} {'p99.9':>7} {'max':>7}")
+    print("-" * 100)
+    chosen = {}
+    for population in populations:
+        for spec in args.policies:
+            cell = cells[(population, spec)]
+            d = cell['delays']
+            n = len(d)
+            finite = [x for x in d if math.isfinite(x)]
+            p = cell['degraded'] / n
+            lo, hi = wilson_interval(cell['degraded'], n)
+            mean = sum(finite) / len(finite) if finite else math.nan
+            print(f"{population:>10} {spec:<14} {p:>11.4f} {lo:>8.4f}-{hi:<8.4f} {mean:>7.1f} "
+                  f"{percentile(d, 50):>7.1f} {percentile(d, 90):>7.1f} {percentile(d, 99):>7.1f} "
+                  f"{percentile(d, 99.9):>7.1f} {d[-1]:>7.1f}")
+            windows = [w for w, _ in parse_policies(spec)]
+            if len(windows) == 1 and math.isfinite(windows[0]) and hi <= args.target:
+                chosen[population] = min(chosen.get(population, math.inf), windows[0])
+        print()
+
+    print(f"Smallest single fixed window with P(degraded) 95% upper bound <= {args.target}:")
+    floor = wilson_interval(0, args.trials)[1]
+    if floor > args.target:
+        print(f"  (with {args.trials} attempts the bound cannot go below {floor:.4f}; raise --trials)")
+    for population in populations:
+        w = chosen.get(population)
+        print(f"  population {population:>6}: " + (f"{w:.0f} rounds ({w * ROUND_SECONDS / 60:.1f} min)"
+                                                    if w is not None else "none of the tested windows"))
+    print(f"\nSimulated {len(cells) * args.trials:,} attempts in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Formats and timing defaults of the patched node's consensus logs, and the
+other constants the support scripts share.
+
+The scripts that read captures (round_index.py, arrival_model.py, ...) and the
+one that writes synthetic ones (synthetic_logs.py) share these definitions
+instead of importing them from each other:
+
+    headers        every consensus_messages.csv header the logger has written
+                   (V1-V5 in consensus_logging.patch / go-algorand-diff.txt,
+                   then the current one), plus the vote-detail, proposal
+                   detail and pipelined-debug headers
+    write order    rows are appended per round, but a late vote can still be
+                   logged up to ROUND_LOOKBACK rounds after its round
+    timing         soft-step timing used when no log or fitted arrival model
+                   is given, and the proposal relay fan-in fitted to log1
+    sizing         default stake snapshot, envelope sizes and rounds per day
+                   used by the bandwidth and cache estimates
+    percentile     the nearest-rank percentile every report prints
+"""
+
+import os
+from typing import List
+
+# Headers as written by the patched consensus logger (go-algorand-diff.txt)
+MESSAGES_HEADER = ("round,proposals,soft_votes,cert_votes,next_votes,pipelined_soft_votes,pipelined_cert_votes,"
+                   "late_soft_votes,late_cert_votes,late_next_votes,soft_unique_senders,cert_unique_senders,"
+                   "soft_total_unique_senders,cert_total_unique_senders,soft_periods,cert_periods,"
+                   "round_duration_ms,in_peers,out_peers,bundle_votes")
+VOTES_HEADER = "round,step,period,sender,credential_weight,timestamp_unix_ns,is_late"
+DEBUG_HEADER = "player_round,vote_round,vote_period,vote_step,message_kind"
+
+# Legacy consensus_messages.csv headers (go-algorand-diff.txt)
+MESSAGES_HEADER_V1 = "round,proposals,soft_votes,cert_votes,next_votes"
+MESSAGES_HEADER_V2 = "round,proposals,soft_votes,cert_votes,next_votes,round_duration_ms,in_peers,out_peers,bundle_votes"
+MESSAGES_HEADER_V3 = ("round,proposals,soft_votes,cert_votes,next_votes,pipelined_soft_votes,pipelined_cert_votes,"
+                      "round_duration_ms,in_peers,out_peers,bundle_votes")
+MESSAGES_HEADER_V4 = ("round,proposals,soft_votes,cert_votes,next_votes,pipelined_soft_votes,pipelined_cert_votes,"
+                      "obsolete_votes,round_duration_ms,in_peers,out_peers,bundle_votes")
+MESSAGES_HEADER_V5 = ("round,proposals,soft_votes,cert_votes,next_votes,pipelined_soft_votes,pipelined_cert_votes,"
+                      "late_soft_votes,late_cert_votes,late_next_votes,round_duration_ms,in_peers,out_peers,bundle_votes")
+DETAILS_HEADER = ("round,step,period,category,proposal_block_digest,proposal_encoding_digest,"
+                  "proposal_original_period,proposal_original_proposer,unique_senders,total_messages")
+
+# Rounds older than (newest round - ROUND_LOOKBACK) are complete and flushed
+ROUND_LOOKBACK = 2
+
+# Filter timeout before soft votes are cast, used when no round log is given
+# to calibrate it (dynamic filter timeout on mainnet)
+FILTER_TIMEOUT_MS = 600.0
+# Mean soft-vote delay after the filter timeout, used without a fitted model
+DEFAULT_SOFT_DELAY_MS = 400.0
+# Peers relaying proposals; reproduces log1's proposals column (mean 6.5, p10 4,
+# p90 9) under proposal_cutoff.py's relay model
+DEFAULT_PROPOSAL_PEERS = 3
+
+# Stake snapshot used when a script is not given one
+DEFAULT_STAKE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'algorand-consensus-20251124.csv')
+
+# Falcon vote envelope size range and midpoint (falcon_envelopes.md §9.1, §A.1)
+ENVELOPE_BYTES_LOW = 1300
+ENVELOPE_BYTES = 1500
+ENVELOPE_BYTES_HIGH = 1800
+ROUNDS_PER_DAY = 30316  # falcon_envelopes.md §9.3
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list (0.0 when empty)."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))]
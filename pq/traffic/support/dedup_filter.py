@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Round-scoped duplicate-message filter for envelope gossip, with a flood benchmark.
+
+falcon_envelopes.md §9.6 relies on hash-based deduplication against floods, and
+§12.1 / seedgrinding.md §3 worry about invalid-envelope floods during
+short-range catchup. This is a reference design:
+
+- RoundScopedFilter keeps one Bloom filter per round for a sliding window of
+  rounds (r - window + 1 .. r + 1). When the node advances, the oldest filter
+  is dropped whole, so memory is bounded by window x per-round capacity.
+  Messages for rounds outside the window are rejected before any lookup.
+- ExactRoundFilter is the same structure with Python sets, used as the
+  ground truth for false-positive measurement.
+
+The load generator replays per-round message counts from a round log (or the
+stake snapshot's theoretical messages/round, from sortition_cache.py) as
+32-byte digests, adds redundant
+multi-peer deliveries, then mixes in adversarial traffic: replays of already
+seen digests and floods of fresh invalid digests. It reports lookups per
+second, memory per round and false-positive rate against the exact baseline.
+"""
+
+import csv
+import hashlib
+import math
+import random
+import sys
+import time
+from typing import Dict, Iterator, List, Tuple
+
+from consensus_logs import DEFAULT_STAKE_FILE
+from sortition_cache import theoretical_messages
+
+DUPLICATION_FACTOR = 1.3  # multi-peer redundant delivery (learnings.md §4)
+DEFAULT_WINDOW = 3
+DEFAULT_FP_RATE = 1e-4
+CAPACITY_HEADROOM = 1.5  # default capacity over the busiest replayed round
+
+
+class BloomFilter:
+    """Bloom filter over 32-byte digests, using double hashing on the digest bits."""
+
+    def __init__(self, capacity: int, fp_rate: float):
+        m = max(64, int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))))
+        self.num_bits = m
+        self.num_hashes = max(1, int(round(m / capacity * math.log(2))))
+        self.bits = bytearray((m + 7) // 8)
+        self.count = 0
+
+    def add_if_absent(self, digest: bytes) -> bool:
+        """Insert digest; return True if it was (probably) already present."""
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        m = self.num_bits
+        bits = self.bits
+        present = True
+        for i in range(self.num_hashes):
+            pos = (h1 + i * h2) % m
+            byte = pos >> 3
+            mask = 1 << (pos & 7)
+            if not bits[byte] & mask:
+                present = False
+                bits[byte] |= mask
+        if not present:
+            self.count += 1
+        return present
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+
+class RoundScopedFilter:
+    """Sliding window of per-round Bloom filters."""
+
+    def __init__(self, capacity: int, fp_rate: float = DEFAULT_FP_RATE, window: int = DEFAULT_WINDOW):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.window = window
+        self.filters: Dict[int, BloomFilter] = {}
+        self.current = 0
+
+    def advance(self, rnd: int):
+        """Move the node to round rnd and drop filters that left the window."""
+        self.current = rnd
+        for old in [r for r in self.filters if r <= rnd - self.window]:
+            del self.filters[old]
+
+    def in_window(self, rnd: int) -> bool:
+        return self.current - self.window < rnd <= self.current + 1
+
+    def seen(self, rnd: int, digest: bytes) -> bool:
+        """Return True if the message should be dropped (out of window or duplicate)."""
+        if not self.in_window(rnd):
+            return True
+        f = self.filters.get(rnd)
+        if f is None:
+            f = self.filters[rnd] = BloomFilter(self.capacity, self.fp_rate)
+        return f.add_if_absent(digest)
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(f.memory_bytes for f in self.filters.values())
+
+
+class ExactRoundFilter(RoundScopedFilter):
+    """Same window semantics with exact sets; the false-positive baseline."""
+
+    def seen(self, rnd: int, digest: bytes) -> bool:
+        if not self.in_window(rnd):
+            return True
+        s = self.filters.get(rnd)
+        if s is None:
+            s = self.filters[rnd] = set()
+        if digest in s:
+            return True
+        s.add(digest)
+        return False
+
+    @property
+    def memory_bytes(self) -> int:
+        # Set table plus one bytes object per stored digest
+        return sum(sys.getsizeof(s) + len(s) * sys.getsizeof(b'\0' * 32) for s in self.filters.values())
+
+
+def round_message_counts(rounds_file: str, limit: int) -> Iterator[Tuple[int, int]]:
+    """Yield (round, unique messages) from a round log."""
+    with open(rounds_file, 'r') as f:
+        reader = csv.DictReader(f)
+        for i, row in enumerate(reader):
+            if i >= limit:
+                break
+            total = 0
+            for col in ('proposals', 'soft_votes', 'cert_votes', 'next_votes',
+                        'late_soft_votes', 'late_cert_votes', 'late_next_votes'):
+                value = row.get(col)
+                if value:
+                    total += int(value)
+            yield int(row['round']), total
+
+
+def theoretical_counts(rounds: int, per_round: int, start: int = 55000000) -> Iterator[Tuple[int, int]]:
+    for rnd in range(start, start + rounds):
+        yield rnd, per_round
+
+
+def build_round_traffic(rnd: int, unique: int, dup_flood: float, invalid_flood: int,
+                        stale_flood: int, window: int, counter: List[int]) -> Tuple[List[Tuple[int, bytes]], int]:
+    """
+    Build the (round, digest) stream the node receives during round rnd.
+    Returns (messages, number of genuinely new messages).
+    """
+    def digest() -> bytes:
+        counter[0] += 1
+        return hashlib.sha256(counter[0].to_bytes(8, 'little')).digest()
+
+    honest = [digest() for _ in range(unique)]
+    msgs = [(rnd, d) for d in honest]
+    # Redundant deliveries from other peers
+    msgs += [(rnd, random.choice(honest)) for _ in range(int(unique * (DUPLICATION_FACTOR - 1)))]
+    # Adversarial replays of already-seen digests
+    msgs += [(rnd, random.choice(honest)) for _ in range(int(unique * dup_flood))]
+    # Fresh invalid digests for the current round (pass dedup, fail verification)
+    msgs += [(rnd, digest()) for _ in range(invalid_flood)]
+    # Floods aimed at old rounds, as during short-range catchup
+    msgs += [(rnd - random.randint(window, window + 256), digest()) for _ in range(stale_flood)]
+    random.shuffle(msgs)
+    return msgs, unique + invalid_flood
+
+
+def run_benchmark(counts: Iterator[Tuple[int, int]], fp_rate: float, window: int,
+                  dup_flood: float, invalid_flood: int, stale_flood: int, capacity: int = 0):
+    """
+    Replay (round, unique messages) with floods through both filters. Without
+    an explicit capacity, every round's filter is sized for the busiest round
+    of the replay (x CAPACITY_HEADROOM), so no round runs over its target FPR.
+    """
+    counts = list(counts)
+    bloom = None
+    exact = None
+    if counts:
+        cap = capacity or int((max(unique for _, unique in counts) + invalid_flood) * CAPACITY_HEADROOM)
+        bloom = RoundScopedFilter(cap, fp_rate, window)
+        exact = ExactRoundFilter(cap, fp_rate, window)
+    counter = [0]
+    lookups = 0
+    bloom_time = 0.0
+    exact_time = 0.0
+    false_positives = 0
+    new_messages = 0
+    rounds = 0
+    bloom_mem = []
+    exact_mem = []
+
+    for rnd, unique in counts:
+        msgs, fresh = build_round_traffic(rnd, unique, dup_flood, invalid_flood, stale_flood, window, counter)
+        bloom.advance(rnd)
+        exact.advance(rnd)
+
+        t0 = time.perf_counter()
+        bloom_results = [bloom.seen(r, d) for r, d in msgs]
+        t1 = time.perf_counter()
+        exact_results = [exact.seen(r, d) for r, d in msgs]
+        t2 = time.perf_counter()
+        bloom_time += t1 - t0
+        exact_time += t2 - t1
+
+        false_positives += sum(1 for b, e in zip(bloom_results, exact_results) if b and not e)
+        new_messages += fresh
+        lookups += len(msgs)
+        rounds += 1
+        bloom_mem.append(bloom.memory_bytes)
+        exact_mem.append(exact.memory_bytes)
+        if rounds % 1000 == 0:
+            print(f"  Round {rounds}...")
+
+    return {
+        'rounds': rounds,
+        'lookups': lookups,
+        'bloom_rate': lookups / bloom_time if bloom_time else 0.0,
+        'exact_rate': lookups / exact_time if exact_time else 0.0,
+        'fp_rate': false_positives / new_messages if new_messages else 0.0,
+        'false_positives': false_positives,
+        'bloom_mem_round': max(bloom_mem) / window if bloom_mem else 0,
+        'exact_mem_round': max(exact_mem) / window if exact_mem else 0,
+        'bloom_mem_peak': max(bloom_mem) if bloom_mem else 0,
+        'exact_mem_peak': max(exact_mem) if exact_mem else 0,
+        'capacity': bloom.capacity if bloom else 0,
+        'hashes': next(iter(bloom.filters.values())).num_hashes if bloom and bloom.filters else 0,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark a round-scoped Bloom dedup filter under flood traffic")
+    parser.add_argument("--rounds-log", help="round log (consensus_messages.csv) to replay message counts from")
+    parser.add_argument("--stake-file", default=DEFAULT_STAKE_FILE,
+                        help="stake snapshot for theoretical messages/round without --rounds-log")
+    parser.add_argument("--rounds", type=int, default=200, help="rounds to replay")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="rounds kept in the filter window")
+    parser.add_argument("--fp-rate", type=float, default=DEFAULT_FP_RATE, help="target Bloom false-positive rate")
+    parser.add_argument("--capacity", type=int, default=0, help="messages per round filter (default: 1.5x the busiest replayed round)")
+    parser.add_argument("--dup-flood", type=float, default=2.0, help="replayed duplicates per honest message")
+    parser.add_argument("--invalid-flood", type=int, default=2000, help="fresh invalid digests per round")
+    parser.add_argument("--stale-flood", type=int, default=2000, help="digests per round aimed at old rounds")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.rounds_log:
+        print(f"Replaying message counts from: {args.rounds_log}")
+        counts = round_message_counts(args.rounds_log, args.rounds)
+    else:
+        per_round = round(theoretical_messages(args.stake_file))
+        print(f"Replaying {per_round} theoretical messages per round ({args.stake_file})")
+        counts = theoretical_counts(args.rounds, per_round)
+
+    r = run_benchmark(counts, args.fp_rate, args.window, args.dup_flood,
+                      args.invalid_flood, args.stale_flood, args.capacity)
+    if not r['rounds']:
+        print("No rounds replayed.")
+        return
+
+    print(f"\n{'='*64}")
+    print("ROUND-SCOPED DEDUP FILTER")
+    print(f"{'='*64}")
+    print(f"Rounds replayed:        {r['rounds']:,}")
+    print(f"Lookups:                {r['lookups']:,} ({r['lookups'] / r['rounds']:,.0f}/round)")
+    print(f"Window:                 {args.window} rounds (+1 ahead)")
+    print(f"Capacity per round:     {r['capacity']:,} at target FPR {args.fp_rate:g} ({r['hashes']} hashes)")
+    print(f"\n{'':<22} {'Bloom':>14} {'Exact set':>14}")
+    print(f"{'-'*22} {'-'*14} {'-'*14}")
+    print(f"{'Lookups/sec':<22} {r['bloom_rate']:>14,.0f} {r['exact_rate']:>14,.0f}")
+    print(f"{'Memory per round':<22} {r['bloom_mem_round'] / 1024:>11.1f} KB {r['exact_mem_round'] / 1024:>11.1f} KB")
+    print(f"{'Peak window memory':<22} {r['bloom_mem_peak'] / 1024:>11.1f} KB {r['exact_mem_peak'] / 1024:>11.1f} KB")
+    print(f"{'False-positive rate':<22} {r['fp_rate']:>14.2e} {0:>14}")
+    print(f"\nFalse positives: {r['false_positives']:,} new messages wrongly dropped")
+
+
+if __name__ == "__main__":
+    main()
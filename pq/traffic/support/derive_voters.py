@@ -11,8 +11,12 @@ unique voters are needed to reach threshold for each consensus step.
 import csv
 import random
 import math
-from dataclasses import dataclass
-from typing import List, Tuple
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import metrics
 
 # go-algorand consensus parameters (from config/consensus.go, v8+)
 @dataclass
@@ -23,6 +27,19 @@ class ConsensusParams:
     cert_threshold: int = 1112
     next_committee_size: int = 5000
     next_threshold: int = 3838
+    num_proposers: int = 20  # NumProposers
+
+# Adaptive Monte Carlo defaults (simulate_adaptive)
+DEFAULT_TOLERANCE = 1.5  # CI half-width, in voters
+DEFAULT_CONFIDENCE = 0.95
+BATCH_TRIALS = 200
+MIN_TRIALS = 400
+MAX_TRIALS = 20000
+BOOTSTRAP_RESAMPLES = 2000  # reported CI only; the stopping rule uses the normal CI
+
+def parse_balance(value: str) -> float:
+    """Balance (Algos) from a snapshot's Balance column; thousands separators allowed."""
+    return float(value.replace(',', ''))
 
 def load_stakes(filepath: str) -> Tuple[List[float], float]:
     """Load stake distribution from CSV, return stakes in Algos and total."""
@@ -30,13 +47,24 @@ def load_stakes(filepath: str) -> Tuple[List[float], float]:
     with open(filepath, 'r') as f:
         reader = csv.DictReader(f)
         for row in reader:
-            balance = float(row['Balance'])
+            balance = parse_balance(row['Balance'])
             if balance > 0:
                 stakes.append(balance)
 
     total_stake = sum(stakes)
     return stakes, total_stake
 
+def load_snapshot(filepath: str) -> Dict[str, float]:
+    """Load address -> balance (Algos) for accounts with positive balance."""
+    balances = {}
+    with open(filepath, 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            balance = parse_balance(row['Balance'])
+            if balance > 0:
+                balances[row['Address']] = balance
+    return balances
+
 def expected_unique_voters(stakes: List[float], total_stake: float, committee_size: int) -> float:
     """
     Calculate expected number of unique voters using binomial probability.
@@ -101,51 +129,100 @@ def sample_weight(stake: float, tau_over_W: float) -> int:
             remaining_expected -= 1
         return weight
 
+def selection_table(stakes: List[float], tau_over_W: float) -> List[Tuple[float, float]]:
+    """Precompute (stake, P(selected)) for every account."""
+    log_not = math.log(1.0 - tau_over_W)
+    return [(stake, 1.0 - math.exp(stake * log_not)) for stake in stakes]
+
+def simulate_trial(
+    selection_probs: List[Tuple[float, float]],
+    tau_over_W: float,
+    threshold: int,
+    arrival_model=None
+) -> Optional[Tuple[int, Optional[int], Optional[int]]]:
+    """
+    One sortition draw. Returns (voters to reach threshold, overshoot, late),
+    or None if nobody was selected. Overshoot counts voters arriving within the
+    sampled late span after threshold; late is the part of it arriving after
+    the sampled advance lag. Both are None without an arrival model.
+    """
+    # Sortition: determine who is selected and their weight
+    selected_weights = []
+    for stake, p_sel in selection_probs:
+        if random.random() < p_sel:
+            weight = sample_weight(stake, tau_over_W)
+            selected_weights.append(weight)
+
+    if not selected_weights:
+        return None
+
+    if arrival_model is None:
+        # Random arrival order
+        random.shuffle(selected_weights)
+        arrivals = None
+    else:
+        # Arrival order sampled from the fitted delay model
+        arrivals = sorted((arrival_model.sample_delay(w), w) for w in selected_weights)
+        selected_weights = [w for _, w in arrivals]
+
+    # Count voters to reach threshold
+    cumulative = 0
+    reached = len(selected_weights)
+    for i, w in enumerate(selected_weights):
+        cumulative += w
+        if cumulative >= threshold:
+            reached = i + 1
+            break
+
+    if arrivals is None:
+        return reached, None, None
+    t_threshold = arrivals[reached - 1][0]
+    cutoff = t_threshold + arrival_model.sample_late_span()
+    advance = t_threshold + arrival_model.sample_advance_lag()
+    after = [d for d, _ in arrivals[reached:] if d <= cutoff]
+    return reached, len(after), sum(1 for d in after if d > advance)
+
 def simulate_voters_to_threshold(
     stakes: List[float],
     total_stake: float,
     committee_size: int,
     threshold: int,
-    trials: int = 1000
+    trials: int = 1000,
+    arrival_model=None,
+    overshoot: Optional[List[int]] = None,
+    late: Optional[List[int]] = None,
+    p_selected: Optional[Sequence[float]] = None
 ) -> Tuple[float, float, List[int]]:
     """
     Simulate sortition and calculate voters needed to reach threshold.
     Returns (mean, std, raw_results).
+
+    If arrival_model (a StepArrivalModel from arrival_model.py) is given,
+    arrival order is sampled from its fitted per-weight delays instead of a
+    uniform shuffle, and per-trial overshoot (voters arriving within the
+    sampled late span after threshold) is appended to `overshoot` if provided,
+    and the late part of it (after the sampled advance lag) to `late`.
+
+    p_selected, if given, is P(selected) per account in `stakes` order (as
+    stored by sortition_cache.py) and replaces recomputing it.
     """
     tau_over_W = committee_size / total_stake
-
-    # Precompute selection probabilities
-    selection_probs = []
-    for stake in stakes:
-        log_prob_not = stake * math.log(1.0 - tau_over_W)
-        p_sel = 1.0 - math.exp(log_prob_not)
-        selection_probs.append((stake, p_sel))
+    if p_selected is None:
+        selection_probs = selection_table(stakes, tau_over_W)
+    else:
+        selection_probs = list(zip(stakes, p_selected))
 
     voters_needed = []
 
     for trial in range(trials):
-        # Sortition: determine who is selected and their weight
-        selected_weights = []
-        for stake, p_sel in selection_probs:
-            if random.random() < p_sel:
-                weight = sample_weight(stake, tau_over_W)
-                selected_weights.append(weight)
-
-        if not selected_weights:
-            continue
-
-        # Random arrival order
-        random.shuffle(selected_weights)
-
-        # Count voters to reach threshold
-        cumulative = 0
-        for i, w in enumerate(selected_weights):
-            cumulative += w
-            if cumulative >= threshold:
-                voters_needed.append(i + 1)
-                break
-        else:
-            voters_needed.append(len(selected_weights))
+        result = simulate_trial(selection_probs, tau_over_W, threshold, arrival_model)
+        if result is not None:
+            voters, over, n_late = result
+            voters_needed.append(voters)
+            if over is not None and overshoot is not None:
+                overshoot.append(over)
+            if n_late is not None and late is not None:
+                late.append(n_late)
 
         # Progress indicator
         if (trial + 1) % 200 == 0:
@@ -161,16 +238,162 @@ def simulate_voters_to_threshold(
 
     return mean, std, voters_needed
 
+class RunningStats:
+    """Welford running mean and variance."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+def bootstrap_ci(values: List[int], confidence: float = DEFAULT_CONFIDENCE,
+                 resamples: int = BOOTSTRAP_RESAMPLES) -> Tuple[float, float]:
+    """Percentile bootstrap confidence interval for the mean."""
+    n = len(values)
+    means = sorted(sum(random.choices(values, k=n)) / n for _ in range(resamples))
+    alpha = (1.0 - confidence) / 2
+    return means[int(alpha * resamples)], means[min(resamples - 1, int((1.0 - alpha) * resamples))]
+
+@dataclass
+class AdaptiveResult:
+    mean: float
+    std: float
+    ci_low: float
+    ci_high: float
+    trials: int
+    converged: bool  # normal CI half-width reached the tolerance (False: trial cap or time budget)
+    elapsed: float
+    voters_needed: List[int] = field(repr=False, default_factory=list)
+
+    @property
+    def half_width(self) -> float:
+        return (self.ci_high - self.ci_low) / 2
+
+def simulate_adaptive(
+    stakes: List[float],
+    total_stake: float,
+    committee_size: int,
+    threshold: int,
+    tolerance: float = DEFAULT_TOLERANCE,
+    confidence: float = DEFAULT_CONFIDENCE,
+    time_budget: Optional[float] = None,
+    max_trials: int = MAX_TRIALS,
+    arrival_model=None,
+    overshoot: Optional[List[int]] = None,
+    late: Optional[List[int]] = None,
+    p_selected: Optional[Sequence[float]] = None
+) -> AdaptiveResult:
+    """
+    Like simulate_voters_to_threshold, but runs trials in batches of
+    BATCH_TRIALS and stops once the Welford normal-approximation CI
+    half-width for the mean is <= tolerance voters, or when max_trials or
+    time_budget (seconds) is hit. The reported CI is a percentile bootstrap
+    computed once over all trials, so resampling noise cannot end the run early.
+    """
+    t0 = time.perf_counter()
+    tau_over_W = committee_size / total_stake
+    if p_selected is None:
+        selection_probs = selection_table(stakes, tau_over_W)
+    else:
+        selection_probs = list(zip(stakes, p_selected))
+    z = statistics.NormalDist().inv_cdf((1.0 + confidence) / 2)
+
+    stats = RunningStats()
+    voters_needed = []
+    ci = (0.0, 0.0)
+    converged = False
+
+    while len(voters_needed) < max_trials:
+        for _ in range(min(BATCH_TRIALS, max_trials - len(voters_needed))):
+            result = simulate_trial(selection_probs, tau_over_W, threshold, arrival_model)
+            if result is None:
+                continue
+            voters, over, n_late = result
+            voters_needed.append(voters)
+            stats.add(voters)
+            if over is not None and overshoot is not None:
+                overshoot.append(over)
+            if n_late is not None and late is not None:
+                late.append(n_late)
+
+        n = len(voters_needed)
+        if n >= MIN_TRIALS and z * stats.std / math.sqrt(n) <= tolerance:
+            converged = True
+            break
+        if time_budget is not None and time.perf_counter() - t0 >= time_budget:
+            break
+
+    if voters_needed:
+        ci = bootstrap_ci(voters_needed, confidence)
+    return AdaptiveResult(
+        mean=stats.mean,
+        std=stats.std,
+        ci_low=ci[0],
+        ci_high=ci[1],
+        trials=len(voters_needed),
+        converged=converged,
+        elapsed=time.perf_counter() - t0,
+        voters_needed=voters_needed,
+    )
+
 def main():
     import sys
+    from sortition_cache import get_tables
+
+    metrics.init_from_env('derive_voters')
+
+    # Options: --tolerance=VOTERS, --budget=SECONDS (per step), --max-trials=N, --seed=N
+    tolerance = DEFAULT_TOLERANCE
+    budget = None
+    max_trials = MAX_TRIALS
+    args = []
+    for arg in sys.argv[1:]:
+        if arg.startswith('--tolerance='):
+            tolerance = float(arg.split('=', 1)[1])
+        elif arg.startswith('--budget='):
+            budget = float(arg.split('=', 1)[1])
+        elif arg.startswith('--max-trials='):
+            max_trials = int(arg.split('=', 1)[1])
+        elif arg.startswith('--seed='):
+            random.seed(int(arg.split('=', 1)[1]))
+        else:
+            args.append(arg)
 
     # Load stake distribution
     stake_file = "/home/thong/algofun/pq/traffic/support/algorand-consensus-20251124.csv"
-    if len(sys.argv) > 1:
-        stake_file = sys.argv[1]
+    if len(args) > 0:
+        stake_file = args[0]
+
+    # Optional fitted arrival model (see arrival_model.py)
+    arrival = None
+    if len(args) > 1:
+        from arrival_model import ArrivalModel
+        print(f"Loading arrival model from: {args[1]}")
+        arrival = ArrivalModel.load(args[1])
 
+    params = ConsensusParams()
+
+    # Stakes, selection probabilities and expected voters come from the
+    # per-snapshot sortition cache (built on first use)
     print(f"Loading stakes from: {stake_file}")
-    stakes, total_stake = load_stakes(stake_file)
+    with metrics.stage('load_stakes'):
+        tables = get_tables(stake_file, params)
+        stakes, total_stake = list(tables.array('stakes')), tables.total_stake
+    metrics.gauge('accounts', len(stakes))
 
     print(f"\n{'='*60}")
     print("STAKE DISTRIBUTION SUMMARY")
@@ -191,8 +414,6 @@ def main():
                 break
         print(f"Top {count} accounts hold {threshold_pct}% of stake")
 
-    params = ConsensusParams()
-
     print(f"\n{'='*60}")
     print("CONSENSUS PARAMETERS (go-algorand v8+)")
     print(f"{'='*60}")
@@ -204,58 +425,65 @@ def main():
     print("THEORETICAL EXPECTED UNIQUE VOTERS (full committee)")
     print(f"{'='*60}")
 
-    soft_expected = expected_unique_voters(stakes, total_stake, params.soft_committee_size)
-    cert_expected = expected_unique_voters(stakes, total_stake, params.cert_committee_size)
-    next_expected = expected_unique_voters(stakes, total_stake, params.next_committee_size)
+    soft_expected = tables.expected_unique_voters[params.soft_committee_size]
+    cert_expected = tables.expected_unique_voters[params.cert_committee_size]
+    next_expected = tables.expected_unique_voters[params.next_committee_size]
 
     print(f"Soft: {soft_expected:.1f} unique voters expected")
     print(f"Cert: {cert_expected:.1f} unique voters expected")
     print(f"Next: {next_expected:.1f} unique voters expected")
 
     print(f"\n{'='*60}")
-    print("SIMULATED VOTERS TO REACH THRESHOLD (1000 trials each)")
+    print(f"SIMULATED VOTERS TO REACH THRESHOLD "
+          f"(until {DEFAULT_CONFIDENCE:.0%} CI +/-{tolerance:g} voters)")
     print(f"{'='*60}")
 
-    # Soft votes
-    print("\nSimulating Soft votes...")
-    soft_mean, soft_std, _ = simulate_voters_to_threshold(
-        stakes, total_stake, params.soft_committee_size, params.soft_threshold
-    )
+    steps = [
+        ("Soft", 1, params.soft_committee_size, params.soft_threshold, soft_expected, "0.871x (~308 voters)"),
+        ("Cert", 2, params.cert_committee_size, params.cert_threshold, cert_expected, "0.627x (~147 voters)"),
+        ("Next", 3, params.next_committee_size, params.next_threshold, next_expected, None),
+    ]
+    results = {}
+    for name, step, committee_size, threshold, expected, paper in steps:
+        print(f"\nSimulating {name} votes...")
+        over = []
+        late = []
+        with metrics.stage(f'simulate_{name.lower()}'):
+            r = simulate_adaptive(
+                stakes, total_stake, committee_size, threshold,
+                tolerance=tolerance, time_budget=budget, max_trials=max_trials,
+                arrival_model=arrival.for_step(step) if arrival else None, overshoot=over, late=late,
+                p_selected=tables.array(f'p_selected_{committee_size}')
+            )
+        metrics.count('trials', r.trials)
+        results[name] = r
+        stop = "converged" if r.converged else "stopped at budget/trial cap"
+        print(f"{name} votes to threshold {threshold}:")
+        print(f"  Mean: {r.mean:.1f} voters (std: {r.std:.1f}, "
+              f"{DEFAULT_CONFIDENCE:.0%} CI {r.ci_low:.1f}-{r.ci_high:.1f})")
+        print(f"  Trials: {r.trials} in {r.elapsed:.1f}s ({stop})")
+        print(f"  Ratio to theory: {r.mean / expected:.3f}x")
+        if over:
+            print(f"  Overshoot (fitted arrival): {sum(over) / len(over):.1f} voters, "
+                  f"{sum(late) / len(late):.1f} of them late")
+        if paper:
+            print(f"  Paper observed:  {paper}")
+
+    soft_mean, cert_mean, next_mean = (results[name].mean for name in ("Soft", "Cert", "Next"))
     soft_ratio = soft_mean / soft_expected
-    print(f"Soft votes to threshold {params.soft_threshold}:")
-    print(f"  Mean: {soft_mean:.1f} voters (std: {soft_std:.1f})")
-    print(f"  Ratio to theory: {soft_ratio:.3f}x")
-    print(f"  Paper observed:  0.871x (~308 voters)")
-
-    # Cert votes
-    print("\nSimulating Cert votes...")
-    cert_mean, cert_std, _ = simulate_voters_to_threshold(
-        stakes, total_stake, params.cert_committee_size, params.cert_threshold
-    )
     cert_ratio = cert_mean / cert_expected
-    print(f"Cert votes to threshold {params.cert_threshold}:")
-    print(f"  Mean: {cert_mean:.1f} voters (std: {cert_std:.1f})")
-    print(f"  Ratio to theory: {cert_ratio:.3f}x")
-    print(f"  Paper observed:  0.627x (~147 voters)")
-
-    # Next votes
-    print("\nSimulating Next votes...")
-    next_mean, next_std, _ = simulate_voters_to_threshold(
-        stakes, total_stake, params.next_committee_size, params.next_threshold
-    )
     next_ratio = next_mean / next_expected
-    print(f"Next votes to threshold {params.next_threshold}:")
-    print(f"  Mean: {next_mean:.1f} voters (std: {next_std:.1f})")
-    print(f"  Ratio to theory: {next_ratio:.3f}x")
 
     print(f"\n{'='*60}")
     print("COMPARISON SUMMARY")
     print(f"{'='*60}")
-    print(f"{'Step':<6} {'Theory':<10} {'Simulated':<12} {'Ratio':<8} {'Paper':<8} {'Empirical':<10}")
-    print(f"{'-'*6} {'-'*10} {'-'*12} {'-'*8} {'-'*8} {'-'*10}")
-    print(f"{'Soft':<6} {soft_expected:<10.1f} {soft_mean:<12.1f} {soft_ratio:<8.3f} {'0.871':<8} {'~308':<10}")
-    print(f"{'Cert':<6} {cert_expected:<10.1f} {cert_mean:<12.1f} {cert_ratio:<8.3f} {'0.627':<8} {'~147':<10}")
-    print(f"{'Next':<6} {next_expected:<10.1f} {next_mean:<12.1f} {next_ratio:<8.3f} {'N/A':<8} {'0':<10}")
+    print(f"{'Step':<6} {'Theory':<10} {'Simulated':<12} {'CI':<14} {'Ratio':<8} {'Paper':<8} {'Empirical':<10}")
+    print(f"{'-'*6} {'-'*10} {'-'*12} {'-'*14} {'-'*8} {'-'*8} {'-'*10}")
+    soft_ci, cert_ci, next_ci = (f"{results[name].ci_low:.1f}-{results[name].ci_high:.1f}"
+                                 for name in ("Soft", "Cert", "Next"))
+    print(f"{'Soft':<6} {soft_expected:<10.1f} {soft_mean:<12.1f} {soft_ci:<14} {soft_ratio:<8.3f} {'0.871':<8} {'~308':<10}")
+    print(f"{'Cert':<6} {cert_expected:<10.1f} {cert_mean:<12.1f} {cert_ci:<14} {cert_ratio:<8.3f} {'0.627':<8} {'~147':<10}")
+    print(f"{'Next':<6} {next_expected:<10.1f} {next_mean:<12.1f} {next_ci:<14} {next_ratio:<8.3f} {'N/A':<8} {'0':<10}")
 
     print(f"\n{'='*60}")
     print("INTERPRETATION")
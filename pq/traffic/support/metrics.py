@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Stage timers, counters and an optional sampling profiler for the analysis scripts.
+
+Scripts wrap coarse stages (CSV parse, grouping, sorting, simulation) in
+`with stage("parse"):` and report totals with `count("rows_parsed", n)`.
+Both cost about a microsecond, so they belong around loops, not inside them.
+Nothing is emitted unless enabled from the environment, so the human report
+on stdout is unchanged:
+
+    ALGOFUN_METRICS=json|prom   emit metrics at exit (JSON or Prometheus text)
+    ALGOFUN_METRICS_FILE=path   write them there instead of stderr
+    ALGOFUN_PROFILE=path        sample the main thread's stack every
+                                ALGOFUN_PROFILE_INTERVAL seconds (default
+                                0.005) and write folded stacks to path, for
+                                flamegraph.pl or speedscope
+
+The profiler is a SIGPROF interval timer (CPU time, main thread, Unix only);
+each sample walks the current frame stack, so overhead scales with the
+sampling rate, not with the code being profiled.
+"""
+
+import atexit
+import json
+import os
+import signal
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+DEFAULT_PROFILE_INTERVAL = 0.005
+PROMETHEUS_PREFIX = 'algofun'
+
+
+class Metrics:
+    """Accumulated stage timings, counters and gauges for one script run."""
+
+    def __init__(self, script: str = ''):
+        self.script = script
+        self.started = time.time()
+        self.stage_seconds: Dict[str, float] = {}
+        self.stage_calls: Counter = Counter()
+        self.counters: Counter = Counter()
+        self.gauges: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.perf_counter() - t0
+            self.stage_calls[name] += 1
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def to_dict(self) -> dict:
+        return {
+            'script': self.script,
+            'started_unix': self.started,
+            'wall_seconds': time.time() - self.started,
+            'stages': {name: {'seconds': secs, 'calls': self.stage_calls[name]}
+                       for name, secs in self.stage_seconds.items()},
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=1)
+
+    def to_prometheus(self, prefix: str = PROMETHEUS_PREFIX) -> str:
+        """Prometheus text exposition format, labelled by script."""
+        label = f'script="{self.script}"'
+        lines = [
+            f"# TYPE {prefix}_stage_seconds_total counter",
+            *(f'{prefix}_stage_seconds_total{{{label},stage="{name}"}} {secs:.6f}'
+              for name, secs in self.stage_seconds.items()),
+            f"# TYPE {prefix}_stage_calls_total counter",
+            *(f'{prefix}_stage_calls_total{{{label},stage="{name}"}} {calls}'
+              for name, calls in self.stage_calls.items()),
+        ]
+        for name, value in self.counters.items():
+            lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total{{{label}}} {value}"]
+        for name, value in self.gauges.items():
+            lines += [f"# TYPE {prefix}_{name} gauge", f"{prefix}_{name}{{{label}}} {value}"]
+        lines += [f"# TYPE {prefix}_wall_seconds gauge",
+                  f"{prefix}_wall_seconds{{{label}}} {time.time() - self.started:.6f}"]
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Folded-stack sampler driven by SIGPROF."""
+
+    def __init__(self, interval: float = DEFAULT_PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def write(self, path: str):
+        with open(path, 'w') as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+
+
+# Process-wide registry used by the module-level helpers
+METRICS = Metrics()
+_profiler: Optional[SamplingProfiler] = None
+
+
+def stage(name: str):
+    return METRICS.stage(name)
+
+
+def count(name: str, n: int = 1):
+    METRICS.count(name, n)
+
+
+def gauge(name: str, value: float):
+    METRICS.gauge(name, value)
+
+
+def _emit(fmt: str, path: Optional[str]):
+    text = METRICS.to_prometheus() if fmt == 'prom' else METRICS.to_json() + '\n'
+    if path:
+        with open(path, 'w') as f:
+            f.write(text)
+    else:
+        sys.stderr.write(text)
+
+
+def _finish_profile(path: str):
+    _profiler.stop()
+    _profiler.write(path)
+
+
+def init_from_env(script: str):
+    """Name this run and enable emission/profiling from ALGOFUN_* variables."""
+    global _profiler
+    METRICS.script = script
+    fmt = os.environ.get('ALGOFUN_METRICS')
+    if fmt:
+        if fmt not in ('json', 'prom'):
+            raise ValueError(f"ALGOFUN_METRICS must be 'json' or 'prom', not {fmt!r}")
+        atexit.register(_emit, fmt, os.environ.get('ALGOFUN_METRICS_FILE'))
+    profile_path = os.environ.get('ALGOFUN_PROFILE')
+    if profile_path and _profiler is None:
+        interval = float(os.environ.get('ALGOFUN_PROFILE_INTERVAL', DEFAULT_PROFILE_INTERVAL))
+        _profiler = SamplingProfiler(interval)
+        _profiler.start()
+        atexit.register(_finish_profile, profile_path)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Regress per-round message volume on peer count across captures and
+extrapolate aggregate envelope bandwidth to 50-100 peer relays.
+
+Every consensus_messages.csv row from V2 on carries in_peers/out_peers, but
+learnings.md §4 only contrasts the single-peer and ~54-peer captures, and
+falcon_envelopes.md §9.4.1 asserts that aggregate bandwidth is proportional to
+peer count. This streams every messages-kind CSV under the given paths
+(schemas matched as in round_index.py) and fits, per round,
+
+    y = a + b * peers                       peers = in_peers + out_peers
+    y = a + b_in * in_peers + b_out * out_peers   when both vary
+
+for four metrics:
+
+    messages    proposals + soft/cert/next votes, on-time and late
+    late        late soft + cert + next votes (V5 and later)
+    soft_total  soft votes + late soft votes (V5 and later)
+    overshoot   soft_total_unique_senders - soft_unique_senders: soft voters
+                heard only after the node left the soft step (current header)
+
+The pipelined_* columns are left out: recordConsensusVote counts a pipelined
+vote under both vote.Round and playerRound, so it is already in the soft/cert
+counts of its own round. overshoot counts senders past the point the node
+advanced, which includes the advance lag; voters past the threshold itself
+need arrival order from consensus_votes_detail.csv (see
+quantify_whale_impact_soft.py).
+
+Fits use per-block sufficient statistics (X'X, X'y, y'y over BLOCK_ROUNDS
+consecutive rounds of one capture), so memory is independent of capture
+length. Consecutive rounds are correlated, so uncertainty comes from a block
+bootstrap over those blocks rather than from the OLS standard errors.
+
+The logged counts are what one node's agreement layer saw. The bandwidth
+extrapolation keeps §9.4.1's model, where each peer connection carries the
+per-peer stream once, but uses the fitted messages(P) in place of the
+snapshot's theoretical messages per round (sortition_cache.py, ~1,084):
+
+    aggregate = P * messages(P) * envelope size * rounds/day
+"""
+
+import csv
+import math
+import os
+import random
+from typing import Dict, List, Optional, Tuple
+
+from consensus_logs import DEFAULT_STAKE_FILE, ENVELOPE_BYTES, ENVELOPE_BYTES_HIGH, ENVELOPE_BYTES_LOW, ROUNDS_PER_DAY
+from round_index import SCHEMAS, match_schema
+from sortition_cache import theoretical_messages
+
+BLOCK_ROUNDS = 256
+BOOTSTRAP_RESAMPLES = 1000
+CONFIDENCE = 0.95
+DEFAULT_PEERS = (50, 60, 70, 80, 90, 100)
+MIN_VARIANCE = 1e-9
+
+MESSAGE_COLUMNS = ('proposals', 'soft_votes', 'cert_votes', 'next_votes',
+                   'late_soft_votes', 'late_cert_votes', 'late_next_votes')
+LATE_COLUMNS = ('late_soft_votes', 'late_cert_votes', 'late_next_votes')
+SOFT_COLUMNS = ('soft_votes', 'late_soft_votes')
+METRICS = ('messages', 'late', 'soft_total', 'overshoot')
+# Columns a capture's header must have for each metric
+METRIC_REQUIRES = {
+    'messages': (),
+    'late': LATE_COLUMNS,
+    'soft_total': SOFT_COLUMNS,
+    'overshoot': ('soft_unique_senders', 'soft_total_unique_senders'),
+}
+# Regressors of the full model; the total-peers model is derived from it
+REGRESSORS = ('1', 'in_peers', 'out_peers')
+TOTAL_MODEL = ((1, 0, 0), (0, 1, 1))  # rows map (1, in, out) -> (1, in + out)
+
+
+class Block:
+    """Sufficient statistics for one run of consecutive rounds from one capture."""
+
+    def __init__(self, metrics: Tuple[str, ...]):
+        k = len(REGRESSORS)
+        self.metrics = metrics
+        self.n = 0
+        self.xtx = [[0.0] * k for _ in range(k)]
+        self.xty = {m: [0.0] * k for m in metrics}
+        self.yty = {m: 0.0 for m in metrics}
+
+    def add(self, x: Tuple[float, ...], ys: Dict[str, float]):
+        self.n += 1
+        k = len(x)
+        for i in range(k):
+            xi = x[i]
+            row = self.xtx[i]
+            for j in range(k):
+                row[j] += xi * x[j]
+        for m in self.metrics:
+            y = ys[m]
+            xty = self.xty[m]
+            for i in range(k):
+                xty[i] += x[i] * y
+            self.yty[m] += y * y
+
+
+def project(xtx: List[List[float]], xty: List[float], rows) -> Tuple[List[List[float]], List[float]]:
+    """Moments of the model with regressors A x, from moments of x."""
+    a = [list(r) for r in rows]
+    k = len(xtx)
+    ax = [[sum(a[i][p] * xtx[p][q] for p in range(k)) for q in range(k)] for i in range(len(a))]
+    xtx_a = [[sum(ax[i][q] * a[j][q] for q in range(k)) for j in range(len(a))] for i in range(len(a))]
+    xty_a = [sum(a[i][p] * xty[p] for p in range(k)) for i in range(len(a))]
+    return xtx_a, xty_a
+
+
+def invert(m: List[List[float]]) -> List[List[float]]:
+    """Gauss-Jordan inverse of a small symmetric positive definite matrix."""
+    k = len(m)
+    aug = [list(row) + [1.0 if i == j else 0.0 for j in range(k)] for i, row in enumerate(m)]
+    for col in range(k):
+        pivot = max(range(col, k), key=lambda r: abs(aug[r][col]))
+        aug[col], aug[pivot] = aug[pivot], aug[col]
+        p = aug[col][col]
+        aug[col] = [v / p for v in aug[col]]
+        for r in range(k):
+            if r != col and aug[r][col]:
+                f = aug[r][col]
+                aug[r] = [v - f * w for v, w in zip(aug[r], aug[col])]
+    return [row[k:] for row in aug]
+
+
+def ols(n: int, xtx: List[List[float]], xty: List[float], yty: float) -> Optional[dict]:
+    """
+    Solve the normal equations, dropping regressors with no variance.
+    Returns coefficients (None for dropped), residual variance and R^2.
+    """
+    if n < 3:
+        return None
+    k = len(xtx)
+    keep = [0] + [j for j in range(1, k)
+                  if xtx[j][j] / n - (xtx[0][j] / n) ** 2 > MIN_VARIANCE]
+    inv = invert([[xtx[i][j] for j in keep] for i in keep])
+    sub_xty = [xty[i] for i in keep]
+    beta_kept = [sum(inv[i][j] * sub_xty[j] for j in range(len(keep))) for i in range(len(keep))]
+    rss = yty - sum(b * v for b, v in zip(beta_kept, sub_xty))
+    tss = yty - xty[0] ** 2 / n
+    beta: List[Optional[float]] = [None] * k
+    for b, i in zip(beta_kept, keep):
+        beta[i] = b
+    return {
+        'beta': beta,
+        'sigma2': max(rss, 0.0) / max(n - len(keep), 1),
+        'r2': 1.0 - rss / tss if tss > 0 else 0.0,
+        'n': n,
+    }
+
+
+def pooled(blocks: List[Block], metric: str, rows=None) -> Optional[dict]:
+    """OLS on the summed moments of the blocks that carry `metric`."""
+    k = len(REGRESSORS)
+    n = 0
+    xtx = [[0.0] * k for _ in range(k)]
+    xty = [0.0] * k
+    yty = 0.0
+    for b in blocks:
+        if metric not in b.metrics:
+            continue
+        n += b.n
+        for i in range(k):
+            xty[i] += b.xty[metric][i]
+            for j in range(k):
+                xtx[i][j] += b.xtx[i][j]
+        yty += b.yty[metric]
+    if rows is not None:
+        xtx, xty = project(xtx, xty, rows)
+    return ols(n, xtx, xty, yty)
+
+
+def row_metrics(row: Dict[str, str], metrics: Tuple[str, ...]) -> Dict[str, float]:
+    def val(col):
+        v = row.get(col)
+        return float(v) if v else 0.0
+
+    ys = {}
+    if 'messages' in metrics:
+        ys['messages'] = sum(val(c) for c in MESSAGE_COLUMNS)
+    if 'late' in metrics:
+        ys['late'] = sum(val(c) for c in LATE_COLUMNS)
+    if 'soft_total' in metrics:
+        ys['soft_total'] = sum(val(c) for c in SOFT_COLUMNS)
+    if 'overshoot' in metrics:
+        ys['overshoot'] = val('soft_total_unique_senders') - val('soft_unique_senders')
+    return ys
+
+
+def find_captures(paths: List[str]) -> List[Tuple[str, str]]:
+    """(path, schema) for every messages-kind CSV with peer columns under paths."""
+    found = []
+    for path in paths:
+        files = [path] if os.path.isfile(path) else sorted(
+            os.path.join(d, f) for d, _, names in os.walk(path) for f in names if f.endswith('.csv'))
+        for fn in files:
+            with open(fn, 'r', errors='replace') as f:
+                schema = match_schema(f.readline().rstrip('\r\n'))
+            if schema and SCHEMAS[schema][0] == 'messages' and 'in_peers' in SCHEMAS[schema][2].split(','):
+                found.append((fn, schema))
+    return found
+
+
+def stream_capture(path: str, schema: str, stats: dict) -> List[Block]:
+    """Read one capture into per-block moments; fills peer range and row count in stats."""
+    columns = SCHEMAS[schema][2].split(',')
+    metrics = tuple(m for m in METRICS if all(c in columns for c in METRIC_REQUIRES[m]))
+    blocks = []
+    block = Block(metrics)
+    lo, hi = math.inf, -math.inf
+    with open(path, 'r') as f:
+        for row in csv.DictReader(f):
+            try:
+                p_in, p_out = float(row['in_peers']), float(row['out_peers'])
+            except (TypeError, ValueError):
+                continue
+            block.add((1.0, p_in, p_out), row_metrics(row, metrics))
+            lo, hi = min(lo, p_in + p_out), max(hi, p_in + p_out)
+            if block.n == BLOCK_ROUNDS:
+                blocks.append(block)
+                block = Block(metrics)
+    if block.n:
+        blocks.append(block)
+    stats.update(rows=sum(b.n for b in blocks), peers=(lo, hi), metrics=metrics)
+    return blocks
+
+
+def bootstrap_predictions(blocks: List[Block], metric: str, peers: Tuple[int, ...],
+                          resamples: int, rng: random.Random) -> Tuple[List[List[float]], List[float]]:
+    """Per-peer-count predictions and slopes of the total-peers model over block resamples."""
+    usable = [b for b in blocks if metric in b.metrics]
+    preds = [[] for _ in peers]
+    slopes = []
+    for _ in range(resamples):
+        fit = pooled(rng.choices(usable, k=len(usable)), metric, TOTAL_MODEL)
+        if fit is None or fit['beta'][1] is None:
+            continue
+        a, b = fit['beta']
+        slopes.append(b)
+        for i, p in enumerate(peers):
+            preds[i].append(a + b * p)
+    return preds, slopes
+
+
+def percentile_interval(values: List[float], confidence: float = CONFIDENCE) -> Tuple[float, float]:
+    if not values:
+        return math.nan, math.nan
+    s = sorted(values)
+    alpha = (1.0 - confidence) / 2
+    return s[int(alpha * (len(s) - 1))], s[int(math.ceil((1 - alpha) * (len(s) - 1)))]
+
+
+def gb_per_day(messages: float, peers: int, envelope_bytes: int) -> float:
+    return messages * peers * envelope_bytes * ROUNDS_PER_DAY / 1e9
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Peer-count scaling of per-round message volume")
+    parser.add_argument('paths', nargs='+', help="capture directories or consensus_messages CSVs")
+    parser.add_argument('--peers', default=','.join(map(str, DEFAULT_PEERS)),
+                        help="peer counts to extrapolate to (default: %(default)s)")
+    parser.add_argument('--stake-file', default=DEFAULT_STAKE_FILE,
+                        help="stake snapshot for the §9.4.1 theoretical messages per round")
+    parser.add_argument('--resamples', type=int, default=BOOTSTRAP_RESAMPLES)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    peers = tuple(int(p) for p in args.peers.split(','))
+    rng = random.Random(args.seed)
+
+    captures = find_captures(args.paths)
+    if not captures:
+        print("No consensus_messages CSVs with peer columns found")
+        return
+
+    print(f"{'='*60}")
+    print("CAPTURES")
+    print(f"{'='*60}")
+    print(f"{'File':<50} {'Schema':<12} {'Rounds':>8} {'Peers':>9}  Metrics")
+    blocks: List[Block] = []
+    observed = (math.inf, -math.inf)
+    for path, schema in captures:
+        stats = {}
+        blocks += stream_capture(path, schema, stats)
+        lo, hi = stats['peers']
+        observed = (min(observed[0], lo), max(observed[1], hi))
+        print(f"{path[-50:]:<50} {schema:<12} {stats['rows']:>8} {lo:>4.0f}-{hi:<4.0f}  {','.join(stats['metrics'])}")
+
+    print(f"\n{'='*60}")
+    print(f"FITS (slope per peer, {CONFIDENCE:.0%} block-bootstrap interval)")
+    print(f"{'='*60}")
+    predictions = {}
+    for metric in METRICS:
+        fit = pooled(blocks, metric, TOTAL_MODEL)
+        if fit is None:
+            continue
+        print(f"\n{metric}: n={fit['n']:,} rounds")
+        if fit['beta'][1] is None:
+            print(f"  peers constant across captures: mean {fit['beta'][0]:.1f}/round, no slope")
+            continue
+        preds, slopes = bootstrap_predictions(blocks, metric, peers, args.resamples, rng)
+        s_lo, s_hi = percentile_interval(slopes)
+        print(f"  total peers:  {fit['beta'][0]:.1f} {fit['beta'][1]:+.3f} * peers "
+              f"[{s_lo:+.3f}, {s_hi:+.3f}]  R^2={fit['r2']:.3f}  resid sd={math.sqrt(fit['sigma2']):.1f}")
+        split = pooled(blocks, metric)
+        terms = [f"{name} {b:+.3f}" if b is not None else f"{name} (no variance)"
+                 for name, b in zip(REGRESSORS[1:], split['beta'][1:])]
+        print(f"  split:        {split['beta'][0]:.1f}, {', '.join(terms)}")
+        predictions[metric] = (fit, preds)
+
+    if 'messages' not in predictions:
+        return
+    fit, preds = predictions['messages']
+    print(f"\n{'='*60}")
+    print("AGGREGATE ENVELOPE BANDWIDTH (P peers x messages(P) per peer)")
+    print(f"{'='*60}")
+    print(f"Observed peers: {observed[0]:.0f}-{observed[1]:.0f}; * = extrapolated beyond observed range")
+    print(f"Bands: {CONFIDENCE:.0%} bootstrap interval of messages(P) x "
+          f"{ENVELOPE_BYTES_LOW / 1000:.1f}-{ENVELOPE_BYTES_HIGH / 1000:.1f} KB envelopes\n")
+    print(f"{'Peers':>6} {'Msgs/round':>11} {'Msgs CI':>15} {'GB/day':>8} {'GB/day band':>15} "
+          f"{'Mbps':>6} {'§9.4.1 GB/day':>14}")
+    print("-" * 84)
+    a, b = fit['beta']
+    theoretical = theoretical_messages(args.stake_file)
+    for i, p in enumerate(peers):
+        mean = a + b * p
+        m_lo, m_hi = percentile_interval(preds[i])
+        mid = gb_per_day(mean, p, ENVELOPE_BYTES)
+        band_lo = gb_per_day(m_lo, p, ENVELOPE_BYTES_LOW)
+        band_hi = gb_per_day(m_hi, p, ENVELOPE_BYTES_HIGH)
+        mbps = mid * 8e3 / 86400
+        flag = '*' if p > observed[1] or p < observed[0] else ' '
+        print(f"{p:>5}{flag} {mean:>11.0f} {m_lo:>7.0f}-{m_hi:<7.0f} {mid:>8.0f} {band_lo:>7.0f}-{band_hi:<7.0f} "
+              f"{mbps:>6.0f} {gb_per_day(theoretical, p, ENVELOPE_BYTES):>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
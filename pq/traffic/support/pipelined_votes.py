@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Analyze pipelined (future-round) votes from consensus_pipelined_debug.csv.
+
+Every row is a vote for vote_round > player_round, observed while the node was
+still on player_round. This script streams the debug log, joins it against the
+per-round log (consensus_messages*.csv) and reports:
+- how many future-round votes arrive early per round, by step
+- how many a node buffers vs drops, and at what lookahead depth
+- the buffer memory needed for each lookahead distance
+
+go-algorand only buffers votes for player_round + 1 (MAX_BUFFER_DEPTH); votes
+further ahead are dropped by the vote filter and must be re-gossiped later.
+
+Per-round aggregates are held as counts keyed by a packed integer
+(lookahead, period, step, kind), so memory grows with the number of rounds
+that saw pipelining, not with the number of debug rows.
+"""
+
+import csv
+import statistics
+from collections import Counter, defaultdict
+from typing import Dict, Optional
+
+from consensus_logs import percentile
+
+MAX_BUFFER_DEPTH = 1  # votes for r+1 are buffered, r+2 and beyond are dropped
+
+# Wire size of one buffered vote (vpack stateless, consensus_traffic.md Part V)
+VOTE_WIRE_BYTES = 375
+# Packed buffer entry: 64-bit vote shape + 32-bit sender index
+PACKED_ENTRY_BYTES = 12
+
+# Packed vote shape layout (low to high): kind 4 bits, step 8 bits, period 16 bits, lookahead
+KIND_BITS = 4
+STEP_BITS = 8
+PERIOD_BITS = 16
+STEP_SHIFT = KIND_BITS
+PERIOD_SHIFT = STEP_SHIFT + STEP_BITS
+LOOKAHEAD_SHIFT = PERIOD_SHIFT + PERIOD_BITS
+
+
+def pack_shape(lookahead: int, period: int, step: int, kind: int) -> int:
+    """Pack a pipelined vote's shape into a single integer."""
+    return (lookahead << LOOKAHEAD_SHIFT) | (period << PERIOD_SHIFT) | (step << STEP_SHIFT) | kind
+
+
+def unpack_shape(shape: int):
+    """Return (lookahead, period, step, kind) from a packed shape."""
+    return (
+        shape >> LOOKAHEAD_SHIFT,
+        (shape >> PERIOD_SHIFT) & ((1 << PERIOD_BITS) - 1),
+        (shape >> STEP_SHIFT) & ((1 << STEP_BITS) - 1),
+        shape & ((1 << KIND_BITS) - 1),
+    )
+
+
+def load_pipelined(debug_file: str) -> Dict[int, Counter]:
+    """
+    Stream the pipelined debug log into player_round -> Counter(packed shape).
+    Header lines repeated by logger restarts are skipped.
+    """
+    rounds = defaultdict(Counter)
+    with open(debug_file, 'r') as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if not row or not row[0].isdigit():
+                continue
+            player_round = int(row[0])
+            lookahead = int(row[1]) - player_round
+            rounds[player_round][pack_shape(lookahead, int(row[2]), int(row[3]), int(row[4]))] += 1
+    return rounds
+
+
+def join_round_log(rounds_file: str, pipelined: Dict[int, Counter]):
+    """
+    Stream the round log and pick out logged pipelined counts and the
+    next round's vote totals for every player_round that saw pipelining.
+    Columns are looked up by name so every logger schema version works.
+    Returns (round -> row, total rounds in log).
+    """
+    wanted = set(pipelined) | {r + 1 for r in pipelined}
+    joined = {}
+    total = 0
+    with open(rounds_file, 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            total += 1
+            rnd = int(row['round'])
+            if rnd in wanted:
+                joined[rnd] = row
+    return joined, total
+
+
+def _int_or_none(value: Optional[str]) -> Optional[int]:
+    return int(value) if value not in (None, '') else None
+
+
+def analyze(pipelined: Dict[int, Counter], joined: Dict[int, dict]):
+    """Build per-round rows and per-lookahead depth samples."""
+    per_round = []
+    depth_samples = defaultdict(list)  # lookahead -> buffered votes per round
+    lookaheads = set()
+    for counts in pipelined.values():
+        for shape in counts:
+            lookaheads.add(unpack_shape(shape)[0])
+
+    for player_round in sorted(pipelined):
+        counts = pipelined[player_round]
+        by_kind = Counter()
+        by_depth = Counter()
+        for shape, n in counts.items():
+            lookahead, _, _, kind = unpack_shape(shape)
+            by_kind[kind] += n
+            by_depth[lookahead] += n
+
+        early = sum(by_depth.values())
+        buffered = sum(n for d, n in by_depth.items() if d <= MAX_BUFFER_DEPTH)
+        for d in lookaheads:
+            depth_samples[d].append(by_depth.get(d, 0))
+
+        logged = joined.get(player_round, {})
+        following = joined.get(player_round + 1, {})
+        next_soft = _int_or_none(following.get('soft_votes'))
+        per_round.append({
+            'round': player_round,
+            'early': early,
+            'soft': by_kind.get(1, 0),
+            'cert': by_kind.get(2, 0),
+            'buffered': buffered,
+            'dropped': early - buffered,
+            'max_depth': max(by_depth),
+            'logged_soft': _int_or_none(logged.get('pipelined_soft_votes')),
+            'logged_cert': _int_or_none(logged.get('pipelined_cert_votes')),
+            'next_round_soft': next_soft,
+            'in_round_log': bool(logged),
+        })
+
+    return per_round, depth_samples
+
+
+def print_results(per_round, depth_samples, total_rounds: Optional[int]):
+    print("=" * 80)
+    print("PIPELINED VOTES PER ROUND")
+    print("=" * 80)
+    print(f"\n{'Round':<10} {'Early':>7} {'Soft':>6} {'Cert':>6} {'Buffered':>9} {'Dropped':>8} "
+          f"{'Depth':>6} {'Logged S/C':>11} {'% of r+1 soft':>14}")
+    print("-" * 86)
+    for r in per_round:
+        if r['in_round_log']:
+            logged = f"{r['logged_soft'] or 0}/{r['logged_cert'] or 0}"
+        else:
+            logged = "n/a"
+        if r['next_round_soft']:
+            share = f"{r['soft'] / r['next_round_soft'] * 100:.1f}%"
+        else:
+            share = "n/a"
+        print(f"{r['round']:<10} {r['early']:>7} {r['soft']:>6} {r['cert']:>6} {r['buffered']:>9} "
+              f"{r['dropped']:>8} {r['max_depth']:>6} {logged:>11} {share:>14}")
+
+    early = [r['early'] for r in per_round]
+    print("\n" + "=" * 80)
+    print("SUMMARY")
+    print("=" * 80)
+    print(f"\nRounds with pipelined votes: {len(per_round)}"
+          + (f" of {total_rounds} in round log" if total_rounds else ""))
+    if early:
+        print(f"Early votes per pipelined round: mean {statistics.mean(early):.1f}, "
+              f"max {max(early)}")
+        print(f"Buffered: {sum(r['buffered'] for r in per_round):,}  "
+              f"Dropped (depth > {MAX_BUFFER_DEPTH}): {sum(r['dropped'] for r in per_round):,}")
+        mismatched = [r['round'] for r in per_round
+                      if r['in_round_log'] and (r['logged_soft'], r['logged_cert']) != (r['soft'], r['cert'])]
+        if mismatched:
+            print(f"Rounds where debug rows disagree with round log: {len(mismatched)}")
+
+    print("\n" + "=" * 80)
+    print("BUFFER MEMORY BY LOOKAHEAD DISTANCE")
+    print("=" * 80)
+    print(f"\n{'Lookahead':<10} {'Mean':>8} {'p99':>8} {'Max':>8} "
+          f"{'Full votes KB':>14} {'Packed KB':>10}")
+    print("-" * 62)
+    for d in sorted(depth_samples):
+        samples = depth_samples[d]
+        peak = max(samples)
+        print(f"r+{d:<8} {statistics.mean(samples):>8.1f} {percentile(sorted(samples), 99):>8} {peak:>8} "
+              f"{peak * VOTE_WIRE_BYTES / 1024:>14.1f} {peak * PACKED_ENTRY_BYTES / 1024:>10.2f}")
+    print(f"\nFull votes at {VOTE_WIRE_BYTES} B each; packed entries at {PACKED_ENTRY_BYTES} B "
+          f"(64-bit shape + 32-bit sender index). KB columns use the per-round peak.")
+
+
+def main():
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: pipelined_votes.py <consensus_pipelined_debug.csv> [consensus_messages.csv]")
+        sys.exit(1)
+
+    debug_file = sys.argv[1]
+    rounds_file = sys.argv[2] if len(sys.argv) > 2 else None
+
+    print(f"Loading pipelined votes from: {debug_file}")
+    pipelined = load_pipelined(debug_file)
+    if not pipelined:
+        print("No pipelined votes found.")
+        return
+
+    joined = {}
+    total_rounds = None
+    if rounds_file:
+        print(f"Joining against round log: {rounds_file}")
+        joined, total_rounds = join_round_log(rounds_file, pipelined)
+
+    per_round, depth_samples = analyze(pipelined, joined)
+    print_results(per_round, depth_samples, total_rounds)
+
+
+if __name__ == "__main__":
+    main()
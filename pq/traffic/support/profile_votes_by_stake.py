@@ -7,6 +7,8 @@ Analyzes how many votes emanate from top-10, 10-20, 20-30, etc. accounts.
 import csv
 from collections import defaultdict
 
+from metrics import count, init_from_env, stage
+
 # Load stake distribution and rank accounts
 def load_stake_ranks(stake_file):
     """Load stake distribution and return address -> rank mapping."""
@@ -84,6 +86,8 @@ def analyze_votes(votes_file, addr_to_rank):
                 cert_weight[tier] += weight
                 total_cert += 1
 
+        count('rows_parsed', reader.line_num - 1)
+
     return {
         'tiers': tiers,
         'soft_votes': soft_votes,
@@ -181,15 +185,24 @@ def print_results(results, accounts):
 
 
 def main():
-    stake_file = "/home/thong/algofun/pq/traffic/support/algorand-consensus-20251128.csv"
+    import sys
+    init_from_env('profile_votes_by_stake')
+
     votes_file = "/home/thong/algofun/pq/traffic/logs/log5/consensus_votes_detail.csv"
+    stake_file = "/home/thong/algofun/pq/traffic/support/algorand-consensus-20251128.csv"
+    if len(sys.argv) > 1:
+        votes_file = sys.argv[1]
+    if len(sys.argv) > 2:
+        stake_file = sys.argv[2]
 
     print("Loading stake distribution...")
-    addr_to_rank, accounts = load_stake_ranks(stake_file)
+    with stage('load_stakes'):
+        addr_to_rank, accounts = load_stake_ranks(stake_file)
     print(f"  Loaded {len(accounts)} accounts")
 
     print("Analyzing votes...")
-    results = analyze_votes(votes_file, addr_to_rank)
+    with stage('parse_and_group'):
+        results = analyze_votes(votes_file, addr_to_rank)
     print(f"  Soft votes: {results['total_soft']:,}")
     print(f"  Cert votes: {results['total_cert']:,}")
 
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Model how many proposals a node observes per round when the soft-vote quorum
+cuts the proposal phase short (see proposals_discrepancy.md).
+
+For each simulated round:
+1. Proposer sortition over the stake snapshot (~20 expected proposers); each
+   proposer's priority is the lowest of its sub-user credential hashes.
+2. Every proposal is given an arrival time at the node from a propagation
+   model of its own (PROPOSAL_BASE_MS + exponential PROPOSAL_SPREAD_MS). The
+   arrival_model.py delays are not reused here: they are measured from the
+   first soft vote, so proposals drawn from them would all land inside the
+   soft step and could never be cut.
+3. Soft voters are drawn by sortition and given arrival times after the
+   filter timeout, which fixes the soft-quorum time. With a round log, the
+   filter timeout is calibrated so that the simulated soft + cert
+   time-to-threshold matches its median round_duration_ms. Proposal timing
+   is not calibrated from the log (it has no proposal arrival times).
+4. The proposalTracker accepts a proposal only if it arrives before soft
+   quorum and beats the best priority seen so far; relays apply the same
+   filter, so non-improving proposals are never delivered. With several
+   peers, each relays its own improving sequence and the node sees the union.
+
+With a round log, --peers (unless given) is also fitted: the smallest peer
+count whose simulated mean reaches the observed mean proposals, keeping
+whichever of it and the one below is closer.
+
+Rounds are simulated in independent batches (optionally across processes) and
+the per-round observed-proposal counts are reported as a distribution, along
+with how many relayed proposals the quorum actually cut, the proposal
+bandwidth and the envelope count it implies in place of the NumProposers
+upper bound used in falcon_envelopes.md §9.2. Vote envelopes are the
+snapshot's expected unique soft + cert + next voters (sortition_cache.py).
+The bandwidth is labelled uncalibrated unless the simulated distribution is
+within MATCH_TV_DISTANCE (total variation) of an observed one.
+
+Calibrated against log1 (median round 2784 ms) the filter timeout comes out
+near 1.6 s, after practically every proposal has arrived, so the quorum cuts
+nothing. When fewer than CUTOFF_NEGLIGIBLE of relayed proposals are cut the
+report says the mechanism does not apply; the simulated count is then set by
+the improving-priority relay filter and the number of relaying peers.
+"""
+
+import csv
+import math
+import os
+import random
+from collections import Counter
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
+
+from consensus_logs import (DEFAULT_PROPOSAL_PEERS, DEFAULT_SOFT_DELAY_MS, ENVELOPE_BYTES, FILTER_TIMEOUT_MS,
+                            ROUNDS_PER_DAY)
+from derive_voters import ConsensusParams, load_stakes, sample_weight, selection_table
+from sortition_cache import theoretical_vote_messages
+
+# Proposal propagation delay to the node: base + exponential tail
+PROPOSAL_BASE_MS = 80.0
+PROPOSAL_SPREAD_MS = 250.0
+
+# Below this fraction of relayed proposals cut, the quorum cutoff is reported as not applying
+CUTOFF_NEGLIGIBLE = 0.01
+# Rounds simulated to calibrate the filter timeout against round_duration_ms
+CALIBRATION_ROUNDS = 300
+# Rounds simulated per candidate when fitting --peers to an observed log
+FIT_ROUNDS = 1000
+MAX_FIT_PEERS = 16
+# Simulated and observed proposal distributions further apart than this
+# (total variation distance) leave the bandwidth estimate uncalibrated
+MATCH_TV_DISTANCE = 0.1
+
+BATCH_SIZE = 500
+
+# Wire size (consensus_traffic.md Part V, falcon_envelopes.md §9.2)
+PROPOSAL_WIRE_BYTES = 1200
+
+
+def draw_committee(table: List[Tuple[float, float]], tau_over_W: float) -> List[int]:
+    """Return the weights of the selected members of one committee draw."""
+    weights = []
+    for stake, p_sel in table:
+        if random.random() < p_sel:
+            weights.append(sample_weight(stake, tau_over_W))
+    return weights
+
+
+def time_to_threshold(weights: List[int], threshold: int, model) -> float:
+    """Delay (ms from the start of the step) at which cumulative weight reaches threshold."""
+    if model is None:
+        arrivals = sorted((random.expovariate(1.0 / DEFAULT_SOFT_DELAY_MS), w) for w in weights)
+    else:
+        arrivals = sorted((model.sample_delay(w), w) for w in weights)
+    cumulative = 0
+    for delay, w in arrivals:
+        cumulative += w
+        if cumulative >= threshold:
+            return delay
+    return math.inf
+
+
+def proposal_delay() -> float:
+    """Propagation delay (ms) of one proposal to the node."""
+    return PROPOSAL_BASE_MS + random.expovariate(1.0 / PROPOSAL_SPREAD_MS)
+
+
+def relayed_proposals(proposer_weights: List[int], t_quorum: float, peers: int = 1) -> Tuple[int, int]:
+    """
+    Count distinct proposals delivered to the node, as (before soft quorum,
+    without the quorum cutoff) from the same arrival draw. Each peer forwards
+    a proposal only if it improves on the best priority that peer has seen.
+    """
+    # Lowest of w uniform credential hashes
+    priorities = [1.0 - (1.0 - random.random()) ** (1.0 / w) for w in proposer_weights]
+
+    seen = set()
+    uncut = set()
+    for _ in range(peers):
+        arrivals = sorted((proposal_delay(), i) for i in range(len(proposer_weights)))
+        best = math.inf
+        for arrival, i in arrivals:
+            if priorities[i] < best:
+                best = priorities[i]
+                uncut.add(i)
+                if arrival < t_quorum:
+                    seen.add(i)
+    return len(seen), len(uncut)
+
+
+def observed_proposals(proposer_weights: List[int], t_quorum: float, peers: int = 1) -> int:
+    """Count distinct proposals delivered before soft quorum (see relayed_proposals)."""
+    return relayed_proposals(proposer_weights, t_quorum, peers)[0]
+
+
+# Selection tables and arrival models built by _init_worker; simulate_batch reads them here
+_state = {}
+
+
+def _init_worker(stakes, total_stake, arrival_model_file, peers, filter_timeout_ms=FILTER_TIMEOUT_MS):
+    params = ConsensusParams()
+    soft_model = cert_model = None
+    if arrival_model_file:
+        from arrival_model import ArrivalModel
+        arrival = ArrivalModel.load(arrival_model_file)
+        soft_model = arrival.for_step(1)
+        cert_model = arrival.for_step(2)
+    proposer_tau = params.num_proposers / total_stake
+    soft_tau = params.soft_committee_size / total_stake
+    cert_tau = params.cert_committee_size / total_stake
+    _state.update(
+        proposer_table=selection_table(stakes, proposer_tau),
+        proposer_tau=proposer_tau,
+        soft_table=selection_table(stakes, soft_tau),
+        soft_tau=soft_tau,
+        soft_threshold=params.soft_threshold,
+        soft_model=soft_model,
+        cert_table=selection_table(stakes, cert_tau),
+        cert_tau=cert_tau,
+        cert_threshold=params.cert_threshold,
+        cert_model=cert_model,
+        filter_timeout_ms=filter_timeout_ms,
+        peers=peers,
+    )
+
+
+def calibrate_filter_timeout(median_duration_ms: float, rounds: int = CALIBRATION_ROUNDS) -> float:
+    """
+    Filter timeout (ms) that makes filter + soft + cert time-to-threshold match
+    an observed median round duration, using the current process's _state.
+    """
+    s = _state
+    steps = []
+    for _ in range(rounds):
+        soft = draw_committee(s['soft_table'], s['soft_tau'])
+        cert = draw_committee(s['cert_table'], s['cert_tau'])
+        steps.append(time_to_threshold(soft, s['soft_threshold'], s['soft_model'])
+                     + time_to_threshold(cert, s['cert_threshold'], s['cert_model']))
+    steps.sort()
+    return max(0.0, median_duration_ms - steps[len(steps) // 2])
+
+
+def simulate_batch(args) -> Tuple[Counter, int, int, int, List[float]]:
+    """
+    Simulate one batch of rounds; returns (Counter of observed proposals,
+    proposers drawn, proposals cut by the quorum, rounds with any cut,
+    soft-quorum times in ms).
+    """
+    seed, rounds = args
+    random.seed(seed)
+    s = _state
+    counts = Counter()
+    proposers_drawn = 0
+    cut = 0
+    rounds_cut = 0
+    quorum_times = []
+    for _ in range(rounds):
+        proposers = draw_committee(s['proposer_table'], s['proposer_tau'])
+        soft = draw_committee(s['soft_table'], s['soft_tau'])
+        t_quorum = s['filter_timeout_ms'] + time_to_threshold(soft, s['soft_threshold'], s['soft_model'])
+        seen, uncut = relayed_proposals(proposers, t_quorum, s['peers'])
+        counts[seen] += 1
+        proposers_drawn += len(proposers)
+        cut += uncut - seen
+        rounds_cut += uncut > seen
+        quorum_times.append(t_quorum)
+    return counts, proposers_drawn, cut, rounds_cut, quorum_times
+
+
+def simulate_rounds(
+    stakes: List[float],
+    total_stake: float,
+    rounds: int,
+    arrival_model_file: Optional[str] = None,
+    peers: int = DEFAULT_PROPOSAL_PEERS,
+    workers: Optional[int] = None,
+    seed: int = 1,
+    filter_timeout_ms: float = FILTER_TIMEOUT_MS
+) -> Tuple[Counter, float, float, float, List[float]]:
+    """
+    Simulate `rounds` rounds in batches of BATCH_SIZE. Returns (Counter of
+    observed proposals per round, mean proposers selected, mean proposals cut
+    by the quorum per round, fraction of rounds with any cut, sorted
+    soft-quorum times in ms).
+    """
+    batches = []
+    remaining = rounds
+    i = 0
+    while remaining > 0:
+        n = min(BATCH_SIZE, remaining)
+        batches.append((seed * 1000003 + i, n))
+        remaining -= n
+        i += 1
+
+    workers = workers or os.cpu_count() or 1
+    init_args = (stakes, total_stake, arrival_model_file, peers, filter_timeout_ms)
+    if workers == 1:
+        _init_worker(*init_args)
+        results = map(simulate_batch, batches)
+    else:
+        pool = Pool(workers, initializer=_init_worker, initargs=init_args)
+        results = pool.imap_unordered(simulate_batch, batches)
+
+    total = Counter()
+    proposers = 0
+    cut = 0
+    rounds_cut = 0
+    quorum_times = []
+    for done, (counts, drawn, batch_cut, batch_rounds_cut, batch_quorum) in enumerate(results, 1):
+        total.update(counts)
+        proposers += drawn
+        cut += batch_cut
+        rounds_cut += batch_rounds_cut
+        quorum_times.extend(batch_quorum)
+        if done % 10 == 0:
+            print(f"  Batch {done}/{len(batches)}...")
+    if workers != 1:
+        pool.close()
+        pool.join()
+    quorum_times.sort()
+    return total, proposers / rounds, cut / rounds, rounds_cut / rounds, quorum_times
+
+
+def proposal_arrival_quantile(q: float, samples: int = 20000) -> float:
+    """Quantile of a single proposal's arrival delay (ms), by sampling."""
+    delays = sorted(proposal_delay() for _ in range(samples))
+    return delays[min(int(q * samples), samples - 1)]
+
+
+def fit_peers(
+    stakes: List[float],
+    total_stake: float,
+    observed_mean: float,
+    arrival_model_file: Optional[str],
+    filter_timeout_ms: float,
+    workers: Optional[int],
+    seed: int
+) -> Tuple[int, float]:
+    """
+    Relaying peer count whose simulated mean proposals per round is closest to
+    observed_mean (the mean grows with peers, so the search stops once it is
+    reached). Returns (peers, simulated mean).
+    """
+    best = None
+    for peers in range(1, MAX_FIT_PEERS + 1):
+        counts, _, _, _, _ = simulate_rounds(stakes, total_stake, FIT_ROUNDS, arrival_model_file, peers,
+                                             workers, seed, filter_timeout_ms)
+        mean = summarize(counts)[1]
+        if best is None or abs(mean - observed_mean) < abs(best[1] - observed_mean):
+            best = (peers, mean)
+        if mean >= observed_mean:
+            break
+    return best
+
+
+def tv_distance(a: Counter, b: Counter) -> float:
+    """Total variation distance between two value -> count distributions."""
+    n_a = sum(a.values())
+    n_b = sum(b.values())
+    return 0.5 * sum(abs(a.get(k, 0) / n_a - b.get(k, 0) / n_b) for k in set(a) | set(b))
+
+
+def load_observed(rounds_file: str) -> Tuple[Counter, List[int]]:
+    """Distribution of the proposals column in a round log, and its round durations (ms)."""
+    counts = Counter()
+    durations = []
+    with open(rounds_file, 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            counts[int(row['proposals'])] += 1
+            if row.get('round_duration_ms'):
+                durations.append(int(row['round_duration_ms']))
+    return counts, durations
+
+
+def summarize(counts: Counter):
+    """Return (n, mean, p10, p50, p90) for a value -> count distribution."""
+    n = sum(counts.values())
+    mean = sum(k * c for k, c in counts.items()) / n
+    quantiles = []
+    for q in (0.1, 0.5, 0.9):
+        running = 0
+        for k in sorted(counts):
+            running += counts[k]
+            if running >= q * n:
+                quantiles.append(k)
+                break
+    return (n, mean, *quantiles)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate proposals observed per round under soft-quorum cutoff")
+    parser.add_argument("stake_file", help="stake snapshot CSV")
+    parser.add_argument("--rounds", type=int, default=10000, help="rounds to simulate")
+    parser.add_argument("--peers", type=int, default=None,
+                        help=f"peers relaying proposals to the node (default: fitted to --observed, "
+                             f"else {DEFAULT_PROPOSAL_PEERS})")
+    parser.add_argument("--arrival-model", help="fitted arrival model from arrival_model.py (vote delays only; "
+                                                "proposals use their own propagation model)")
+    parser.add_argument("--observed", help="round log (consensus_messages.csv) to compare against and "
+                                           "calibrate the filter timeout from")
+    parser.add_argument("--filter-timeout", type=float, default=None,
+                        help=f"filter timeout in ms (default: calibrated from --observed, else {FILTER_TIMEOUT_MS:.0f})")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all CPUs)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"Loading stakes from: {args.stake_file}")
+    stakes, total_stake = load_stakes(args.stake_file)
+
+    observed, durations = load_observed(args.observed) if args.observed else (None, [])
+    filter_timeout = args.filter_timeout
+    if filter_timeout is None and durations:
+        durations.sort()
+        median_duration = durations[len(durations) // 2]
+        random.seed(args.seed)
+        _init_worker(stakes, total_stake, args.arrival_model, DEFAULT_PROPOSAL_PEERS)
+        filter_timeout = calibrate_filter_timeout(median_duration)
+        print(f"Calibrated filter timeout: {filter_timeout:.0f} ms "
+              f"(median round duration {median_duration} ms, {CALIBRATION_ROUNDS} pilot rounds)")
+    elif filter_timeout is None:
+        filter_timeout = FILTER_TIMEOUT_MS
+
+    peers = args.peers
+    if peers is None and observed:
+        obs_mean = summarize(observed)[1]
+        peers, fit_mean = fit_peers(stakes, total_stake, obs_mean, args.arrival_model, filter_timeout,
+                                    args.workers, args.seed)
+        print(f"Fitted relaying peers: {peers} (simulated mean {fit_mean:.2f} vs observed {obs_mean:.2f}, "
+              f"{FIT_ROUNDS} rounds per candidate)")
+    elif peers is None:
+        peers = DEFAULT_PROPOSAL_PEERS
+
+    print(f"Simulating {args.rounds} rounds with {peers} peer(s) (batches of {BATCH_SIZE})...")
+    simulated, mean_proposers, mean_cut, frac_cut, quorum_times = simulate_rounds(
+        stakes, total_stake, args.rounds, args.arrival_model, peers, args.workers, args.seed,
+        filter_timeout
+    )
+    print(f"\n{'='*60}")
+    print("OBSERVED PROPOSALS PER ROUND")
+    print(f"{'='*60}")
+    print(f"Proposers selected (mean): {mean_proposers:.1f}")
+    print(f"\n{'Proposals':<10} {'Simulated':>10}" + (f" {'Observed':>10}" if observed else ""))
+    print("-" * (21 + (11 if observed else 0)))
+    keys = set(simulated) | (set(observed) if observed else set())
+    sim_n = sum(simulated.values())
+    obs_n = sum(observed.values()) if observed else 0
+    for k in sorted(keys):
+        line = f"{k:<10} {simulated.get(k, 0) / sim_n * 100:>9.1f}%"
+        if observed:
+            line += f" {observed.get(k, 0) / obs_n * 100:>9.1f}%"
+        print(line)
+
+    _, sim_mean, sim_p10, sim_p50, sim_p90 = summarize(simulated)
+    print(f"\nSimulated: mean {sim_mean:.2f}, p10 {sim_p10}, p50 {sim_p50}, p90 {sim_p90}")
+    distance = None
+    if observed:
+        _, obs_mean, obs_p10, obs_p50, obs_p90 = summarize(observed)
+        print(f"Observed:  mean {obs_mean:.2f}, p10 {obs_p10}, p50 {obs_p50}, p90 {obs_p90}")
+        distance = tv_distance(simulated, observed)
+        print(f"Total variation distance: {distance:.3f} "
+              f"({'matches' if distance <= MATCH_TV_DISTANCE else 'does not match'} at {MATCH_TV_DISTANCE})")
+
+    print(f"\n{'='*60}")
+    print("QUORUM CUTOFF")
+    print(f"{'='*60}")
+    relayed = sim_mean + mean_cut
+    q10, q50 = (quorum_times[int(q * len(quorum_times))] for q in (0.1, 0.5))
+    random.seed(args.seed)
+    arrival_p99 = proposal_arrival_quantile(0.99)
+    print(f"Filter timeout:            {filter_timeout:.0f} ms")
+    print(f"Soft quorum:               p10 {q10:.0f} ms, p50 {q50:.0f} ms")
+    print(f"Proposal arrival p99:      {arrival_p99:.0f} ms")
+    print(f"Relayed without cutoff:    {relayed:.2f} proposals/round")
+    print(f"Delivered before quorum:   {sim_mean:.2f} proposals/round")
+    print(f"Cut by the quorum:         {mean_cut:.2f} proposals/round "
+          f"({frac_cut:.1%} of rounds lose at least one)")
+    if mean_cut < CUTOFF_NEGLIGIBLE * relayed:
+        print(f"\nThe quorum cutoff does not apply at this timing: soft quorum falls after "
+              f"practically every proposal has arrived.\nThe simulated count is set by the "
+              f"improving-priority relay filter with {peers} relaying peer(s)"
+              + (", fitted to the observed mean." if observed and args.peers is None else "."))
+
+    calibrated = distance is not None and distance <= MATCH_TV_DISTANCE
+    print(f"\n{'='*60}")
+    print("PROPOSAL BANDWIDTH" + ("" if calibrated else " (UNCALIBRATED)"))
+    print(f"{'='*60}")
+    if not calibrated:
+        reason = ("no --observed log to check against" if distance is None else
+                  f"simulated proposals differ from the observed log, TV distance {distance:.3f}")
+        print(f"Uncalibrated: {reason}; the figures below use the simulated mean {sim_mean:.2f}.")
+    num_proposers = ConsensusParams().num_proposers
+    kb_round = sim_mean * PROPOSAL_WIRE_BYTES / 1000
+    print(f"Proposal traffic: {kb_round:.1f} KB/round "
+          f"(vs {num_proposers * PROPOSAL_WIRE_BYTES / 1000:.1f} KB at {num_proposers} proposals)")
+    vote_envelopes = theoretical_vote_messages(args.stake_file)
+    envelopes = vote_envelopes + sim_mean
+    upper = vote_envelopes + num_proposers
+    print(f"Envelopes/round:  {envelopes:,.1f} (vs {upper:,.1f} with {num_proposers} proposals; "
+          f"{vote_envelopes:,.1f} expected unique voters)")
+    print(f"Envelope traffic: {envelopes * ENVELOPE_BYTES * ROUNDS_PER_DAY / 1e9:.1f} GB/day "
+          f"(vs {upper * ENVELOPE_BYTES * ROUNDS_PER_DAY / 1e9:.1f} GB/day) at {ENVELOPE_BYTES / 1000} KB/envelope")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,22 @@
 """
 Quantify the mathematical impact of whale stake concentration on cert votes.
 Extended analysis comparing to theoretical expectations.
+
+Usage: quantify_whale_impact.py [votes_detail.csv] [stake_snapshot.csv]
 """
 
 import csv
+import os
 from collections import defaultdict
 import statistics
 import math
 
+from consensus_logs import DEFAULT_STAKE_FILE
+from metrics import count, init_from_env, stage
+
 CERT_THRESHOLD = 1112
 CERT_COMMITTEE_SIZE = 1500
-THEORETICAL_UNIQUE_VOTERS = 233  # From derive_voters.py
+THEORETICAL_UNIQUE_VOTERS = 233  # Fallback; main() reads the current value from sortition_cache
 
 def load_votes_by_round(votes_file):
     """Load cert votes grouped by round."""
@@ -29,6 +35,8 @@ def load_votes_by_round(votes_file):
             sender = row['sender']
             rounds[rnd].append({'sender': sender, 'weight': weight})
 
+        count('rows_parsed', reader.line_num - 1)
+
     return rounds
 
 
@@ -78,20 +86,75 @@ def gini_coefficient(weights):
     return cumsum / (n * sum(sorted_weights)) if sum(sorted_weights) > 0 else 0
 
 
+def stake_file_arg(argv):
+    """
+    Stake snapshot from argv[2], else DEFAULT_STAKE_FILE. A snapshot named on the
+    command line must exist; only the default may be missing (fallback voters).
+    """
+    if len(argv) <= 2:
+        return DEFAULT_STAKE_FILE
+    if not os.path.exists(argv[2]):
+        raise SystemExit(f"Error: stake snapshot not found: {argv[2]}")
+    return argv[2]
+
+
+def theoretical_voters(stake_file, fallback=THEORETICAL_UNIQUE_VOTERS, committee_size=CERT_COMMITTEE_SIZE):
+    """
+    Expected unique voters for a committee (cert by default) and stake
+    snapshot; the fallback only when the default snapshot is absent.
+    """
+    if stake_file == DEFAULT_STAKE_FILE and not os.path.exists(stake_file):
+        return fallback
+    from sortition_cache import theoretical_unique_voters
+    return round(theoretical_unique_voters(stake_file, committee_size))
+
+
+def summarize_cert(rounds, theoretical):
+    """
+    Mean cert statistics over the rounds reaching threshold (for cross-step
+    comparisons), or None if no round reaches it.
+    """
+    results = [r for r in map(analyze_round, rounds.values()) if r]
+    if not results:
+        return None
+    mean_actual = statistics.mean(r['actual_voters'] for r in results)
+    mean_total = statistics.mean(r['total_voters'] for r in results)
+    return {
+        'rounds': len(results),
+        'theoretical': theoretical,
+        'mean_total': mean_total,
+        'mean_actual': mean_actual,
+        'uniform_threshold_voters': CERT_THRESHOLD / (CERT_COMMITTEE_SIZE / theoretical),
+        'gini': gini_coefficient([w for r in results for w in r['weights']]),
+    }
+
+
 def main():
+    import sys
+    global THEORETICAL_UNIQUE_VOTERS
+    init_from_env('quantify_whale_impact')
+
     votes_file = "/home/thong/algofun/pq/traffic/logs/log5/consensus_votes_detail.csv"
+    if len(sys.argv) > 1:
+        votes_file = sys.argv[1]
+    stake_file = stake_file_arg(sys.argv)
+
+    THEORETICAL_UNIQUE_VOTERS = theoretical_voters(stake_file)
 
     print("Loading cert votes...")
-    rounds = load_votes_by_round(votes_file)
+    with stage('parse'):
+        rounds = load_votes_by_round(votes_file)
 
     results = []
     all_weights = []
 
-    for rnd, votes in rounds.items():
-        r = analyze_round(votes)
-        if r:
-            results.append(r)
-            all_weights.extend(r['weights'])
+    with stage('analyze'):
+        for rnd, votes in rounds.items():
+            r = analyze_round(votes)
+            if r:
+                results.append(r)
+                all_weights.extend(r['weights'])
+    count('rounds_analyzed', len(results))
 
     # Aggregate
     actual_voters = [r['actual_voters'] for r in results]
@@ -105,7 +168,8 @@ def main():
     mean_total = statistics.mean(total_voters)
     mean_weight = statistics.mean(avg_weights)
     mean_total_weight = statistics.mean(total_weights)
-    gini = gini_coefficient(all_weights)
+    with stage('gini'):
+        gini = gini_coefficient(all_weights)
 
     print("\n" + "=" * 80)
     print("WHALE IMPACT ON CERT VOTES: QUANTIFIED")
@@ -127,17 +191,17 @@ Gini coefficient:           {gini:.3f} (high inequality)
 """)
 
     print("=" * 80)
-    print("DECOMPOSING THE GAP: 233 theoretical → 144 observed")
+    print(f"DECOMPOSING THE GAP: {THEORETICAL_UNIQUE_VOTERS} theoretical → {mean_total:.0f} observed")
     print("=" * 80)
 
-    # The gap from 233 to 144 comes from two factors:
-    # 1. Threshold termination (stops at 1112 instead of collecting all votes)
+    # The gap from theoretical to observed voters comes from two factors:
+    # 1. Threshold termination (stops at CERT_THRESHOLD instead of collecting all votes)
     # 2. Whale ordering (whales vote first, reaching threshold faster)
 
     # Factor 1: Threshold termination effect
-    # If all 233 theoretical voters voted and we had uniform stake:
-    # Expected weight per voter = committee_size / theoretical_voters = 1500/233 = 6.44
-    # To reach 1112 threshold: 1112 / 6.44 = 172.7 voters
+    # If all theoretical voters voted and we had uniform stake:
+    # Expected weight per voter = CERT_COMMITTEE_SIZE / THEORETICAL_UNIQUE_VOTERS
+    # To reach threshold: CERT_THRESHOLD / that weight voters
 
     theoretical_weight_per_voter = CERT_COMMITTEE_SIZE / THEORETICAL_UNIQUE_VOTERS
 
@@ -145,7 +209,7 @@ Gini coefficient:           {gini:.3f} (high inequality)
     uniform_threshold_voters = CERT_THRESHOLD / theoretical_weight_per_voter
 
     # Factor 2: Actual whale distribution
-    # Observed avg weight is higher (7.96) because small accounts don't make it
+    # Observed avg weight is higher because small accounts don't make it
     # And whales voting first means even fewer needed
 
     print(f"""
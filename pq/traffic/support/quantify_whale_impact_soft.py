@@ -1,25 +1,38 @@
 #!/usr/bin/env python3
 """
 Quantify the mathematical impact of whale stake concentration on SOFT votes.
-Extended analysis comparing to theoretical expectations.
+Extended analysis comparing to theoretical expectations, with the cert
+figures from quantify_whale_impact.py alongside for the same log.
+
+Usage: quantify_whale_impact_soft.py [votes_detail.csv] [stake_snapshot.csv]
 """
 
 import csv
 from collections import defaultdict
 import statistics
 
+import quantify_whale_impact as cert_impact
+from metrics import count, init_from_env, stage
+
 SOFT_THRESHOLD = 2267
 SOFT_COMMITTEE_SIZE = 2990
-THEORETICAL_UNIQUE_VOTERS = 354  # From derive_voters.py
+THEORETICAL_UNIQUE_VOTERS = 354  # Fallback; main() reads the current value from sortition_cache
 
-def load_votes_by_round(votes_file):
-    """Load soft votes grouped by round."""
+def load_votes_by_round(votes_file, cert_rounds=None):
+    """
+    Load soft votes grouped by round. If cert_rounds is given, cert votes are
+    collected into it in the same pass, in quantify_whale_impact's format.
+    """
     rounds = defaultdict(list)
 
     with open(votes_file, 'r') as f:
         reader = csv.DictReader(f)
         for row in reader:
             step = int(row['step'])
+            if step == 2 and cert_rounds is not None:
+                cert_rounds[int(row['round'])].append({'sender': row['sender'],
+                                                       'weight': int(row['credential_weight'])})
+                continue
             if step != 1:  # Only soft votes
                 continue
 
@@ -35,6 +48,8 @@ def load_votes_by_round(votes_file):
                 'is_late': is_late
             })
 
+        count('rows_parsed', reader.line_num - 1)
+
     return rounds
 
 
@@ -104,19 +119,33 @@ def gini_coefficient(weights):
 
 
 def main():
+    import sys
+    global THEORETICAL_UNIQUE_VOTERS
+    init_from_env('quantify_whale_impact_soft')
+
     votes_file = "/home/thong/algofun/pq/traffic/logs/log5/consensus_votes_detail.csv"
+    if len(sys.argv) > 1:
+        votes_file = sys.argv[1]
+    stake_file = cert_impact.stake_file_arg(sys.argv)
 
-    print("Loading soft votes...")
-    rounds = load_votes_by_round(votes_file)
+    THEORETICAL_UNIQUE_VOTERS = cert_impact.theoretical_voters(stake_file, THEORETICAL_UNIQUE_VOTERS,
+                                                               SOFT_COMMITTEE_SIZE)
+
+    print("Loading soft and cert votes...")
+    cert_rounds = defaultdict(list)
+    with stage('parse'):
+        rounds = load_votes_by_round(votes_file, cert_rounds)
 
     results = []
     all_weights = []
 
-    for rnd, votes in rounds.items():
-        r = analyze_round(votes)
-        if r:
-            results.append(r)
-            all_weights.extend(r['weights'])
+    with stage('analyze'):
+        for rnd, votes in rounds.items():
+            r = analyze_round(votes)
+            if r:
+                results.append(r)
+                all_weights.extend(r['weights'])
+    count('rounds_analyzed', len(results))
 
     # Aggregate
     actual_voters = [r['actual_voters'] for r in results]
@@ -136,7 +165,8 @@ def main():
     mean_late = statistics.mean(late_voters)
     mean_weight = statistics.mean(avg_weights)
     mean_total_weight = statistics.mean(total_weights)
-    gini = gini_coefficient(all_weights)
+    with stage('gini'):
+        gini = gini_coefficient(all_weights)
 
     print("\n" + "=" * 80)
     print("WHALE IMPACT ON SOFT VOTES: QUANTIFIED")
@@ -160,7 +190,7 @@ Gini coefficient:           {gini:.3f}
 """)
 
     print("=" * 80)
-    print("DECOMPOSING THE GAP: 354 theoretical → 303 observed")
+    print(f"DECOMPOSING THE GAP: {THEORETICAL_UNIQUE_VOTERS} theoretical → {mean_total:.0f} observed")
     print("=" * 80)
 
     theoretical_weight_per_voter = SOFT_COMMITTEE_SIZE / THEORETICAL_UNIQUE_VOTERS
@@ -255,23 +285,30 @@ Percentage impact:
   (1 - ρ) × 100 = {(1 - mean_actual/uniform_threshold_voters)*100:.1f}%
 """)
 
-    # Compare to cert
-    print("=" * 80)
-    print("COMPARISON: SOFT vs CERT")
-    print("=" * 80)
-    print(f"""
+    # Compare to cert, from the same votes and stake snapshot
+    with stage('cert'):
+        cert = cert_impact.summarize_cert(cert_rounds, cert_impact.theoretical_voters(stake_file))
+    if cert is None:
+        print("No cert round reaches threshold in this log; skipping the soft vs cert comparison.\n")
+    else:
+        cert_uniform = cert['uniform_threshold_voters']
+
+        print("=" * 80)
+        print("COMPARISON: SOFT vs CERT")
+        print("=" * 80)
+        print(f"""
                                     Soft        Cert
-Theoretical voters:                  354         233
-Observed voters:                   {mean_total:.0f}         144
-Ratio (observed/theory):          {mean_total/THEORETICAL_UNIQUE_VOTERS:.2f}x       0.62x
+Theoretical voters:                  {THEORETICAL_UNIQUE_VOTERS}         {cert['theoretical']}
+Observed voters:                   {mean_total:.0f}         {cert['mean_total']:.0f}
+Ratio (observed/theory):          {mean_total/THEORETICAL_UNIQUE_VOTERS:.2f}x       {cert['mean_total']/cert['theoretical']:.2f}x
 
-Voters to threshold (whale-first): {mean_actual:.0f}         131
-Uniform baseline:                  {uniform_threshold_voters:.0f}         173
-Whale reduction:                   {(1 - mean_actual/uniform_threshold_voters)*100:.1f}%       24.4%
+Voters to threshold (whale-first): {mean_actual:.0f}         {cert['mean_actual']:.0f}
+Uniform baseline:                  {uniform_threshold_voters:.0f}         {cert_uniform:.0f}
+Whale reduction:                   {(1 - mean_actual/uniform_threshold_voters)*100:.1f}%       {(1 - cert['mean_actual']/cert_uniform)*100:.1f}%
 
-Gini coefficient:                  {gini:.3f}       0.711
+Gini coefficient:                  {gini:.3f}       {cert['gini']:.3f}
 
-Overshoot (late arrivals):         {mean_total - mean_actual:.0f}          13
+Overshoot (late arrivals):         {mean_total - mean_actual:.0f}          {cert['mean_total'] - cert['mean_actual']:.0f}
 """)
 
     # Validation
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Round index over several capture directories, for querying them as one log.
+
+Captures live in separate directories (logs/log1, log2, log5, the dated files
+in support/), their round ranges overlap, and consensus_messages.csv has gone
+through six headers (V1-V5 in consensus_logging.patch / go-algorand-diff.txt,
+then the current one). `build` scans every CSV under the given directories
+once and records per file:
+
+    schema        matched by header; a header that extends a known one
+                  (e.g. log1's *_with_vote_details.csv) uses the known prefix
+    runs          stretches of rounds that only step back by late votes
+                  (at most ROUND_LOOKBACK behind the newest round; a restarted
+                  node jumps further back and appends a new run), each with
+                  byte range, round range and a checkpoint (round, byte offset)
+                  every CHECKPOINT_BYTES, always at the first row of a new
+                  newest round
+    timestamps    for consensus_votes_detail.csv, the vote arrival time at
+                  each checkpoint and the run's first/last arrival, used to
+                  turn a time window into rounds
+
+Queries seek to the checkpoint before the first requested round in each
+overlapping run and read only up to ROUND_LOOKBACK rounds past the last one,
+so late rows logged after later rounds started are kept. Rows come back in
+round order, normalized to the current header of their kind (missing columns
+are empty, dropped ones such as V4's obsolete_votes are omitted), and each
+round is taken from a single file: the one with the newest schema, then the
+first in index order. Runs of the same file are never deduplicated against
+each other.
+
+A round's start time is the arrival of its earliest logged vote; the logger
+stamps every vote (consensus_votes_detail.csv), so time windows are resolved
+from those captures only.
+"""
+
+import bisect
+import heapq
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from consensus_logs import (
+    DEBUG_HEADER, DETAILS_HEADER, MESSAGES_HEADER, MESSAGES_HEADER_V1, MESSAGES_HEADER_V2, MESSAGES_HEADER_V3,
+    MESSAGES_HEADER_V4, MESSAGES_HEADER_V5, ROUND_LOOKBACK, VOTES_HEADER,
+)
+
+# schema -> (kind, rank within kind, header); the round is always column 0
+SCHEMAS = {
+    'messages_v1': ('messages', 1, MESSAGES_HEADER_V1),
+    'messages_v2': ('messages', 2, MESSAGES_HEADER_V2),
+    'messages_v3': ('messages', 3, MESSAGES_HEADER_V3),
+    'messages_v4': ('messages', 4, MESSAGES_HEADER_V4),
+    'messages_v5': ('messages', 5, MESSAGES_HEADER_V5),
+    'messages': ('messages', 6, MESSAGES_HEADER),
+    'votes': ('votes', 1, VOTES_HEADER),
+    'details': ('details', 1, DETAILS_HEADER),
+    'pipelined': ('pipelined', 1, DEBUG_HEADER),
+}
+# Normalized output header per kind
+KIND_HEADERS = {
+    'messages': MESSAGES_HEADER,
+    'votes': VOTES_HEADER,
+    'details': DETAILS_HEADER,
+    'pipelined': DEBUG_HEADER,
+}
+TIMESTAMP_COLUMN = 'timestamp_unix_ns'
+TIMED_KINDS = ('votes',)  # every row stamped with its arrival time
+
+INDEX_VERSION = 3
+DEFAULT_INDEX_FILE = 'round_index.json'
+CHECKPOINT_BYTES = 64 * 1024
+
+
+def match_schema(header: str) -> Optional[str]:
+    """Schema name for a header line: exact match, else the longest known prefix."""
+    best = None
+    for name, (_, _, known) in SCHEMAS.items():
+        if header == known:
+            return name
+        if header.startswith(known + ',') and (best is None or len(known) > len(SCHEMAS[best][2])):
+            best = name
+    return best
+
+
+def scan_file(path: str, schema: str) -> dict:
+    """Index one CSV: runs of rounds (late rows allowed) with byte-offset checkpoints."""
+    header = SCHEMAS[schema][2].split(',')
+    ts_col = header.index(TIMESTAMP_COLUMN) if SCHEMAS[schema][0] in TIMED_KINDS else None
+    runs = []
+    run = None
+    rows = 0
+    st = os.stat(path)
+
+    with open(path, 'rb') as f:
+        pos = len(f.readline())
+        last_cp = 0
+        for line in f:
+            start = pos
+            pos += len(line)
+            try:
+                comma = line.find(b',')
+                rnd = int(line[:comma] if comma >= 0 else line)
+                ts = int(line.split(b',')[ts_col]) if ts_col is not None else None
+            except (ValueError, IndexError):
+                continue  # blank or truncated line
+            rows += 1
+
+            # A late vote trails the newest round by at most ROUND_LOOKBACK;
+            # anything further back is a restarted node
+            new_run = run is None or rnd < run['last_round'] - ROUND_LOOKBACK
+            if new_run:
+                if run is not None:
+                    runs.append(run)
+                run = {'start': start, 'end': pos, 'first_round': rnd, 'last_round': rnd,
+                       'rows': 0, 'checkpoints': []}
+                last_cp = None
+            if (new_run or rnd > run['last_round']) and (last_cp is None or start - last_cp >= CHECKPOINT_BYTES):
+                run['checkpoints'].append([rnd, start] if ts is None else [rnd, start, ts])
+                last_cp = start
+            run['end'] = pos
+            run['first_round'] = min(run['first_round'], rnd)
+            run['last_round'] = max(run['last_round'], rnd)
+            run['rows'] += 1
+            if ts is not None:
+                run['first_ts'] = min(run.get('first_ts', ts), ts)
+                run['last_ts'] = max(run.get('last_ts', ts), ts)
+
+    if run is not None:
+        runs.append(run)
+    return {'schema': schema, 'size': st.st_size, 'mtime': st.st_mtime, 'rows': rows, 'runs': runs}
+
+
+def _read_rows(path: str, start: int, end: int) -> Iterator[Tuple[int, List[str]]]:
+    """(round, fields) for each parseable line in [start, end)."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        for line in f:
+            if pos >= end:
+                break
+            pos += len(line)
+            fields = line.decode().rstrip('\r\n').split(',')
+            try:
+                yield int(fields[0]), fields
+            except ValueError:
+                continue
+
+
+def _group_rounds(rows: Iterator[Tuple[int, List[str]]]) -> Iterator[Tuple[int, List[List[str]]]]:
+    """(round, rows) in round order; a round is complete once ROUND_LOOKBACK newer rounds started."""
+    pending = defaultdict(list)
+    newest = None
+    for rnd, fields in rows:
+        pending[rnd].append(fields)
+        if newest is None or rnd > newest:
+            newest = rnd
+            for done in sorted(r for r in pending if r < newest - ROUND_LOOKBACK):
+                yield done, pending.pop(done)
+    for rnd in sorted(pending):
+        yield rnd, pending[rnd]
+
+
+def parse_time(value: str) -> int:
+    """Unix seconds or an ISO 8601 time (UTC if no offset) -> unix nanoseconds."""
+    try:
+        return int(float(value) * 1e9)
+    except ValueError:
+        t = datetime.fromisoformat(value)
+        if t.tzinfo is None:
+            t = t.replace(tzinfo=timezone.utc)
+        return int(t.timestamp() * 1e9)
+
+
+class RoundIndex:
+    """Per-file schema, runs and checkpoints for every capture under a set of roots."""
+
+    def __init__(self, path: str = DEFAULT_INDEX_FILE):
+        self.path = path
+        self.roots: List[str] = []
+        self.files: Dict[str, dict] = {}  # path relative to the index file -> entry
+        self.skipped: List[str] = []
+
+    @property
+    def base(self) -> str:
+        return os.path.dirname(os.path.abspath(self.path))
+
+    def _abs(self, rel: str) -> str:
+        return os.path.normpath(os.path.join(self.base, rel))
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_FILE) -> 'RoundIndex':
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError(f"{path}: index version {data.get('version')}, expected {INDEX_VERSION}; rebuild it")
+        index = cls(path)
+        index.roots = data['roots']
+        index.files = data['files']
+        return index
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'roots': self.roots, 'files': self.files}, f, indent=1)
+
+    def build(self, roots: List[str]) -> Tuple[int, int]:
+        """Scan roots for CSV captures, reusing entries whose size and mtime are unchanged.
+
+        Returns (files scanned, files reused).
+        """
+        self.roots = [os.path.relpath(os.path.abspath(r), self.base) for r in roots]
+        old, self.files, self.skipped = self.files, {}, []
+        scanned = reused = 0
+        for root in self.roots:
+            for dirpath, dirnames, filenames in os.walk(self._abs(root)):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if not name.endswith('.csv'):
+                        continue
+                    full = os.path.join(dirpath, name)
+                    rel = os.path.relpath(full, self.base)
+                    if rel in self.files:
+                        continue  # overlapping roots
+                    st = os.stat(full)
+                    entry = old.get(rel)
+                    if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+                        self.files[rel] = entry
+                        reused += 1
+                        continue
+                    with open(full, 'r', errors='replace') as f:
+                        schema = match_schema(f.readline().rstrip('\r\n'))
+                    if schema is None:
+                        self.skipped.append(rel)
+                        continue
+                    self.files[rel] = scan_file(full, schema)
+                    scanned += 1
+        return scanned, reused
+
+    def refresh(self) -> bool:
+        """Rebuild over the same roots if any indexed file changed or disappeared."""
+        for rel, entry in self.files.items():
+            full = self._abs(rel)
+            if not os.path.exists(full):
+                break
+            st = os.stat(full)
+            if st.st_size != entry['size'] or st.st_mtime != entry['mtime']:
+                break
+        else:
+            return False
+        self.build([self._abs(r) for r in self.roots])
+        return True
+
+    def entries(self, kind: str) -> List[Tuple[str, dict]]:
+        return [(rel, e) for rel, e in self.files.items() if SCHEMAS[e['schema']][0] == kind]
+
+    def _round_starts(self, rel: str, col: int, start: int, end: int) -> Iterator[Tuple[int, int]]:
+        """(round, earliest vote arrival) for each round in a byte range of a timed capture."""
+        for rnd, rows in _group_rounds(_read_rows(self._abs(rel), start, end)):
+            arrivals = []
+            for fields in rows:
+                try:
+                    arrivals.append(int(fields[col]))
+                except (ValueError, IndexError):
+                    continue
+            if arrivals:
+                yield rnd, min(arrivals)
+
+    def _round_at(self, t_ns: int, after: bool) -> Optional[int]:
+        """First round starting at/after t_ns (after=True) or last one starting before it."""
+        found = []
+        for kind in TIMED_KINDS:
+            for rel, entry in self.entries(kind):
+                col = SCHEMAS[entry['schema']][2].split(',').index(TIMESTAMP_COLUMN)
+                for run in entry['runs']:
+                    if after and run['last_ts'] < t_ns or not after and run['first_ts'] >= t_ns:
+                        continue
+                    cps = run['checkpoints']
+                    # Arrivals are only roughly ordered by round, so start one
+                    # checkpoint early
+                    i = max(bisect.bisect_right([cp[2] for cp in cps], t_ns) - 2, 0)
+                    best = None
+                    for rnd, t_start in self._round_starts(rel, col, cps[i][1], run['end']):
+                        if after and t_start >= t_ns:
+                            best = rnd
+                            break
+                        if not after:
+                            if t_start >= t_ns:
+                                break
+                            best = rnd
+                    if best is not None:
+                        found.append(best)
+        if not found:
+            return None
+        return min(found) if after else max(found)
+
+    def window_rounds(self, since_ns: int, until_ns: int) -> Optional[Tuple[int, int]]:
+        """Rounds that started in [since_ns, until_ns), from the timestamped captures."""
+        if not any(self.entries(kind) for kind in TIMED_KINDS):
+            raise ValueError("No timestamped captures (consensus_votes_detail.csv) in the index")
+        lo = self._round_at(since_ns, after=True)
+        hi = self._round_at(until_ns, after=False)
+        if lo is None or hi is None or lo > hi:
+            return None
+        return lo, hi
+
+    def _run_rounds(self, rel: str, entry: dict, run: dict, lo: int, hi: int,
+                    order: int, run_order: int) -> Iterator[tuple]:
+        """(round, -rank, file order, run order, normalized rows) for one run, grouped by round."""
+        kind, rank, header = SCHEMAS[entry['schema']]
+        columns = header.split(',')
+        mapping = [columns.index(c) if c in columns else None for c in KIND_HEADERS[kind].split(',')]
+        cps = run['checkpoints']
+        i = max(bisect.bisect_right([cp[0] for cp in cps], lo) - 1, 0)
+
+        def in_range():
+            for rnd, fields in _read_rows(self._abs(rel), cps[i][1], run['end']):
+                if rnd > hi + ROUND_LOOKBACK:
+                    break  # no late rows for hi can follow
+                if lo <= rnd <= hi:
+                    yield rnd, fields
+
+        for rnd, rows in _group_rounds(in_range()):
+            normalized = []
+            for fields in rows:
+                fields += [''] * (len(columns) - len(fields))
+                normalized.append([fields[j] if j is not None else '' for j in mapping])
+            yield rnd, -rank, order, run_order, normalized
+
+    def query(self, kind: str = 'messages', rounds: Optional[Tuple[int, int]] = None,
+              window: Optional[Tuple[int, int]] = None) -> Iterator[List[str]]:
+        """
+        Normalized rows of `kind` for an inclusive round range or a
+        [since, until) window in unix ns, in round order, one source per round.
+        """
+        if kind not in KIND_HEADERS:
+            raise ValueError(f"Unknown kind {kind!r}; expected one of {', '.join(KIND_HEADERS)}")
+        if window is not None:
+            rounds = self.window_rounds(*window)
+            if rounds is None:
+                return
+        lo, hi = rounds if rounds is not None else (0, float('inf'))
+
+        sources = []
+        for order, (rel, entry) in enumerate(self.entries(kind)):
+            for run_order, run in enumerate(entry['runs']):
+                if run['last_round'] >= lo and run['first_round'] <= hi:
+                    sources.append(self._run_rounds(rel, entry, run, lo, hi, order, run_order))
+
+        emitted = source = None
+        for rnd, _, order, _, rows in heapq.merge(*sources):
+            if rnd != emitted:
+                emitted, source = rnd, order
+            elif order != source:
+                continue  # round already taken from a higher-ranked file
+            yield from rows
+
+    def coverage(self, kind: str) -> List[Tuple[str, dict]]:
+        return sorted(self.entries(kind), key=lambda item: item[1]['runs'][0]['first_round']
+                      if item[1]['runs'] else 0)
+
+
+def main():
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Round index across capture directories")
+    parser.add_argument('--index', default=DEFAULT_INDEX_FILE, help="index file (default: %(default)s)")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_build = sub.add_parser('build', help="scan capture directories and write the index")
+    p_build.add_argument('roots', nargs='+', help="capture directories (searched recursively)")
+
+    sub.add_parser('info', help="print indexed files and round coverage")
+
+    p_query = sub.add_parser('query', help="print normalized rows as CSV")
+    p_query.add_argument('--kind', default='messages', choices=list(KIND_HEADERS))
+    p_query.add_argument('--rounds', help="LO:HI inclusive (either side may be empty)")
+    p_query.add_argument('--since', help="unix seconds or ISO 8601 time (UTC default)")
+    p_query.add_argument('--until', help="unix seconds or ISO 8601 time, exclusive")
+    p_query.add_argument('--out', help="write to file instead of stdout")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        index = RoundIndex.load(args.index) if os.path.exists(args.index) else RoundIndex(args.index)
+        t0 = time.perf_counter()
+        scanned, reused = index.build(args.roots)
+        index.save()
+        print(f"Indexed {len(index.files)} files ({scanned} scanned, {reused} unchanged) "
+              f"in {time.perf_counter() - t0:.2f}s -> {args.index}")
+        for rel in index.skipped:
+            print(f"  skipped (unknown header): {rel}")
+        return
+
+    index = RoundIndex.load(args.index)
+    if index.refresh():
+        index.save()
+
+    if args.command == 'info':
+        for kind in KIND_HEADERS:
+            entries = index.coverage(kind)
+            if not entries:
+                continue
+            print(f"\n{'='*60}")
+            print(f"{kind.upper()}")
+            print(f"{'='*60}")
+            print(f"{'File':<58} {'Schema':<12} {'Rows':>9} {'Runs':>5} {'First':>10} {'Last':>10}")
+            for rel, e in entries:
+                first = min((r['first_round'] for r in e['runs']), default=0)
+                last = max((r['last_round'] for r in e['runs']), default=0)
+                print(f"{rel[-58:]:<58} {e['schema']:<12} {e['rows']:>9} {len(e['runs']):>5} {first:>10} {last:>10}")
+        return
+
+    rounds = window = None
+    if args.rounds:
+        lo, _, hi = args.rounds.partition(':')
+        rounds = (int(lo) if lo else 0, int(hi) if hi else float('inf'))
+    if args.since or args.until:
+        if rounds is not None:
+            parser.error("--rounds and --since/--until are exclusive")
+        window = (parse_time(args.since) if args.since else 0,
+                  parse_time(args.until) if args.until else 2 ** 63 - 1)
+
+    out = open(args.out, 'w') if args.out else sys.stdout
+    t0 = time.perf_counter()
+    out.write(KIND_HEADERS[args.kind] + '\n')
+    n = 0
+    for row in index.query(args.kind, rounds, window):
+        out.write(','.join(row) + '\n')
+        n += 1
+    if args.out:
+        out.close()
+    print(f"{n} rows in {time.perf_counter() - t0:.3f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of per-snapshot sortition tables, keyed by content hash.
+
+derive_voters.py and the whale-impact scripts need per-account
+log(1 - tau/W) selection probabilities and the expected unique voters they
+imply. This cache computes them once per (snapshot content, committee
+parameters) and stores:
+
+    <cache_dir>/<key>/meta.json                 totals and expected unique voters
+    <cache_dir>/<key>/stakes.f64                per-account stake
+    <cache_dir>/<key>/p_selected_<tau>.f64      P(selected) per account
+    <cache_dir>/<key>/expected_weight_<tau>.f64 E[weight | selected] per account
+
+Arrays are raw native float64, opened with mmap, so a warm start only hashes
+the snapshot and reads meta.json. Entries are evicted least-recently-used
+(by meta.json mtime, refreshed on every hit) once the cache exceeds its size cap.
+"""
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import shutil
+import tempfile
+from array import array
+from typing import Dict, Optional
+
+from derive_voters import ConsensusParams, expected_weight_given_selected, load_stakes
+
+TABLE_VERSION = 1
+DEFAULT_CACHE_DIR = os.environ.get(
+    'ALGOFUN_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'algofun', 'sortition')
+)
+DEFAULT_SIZE_CAP = 256 * 1024 * 1024
+
+
+def cache_key(stake_file: str, params: ConsensusParams) -> str:
+    """Content hash of the snapshot plus committee parameters."""
+    h = hashlib.sha256()
+    with open(stake_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    h.update(json.dumps({'version': TABLE_VERSION, 'params': vars(params)}, sort_keys=True).encode())
+    return h.hexdigest()[:32]
+
+
+class SortitionTables:
+    """A cache entry: metadata plus lazily mmapped per-account arrays."""
+
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        self.meta = meta
+        self.total_stake: float = meta['total_stake']
+        self.accounts: int = meta['accounts']
+        self.expected_unique_voters: Dict[int, float] = {
+            int(tau): v for tau, v in meta['expected_unique_voters'].items()
+        }
+        self._maps = []
+
+    def array(self, name: str) -> memoryview:
+        """Return a float64 view of stakes, p_selected_<tau> or expected_weight_<tau>."""
+        with open(os.path.join(self.path, f"{name}.f64"), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b'').cast('d')
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mm)
+        return memoryview(mm).cast('d')
+
+
+def build_tables(stake_file: str, params: ConsensusParams, path: str) -> dict:
+    """Compute all tables for a snapshot into directory `path`; returns meta."""
+    stakes, total_stake = load_stakes(stake_file)
+    committees = sorted({params.soft_committee_size, params.cert_committee_size, params.next_committee_size})
+    with open(os.path.join(path, 'stakes.f64'), 'wb') as f:
+        array('d', stakes).tofile(f)
+
+    expected = {}
+    for tau in committees:
+        tau_over_W = tau / total_stake
+        log_not = math.log(1.0 - tau_over_W)
+        p_sel = array('d', (1.0 - math.exp(s * log_not) for s in stakes))
+        weights = array('d', (expected_weight_given_selected(s, tau_over_W) for s in stakes))
+        with open(os.path.join(path, f'p_selected_{tau}.f64'), 'wb') as f:
+            p_sel.tofile(f)
+        with open(os.path.join(path, f'expected_weight_{tau}.f64'), 'wb') as f:
+            weights.tofile(f)
+        expected[str(tau)] = math.fsum(p_sel)
+
+    meta = {
+        'version': TABLE_VERSION,
+        'stake_file': os.path.basename(stake_file),
+        'params': vars(params),
+        'accounts': len(stakes),
+        'total_stake': total_stake,
+        'expected_unique_voters': expected,
+    }
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    return meta
+
+
+def _entry_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def evict(cache_dir: str, size_cap: int, keep: Optional[str] = None):
+    """Remove least-recently-used entries until the cache fits in size_cap."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        meta = os.path.join(path, 'meta.json')
+        if os.path.isdir(path) and os.path.exists(meta):
+            entries.append((os.path.getmtime(meta), _entry_size(path), path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= size_cap:
+            break
+        if path == keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def get_tables(stake_file: str, params: Optional[ConsensusParams] = None,
+               cache_dir: str = DEFAULT_CACHE_DIR, size_cap: int = DEFAULT_SIZE_CAP) -> SortitionTables:
+    """Return cached sortition tables for a snapshot, building them on a miss."""
+    params = params or ConsensusParams()
+    key = cache_key(stake_file, params)
+    path = os.path.join(cache_dir, key)
+    meta_path = os.path.join(path, 'meta.json')
+
+    if os.path.exists(meta_path):
+        os.utime(meta_path)  # LRU touch
+        with open(meta_path, 'r') as f:
+            return SortitionTables(path, json.load(f))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f'.{key}.', dir=cache_dir)
+    try:
+        meta = build_tables(stake_file, params, tmp)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another process built the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    evict(cache_dir, size_cap, keep=path)
+    return SortitionTables(path, meta)
+
+
+def theoretical_unique_voters(stake_file: str, committee_size: int) -> float:
+    """Expected unique voters for a committee size, from the cache."""
+    params = ConsensusParams()
+    tables = get_tables(stake_file, params)
+    if committee_size not in tables.expected_unique_voters:
+        raise ValueError(f"Committee size {committee_size} not in consensus parameters")
+    return tables.expected_unique_voters[committee_size]
+
+
+def theoretical_vote_messages(stake_file: str) -> float:
+    """Expected unique soft + cert + next voters for a snapshot: vote messages per round, one each."""
+    params = ConsensusParams()
+    tables = get_tables(stake_file, params)
+    return sum(tables.expected_unique_voters[tau] for tau in
+               (params.soft_committee_size, params.cert_committee_size, params.next_committee_size))
+
+
+def theoretical_messages(stake_file: str) -> float:
+    """NumProposers proposals plus the vote messages: the per-round upper bound of falcon_envelopes.md §9.2."""
+    return ConsensusParams().num_proposers + theoretical_vote_messages(stake_file)
+
+
+def main():
+    import sys
+    import time
+
+    if len(sys.argv) < 2:
+        print("Usage: sortition_cache.py <stake_file.csv> [--print]")
+        sys.exit(1)
+
+    stake_file = sys.argv[1]
+    t0 = time.perf_counter()
+    tables = get_tables(stake_file)
+    elapsed = time.perf_counter() - t0
+    params = ConsensusParams()
+    soft = tables.expected_unique_voters[params.soft_committee_size]
+    cert = tables.expected_unique_voters[params.cert_committee_size]
+    nxt = tables.expected_unique_voters[params.next_committee_size]
+
+    if '--print' in sys.argv:
+        # Shell-friendly: soft cert next
+        print(f"{soft:.0f} {cert:.0f} {nxt:.0f}")
+        return
+
+    print(f"Snapshot:   {stake_file}")
+    print(f"Cache:      {tables.path}")
+    print(f"Accounts:   {tables.accounts}")
+    print(f"Total:      {tables.total_stake:,.2f} Algos")
+    print(f"Soft:       {soft:.1f} unique voters expected")
+    print(f"Cert:       {cert:.1f} unique voters expected")
+    print(f"Next:       {nxt:.1f} unique voters expected")
+    print(f"Lookup:     {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Track theoretical message volume across a series of stake snapshots incrementally.
+
+derive_voters.expected_unique_voters loops over every account for each
+committee size and each snapshot. Here the per-snapshot work is proportional
+to the number of changed accounts:
+
+    E[unique voters] = N - sum_i exp(-s_i * c),   c = -log(1 - tau / W)
+
+When total stake W moves, c moves for every account. Around a base point c0
+the sum is expanded as
+
+    sum_i exp(-s_i * c) = sum_k (-(c - c0))^k / k! * A_k,   A_k = sum_i s_i^k exp(-s_i * c0)
+
+so each committee keeps the power sums A_0..A_K, which are updated in O(1)
+per changed account. When c drifts more than REBASE_TOLERANCE from c0 the
+sums are rebuilt at the new c (one full pass, amortized over many snapshots).
+
+Per-account selection probabilities are evaluated lazily from the current c,
+and top-N stake concentration is maintained on a sorted stake list with
+running top-N sums. A snapshot diff itself is a dict comparison by address.
+
+Each changed account costs a sorted-list delete and insert plus SERIES_TERMS
+terms per committee, several times the per-account cost of a full build. So
+when more than FULL_REBUILD_FRACTION of accounts change (e.g. snapshots days
+apart, where 1481 of 1704 accounts moved and the incremental update took
+17.8 ms against 6.1 ms for a full build), the state is rebuilt from the new
+snapshot instead. The output reports which path each snapshot took.
+"""
+
+import bisect
+import math
+from typing import Dict, List, Tuple
+
+from derive_voters import ConsensusParams, expected_unique_voters, load_snapshot
+
+SERIES_TERMS = 16  # K: terms kept in the expansion around c0
+REBASE_TOLERANCE = 0.02  # rebuild power sums when |c / c0 - 1| exceeds this
+FULL_REBUILD_FRACTION = 0.4  # full build beats incremental above ~40% changed (1704-account snapshot)
+TOP_N = (10, 20, 30, 50)
+
+
+def diff_snapshots(old: Dict[str, float], new: Dict[str, float],
+                   min_change: float = 0.0) -> List[Tuple[str, float, float]]:
+    """
+    Return (address, old_balance, new_balance) for accounts that differ;
+    0.0 stands for absent. Relative changes <= min_change are ignored.
+    """
+    changes = []
+    for addr, balance in new.items():
+        prev = old.get(addr, 0.0)
+        if prev == balance:
+            continue
+        if prev and min_change and abs(balance - prev) <= min_change * prev:
+            continue
+        changes.append((addr, prev, balance))
+    for addr, prev in old.items():
+        if addr not in new:
+            changes.append((addr, prev, 0.0))
+    return changes
+
+
+class CommitteeSums:
+    """Power sums A_k around c0 for one committee size."""
+
+    def __init__(self, tau: int):
+        self.tau = tau
+        self.c0 = 0.0
+        self.sums = [0.0] * SERIES_TERMS
+        self.rebases = 0
+
+    def rebuild(self, stakes, c: float):
+        self.c0 = c
+        sums = [0.0] * SERIES_TERMS
+        for s in stakes:
+            self._accumulate(sums, s, 1.0)
+        self.sums = sums
+        self.rebases += 1
+
+    def _accumulate(self, sums: List[float], s: float, sign: float):
+        term = sign * math.exp(-s * self.c0)
+        for k in range(SERIES_TERMS):
+            sums[k] += term
+            term *= s
+
+    def update(self, old: float, new: float):
+        if old:
+            self._accumulate(self.sums, old, -1.0)
+        if new:
+            self._accumulate(self.sums, new, 1.0)
+
+    def not_selected_sum(self, c: float) -> float:
+        """sum_i exp(-s_i * c) from the expansion around c0."""
+        delta = -(c - self.c0)
+        total = 0.0
+        factor = 1.0
+        for k, a in enumerate(self.sums):
+            if k:
+                factor *= delta / k
+            total += factor * a
+        return total
+
+
+class StakeState:
+    """Incrementally maintained sortition statistics for one stake distribution."""
+
+    def __init__(self, balances: Dict[str, float], committee_sizes: Tuple[int, ...]):
+        self.committees = {tau: CommitteeSums(tau) for tau in committee_sizes}
+        self.full_builds = 0
+        self.build(balances)
+
+    def build(self, balances: Dict[str, float]):
+        """Recompute everything from a full snapshot in one pass per committee."""
+        self.balances = dict(balances)
+        self.total = sum(self.balances.values())
+        self.sorted_stakes = sorted(self.balances.values())
+        self.top_sums = {n: sum(self.sorted_stakes[-n:]) for n in TOP_N}
+        for tau, committee in self.committees.items():
+            committee.rebuild(self.balances.values(), self._c(tau))
+        self.full_builds += 1
+
+    def _c(self, tau: int) -> float:
+        return -math.log(1.0 - tau / self.total)
+
+    def _remove_sorted(self, s: float):
+        stakes = self.sorted_stakes
+        i = bisect.bisect_left(stakes, s)
+        n_total = len(stakes)
+        for n in TOP_N:
+            if i >= n_total - n:
+                # s leaves the top n; the stake just below the top n moves in
+                self.top_sums[n] -= s
+                if n_total - n - 1 >= 0:
+                    self.top_sums[n] += stakes[n_total - n - 1]
+        del stakes[i]
+
+    def _insert_sorted(self, s: float):
+        stakes = self.sorted_stakes
+        i = bisect.bisect_right(stakes, s)
+        n_total = len(stakes)
+        for n in TOP_N:
+            if i > n_total - n:
+                # s enters the top n; the smallest of the current top n drops out
+                self.top_sums[n] += s
+                if n_total - n >= 0:
+                    self.top_sums[n] -= stakes[n_total - n]
+        stakes.insert(i, s)
+
+    def apply(self, changes: List[Tuple[str, float, float]]):
+        """Apply (address, old, new) changes; cost is O(len(changes)) plus list shifts."""
+        for addr, old, new in changes:
+            old = self.balances.get(addr, 0.0)
+            if old:
+                self._remove_sorted(old)
+            if new:
+                self._insert_sorted(new)
+                self.balances[addr] = new
+            else:
+                self.balances.pop(addr, None)
+            self.total += new - old
+            for committee in self.committees.values():
+                committee.update(old, new)
+
+        for tau, committee in self.committees.items():
+            c = self._c(tau)
+            if abs(c / committee.c0 - 1.0) > REBASE_TOLERANCE:
+                committee.rebuild(self.balances.values(), c)
+
+    def update(self, balances: Dict[str, float], changes: List[Tuple[str, float, float]]) -> str:
+        """
+        Move to the snapshot `balances`, given its diff `changes` against the
+        current state: applied incrementally, or by a full build when more than
+        FULL_REBUILD_FRACTION of accounts changed. Returns 'incremental' or 'full'.
+        """
+        if len(changes) > FULL_REBUILD_FRACTION * max(len(self.balances), 1):
+            self.build(balances)
+            return 'full'
+        self.apply(changes)
+        return 'incremental'
+
+    def expected_unique_voters(self, tau: int) -> float:
+        committee = self.committees[tau]
+        return len(self.balances) - committee.not_selected_sum(self._c(tau))
+
+    def selection_probability(self, addr: str, tau: int) -> float:
+        """P(account selected at least once) under the current total stake."""
+        s = self.balances.get(addr, 0.0)
+        return 1.0 - math.exp(-s * self._c(tau))
+
+    def top_share(self, n: int) -> float:
+        return self.top_sums[n] / self.total
+
+
+def main():
+    import sys
+    import time
+
+    if len(sys.argv) < 3:
+        print("Usage: stake_delta.py [--verify] [--min-change=REL] <snapshot1.csv> <snapshot2.csv> ...")
+        sys.exit(1)
+
+    verify = '--verify' in sys.argv
+    min_change = 0.0
+    files = []
+    for arg in sys.argv[1:]:
+        if arg.startswith('--min-change='):
+            min_change = float(arg.split('=', 1)[1])
+        elif not arg.startswith('--'):
+            files.append(arg)
+
+    params = ConsensusParams()
+    committee_sizes = (params.soft_committee_size, params.cert_committee_size, params.next_committee_size)
+
+    print(f"{'Snapshot':<36} {'Changed':>8} {'W (M Algo)':>11} {'Soft':>7} {'Cert':>7} {'Next':>7} "
+          f"{'Msgs':>7} {'Top10':>6} {'Top20':>6} {'ms':>7} {'Path':>12}")
+    print("-" * 125)
+
+    first = load_snapshot(files[0])
+    t0 = time.perf_counter()
+    state = StakeState(first, committee_sizes)
+    elapsed = time.perf_counter() - t0
+    changed = len(first)
+    path_taken = 'full'
+    incremental = 0
+
+    for i, path in enumerate(files):
+        if i:
+            # Diff against the tracked state so changes skipped by min_change accumulate
+            snapshot = load_snapshot(path)
+            changes = diff_snapshots(state.balances, snapshot, min_change)
+            if min_change:
+                # A full build must keep the skipped changes skipped too
+                snapshot = dict(state.balances)
+                for addr, _, new in changes:
+                    if new:
+                        snapshot[addr] = new
+                    else:
+                        snapshot.pop(addr, None)
+            t0 = time.perf_counter()
+            path_taken = state.update(snapshot, changes)
+            elapsed = time.perf_counter() - t0
+            changed = len(changes)
+            incremental += path_taken == 'incremental'
+
+        soft, cert, nxt = (state.expected_unique_voters(tau) for tau in committee_sizes)
+        name = path.rsplit('/', 1)[-1]
+        print(f"{name:<36} {changed:>8} {state.total / 1e6:>11.2f} {soft:>7.1f} {cert:>7.1f} {nxt:>7.1f} "
+              f"{soft + cert + nxt + params.num_proposers:>7.0f} {state.top_share(10) * 100:>5.1f}% "
+              f"{state.top_share(20) * 100:>5.1f}% {elapsed * 1000:>7.2f} {path_taken:>12}")
+
+        if verify:
+            # Full recompute from the state's own balances
+            stakes = list(state.balances.values())
+            errors = [abs(state.expected_unique_voters(tau) - expected_unique_voters(stakes, sum(stakes), tau))
+                      for tau in committee_sizes]
+            top = sorted(stakes, reverse=True)
+            top_err = max(abs(state.top_sums[n] - sum(top[:n])) / state.total for n in TOP_N)
+            print(f"  verify: max |E - full| = {max(errors):.2e} voters, max top-N share error = {top_err:.2e}")
+
+    rebases = sum(c.rebases for c in state.committees.values()) - len(committee_sizes) * state.full_builds
+    print(f"\nSnapshots after the first: {incremental} incremental, {state.full_builds - 1} full build(s) "
+          f"(more than {FULL_REBUILD_FRACTION:.0%} of accounts changed)")
+    print(f"Power-sum rebuilds during incremental updates: {rebases}")
+
+
+if __name__ == "__main__":
+    main()
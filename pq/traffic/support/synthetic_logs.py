@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Generate mainnet-scale synthetic consensus logs for load and scaling tests.
+
+The analysis scripts have only been run against the few real captures we
+have (log1 is 32k rounds). This writes the files a patched node with
+`logdetails` enabled writes, for as many rounds as needed:
+
+    consensus_messages.csv         per-round message counts, current 20-column
+                                   header from go-algorand-diff.txt
+    consensus_rounds.csv           per-round summary in the column layout
+                                   analyze_rounds.sh reads, plus the simulated
+                                   round start (timestamp_unix_ns)
+    consensus_votes_detail.csv     one row per soft/cert/next vote (on-time and late)
+    consensus_pipelined_debug.csv  votes for r+1 observed while still on r
+
+The logger headers come from consensus_logs.py; consensus_rounds.csv has no
+logger-defined header, so ROUNDS_HEADER below is this generator's own layout.
+
+Each round is driven by the sortition model over a stake snapshot:
+- soft, cert and proposer committees are drawn with each account's
+  P(selected), with credential weights from derive_voters.sample_weight.
+  Accounts are grouped into probability octaves and sampled by geometric
+  skipping, so a draw costs about twice the committee's voters, not one
+  random number per account
+- votes arrive after the step starts, with delays from a fitted arrival model
+  (arrival_model.py) or an exponential default
+- the soft threshold starts the cert step; the node advances --advance-lag-ms
+  after the cert threshold. Votes before that are on-time (the overshoot),
+  votes within the late span after it are logged as late, the rest are missed.
+  The late columns are placeholders, far below log1 (see DEFAULT_LATE_SPAN_MS)
+- a --pipelined-rate fraction of rounds have the node lagging its peers, so
+  the start of round r+1's voting is seen during r
+- a --next-rate fraction of rounds also see a next-vote committee, drawn
+  from the advance; its votes are on-time until --advance-lag-ms after the
+  next threshold and late within the late span after that, like cert's
+
+Rounds are generated in chunks by a process pool. Each chunk writes part files
+that are appended in round order. Timestamps are continuous within a chunk;
+chunk starts are spaced by the mean round duration from a short pilot run, so
+chunk boundaries carry a small gap or overlap.
+
+Throughput is about 300-500 rounds/s per core with consensus_votes_detail.csv
+(~350 rows per round) and about 650 with --no-votes, so 1M rounds costs
+roughly 35-55 CPU-minutes: minutes of wall time need 8 or more cores.
+"""
+
+import math
+import os
+import random
+import shutil
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
+
+from consensus_logs import (
+    DEBUG_HEADER, DEFAULT_PROPOSAL_PEERS, DEFAULT_SOFT_DELAY_MS, FILTER_TIMEOUT_MS, MESSAGES_HEADER, VOTES_HEADER,
+)
+from derive_voters import ConsensusParams, load_snapshot, sample_weight
+from proposal_cutoff import observed_proposals
+
+MESSAGES_FILE = 'consensus_messages.csv'
+ROUNDS_FILE = 'consensus_rounds.csv'
+VOTES_FILE = 'consensus_votes_detail.csv'
+DEBUG_FILE = 'consensus_pipelined_debug.csv'
+
+# Columns 4-13 are the positions analyze_rounds.sh reads; timestamp_unix_ns is
+# the simulated round start
+ROUNDS_HEADER = ("round,timestamp_unix_ns,proposals,round_duration_ms,bundle_votes,in_peers,out_peers,"
+                 "soft_voters,cert_voters,next_voters,soft_weight,cert_weight,next_weight")
+
+STEP_SOFT = 1
+STEP_CERT = 2
+STEP_NEXT = 3
+# message_kind values in the pipelined debug log
+MSG_PIPELINED_SOFT = 1
+MSG_PIPELINED_CERT = 2
+
+# Placeholders, not fitted: with exponential soft delays they give ~11 late
+# soft and ~33 late cert votes per round, against ~324 and ~193 in log1. One
+# committee draw per step cannot get there. The logger keeps late senders in
+# a set apart from on-time ones (recordLateVote in go-algorand-diff.txt), so
+# log1 counts ~150 of its ~308 on-time soft senders again as late, and it sees
+# ~476 unique soft senders per round against ~354 expected committee members.
+# Here a voter is either on-time or late, never both.
+DEFAULT_ADVANCE_LAG_MS = 50.0
+DEFAULT_LATE_SPAN_MS = 500.0
+DEFAULT_PIPELINED_RATE = 3e-4  # ~10 of log1's 32k rounds saw pipelined votes
+DEFAULT_NEXT_RATE = 1e-4
+DEFAULT_CHUNK_ROUNDS = 2000
+PILOT_ROUNDS = 100
+START_TIME_NS = 1764000000 * 10**9  # 2025-11-24
+
+
+class CommitteeSampler:
+    """Draws one committee's selected accounts by geometric skipping within probability octaves."""
+
+    def __init__(self, stakes: List[float], total_stake: float, committee_size: int):
+        self.tau_over_W = committee_size / total_stake
+        log_not = math.log(1.0 - self.tau_over_W)
+        octaves = defaultdict(list)
+        for i, stake in enumerate(stakes):
+            p_sel = 1.0 - math.exp(stake * log_not)
+            if p_sel > 0:
+                octaves[int(-math.log2(p_sel))].append((i, stake, p_sel))
+        # (log(1 - p_max), p_max, members) with every member's p in (p_max / 2, p_max]
+        self.buckets = []
+        for k, members in sorted(octaves.items()):
+            p_max = 2.0 ** -k
+            self.buckets.append((math.log(1.0 - p_max) if k else 0.0, p_max, members))
+
+    def draw(self) -> List[Tuple[int, float]]:
+        """Return (account index, stake) for each selected account."""
+        selected = []
+        rand = random.random
+        for log_q, p_max, members in self.buckets:
+            if not log_q:
+                # p > 1/2: skipping gains nothing
+                selected.extend((i, stake) for i, stake, p_sel in members if rand() < p_sel)
+                continue
+            n = len(members)
+            j = int(math.log(1.0 - rand()) / log_q)
+            while j < n:
+                i, stake, p_sel = members[j]
+                if rand() * p_max < p_sel:
+                    selected.append((i, stake))
+                j += 1 + int(math.log(1.0 - rand()) / log_q)
+        return selected
+
+
+# Committee samplers and delay models built by _init_worker; generate_chunk reads them here
+_state = {}
+
+
+def _init_worker(addresses, stakes, total_stake, arrival_model_file, config):
+    params = ConsensusParams()
+    soft_model = cert_model = None
+    if arrival_model_file:
+        from arrival_model import ArrivalModel
+        arrival = ArrivalModel.load(arrival_model_file)
+        soft_model = arrival.for_step(STEP_SOFT)
+        cert_model = arrival.for_step(STEP_CERT)
+    _state.update(
+        addresses=addresses,
+        proposer=CommitteeSampler(stakes, total_stake, params.num_proposers),
+        soft=CommitteeSampler(stakes, total_stake, params.soft_committee_size),
+        soft_threshold=params.soft_threshold,
+        cert=CommitteeSampler(stakes, total_stake, params.cert_committee_size),
+        cert_threshold=params.cert_threshold,
+        next=CommitteeSampler(stakes, total_stake, params.next_committee_size),
+        next_threshold=params.next_threshold,
+        soft_model=soft_model,
+        cert_model=cert_model,
+        **config,
+    )
+
+
+def draw_step(sampler: CommitteeSampler, model, start_ms: float) -> List[Tuple[float, int, int]]:
+    """Draw one committee; returns its votes as (arrival ms, account index, weight), by arrival."""
+    tau_over_W = sampler.tau_over_W
+    votes = []
+    for i, stake in sampler.draw():
+        w = sample_weight(stake, tau_over_W)
+        delay = model.sample_delay(w) if model else random.expovariate(1.0 / DEFAULT_SOFT_DELAY_MS)
+        votes.append((start_ms + delay, i, w))
+    votes.sort()
+    return votes
+
+
+def threshold_time(votes: List[Tuple[float, int, int]], threshold: int) -> Tuple[float, int]:
+    """Return (arrival ms at which cumulative weight reaches threshold, voters needed)."""
+    cumulative = 0
+    for n, (arrival, _, w) in enumerate(votes, 1):
+        cumulative += w
+        if cumulative >= threshold:
+            return arrival, n
+    # Committee short of threshold: the step ends with its last vote
+    return (votes[-1][0] if votes else 0.0), len(votes)
+
+
+def simulate_round() -> dict:
+    """Simulate one round on the node's timeline (ms from round start)."""
+    s = _state
+    soft = draw_step(s['soft'], s['soft_model'], FILTER_TIMEOUT_MS)
+    t_soft, _ = threshold_time(soft, s['soft_threshold'])
+    cert = draw_step(s['cert'], s['cert_model'], t_soft)
+    t_cert, bundle = threshold_time(cert, s['cert_threshold'])
+    advance = t_cert + s['advance_lag']
+
+    proposer = s['proposer']
+    proposers = [sample_weight(stake, proposer.tau_over_W) for _, stake in proposer.draw()]
+    proposals = observed_proposals(proposers, t_soft, s['proposal_peers'])
+
+    next_votes = []
+    next_advance = advance
+    if random.random() < s['next_rate']:
+        next_votes = draw_step(s['next'], None, advance)
+        t_next, _ = threshold_time(next_votes, s['next_threshold'])
+        next_advance = t_next + s['advance_lag']
+
+    late_soft = s['soft_model'].sample_late_span() if s['soft_model'] else s['late_span']
+    late_cert = s['cert_model'].sample_late_span() if s['cert_model'] else s['late_span']
+    return {
+        'soft': soft,
+        'cert': cert,
+        'advance': advance,
+        'bundle': bundle,
+        'proposals': proposals,
+        'next_votes': next_votes,
+        'next_advance': next_advance,
+        'late_soft': advance + late_soft,
+        'late_cert': advance + late_cert,
+        'late_next': next_advance + s['late_span'],
+    }
+
+
+def split_votes(votes, advance: float, late_until: float):
+    """Split a step's votes into (on-time, late); votes after late_until are missed."""
+    on_time = []
+    late = []
+    for v in votes:
+        if v[0] <= advance:
+            on_time.append(v)
+        elif v[0] <= late_until:
+            late.append(v)
+        else:
+            break
+    return on_time, late
+
+
+def generate_chunk(args) -> dict:
+    """Generate one chunk of rounds into part files; returns their paths and totals."""
+    index, first_round, rounds, start_ns, seed, parts_dir = args
+    random.seed(seed)
+    s = _state
+    addresses = s['addresses']
+    write_votes = s['write_votes']
+    paths = {name: os.path.join(parts_dir, f"{index:06d}.{name}")
+             for name in (MESSAGES_FILE, ROUNDS_FILE, VOTES_FILE, DEBUG_FILE)}
+    messages_out = open(paths[MESSAGES_FILE], 'w')
+    rounds_out = open(paths[ROUNDS_FILE], 'w')
+    votes_out = open(paths[VOTES_FILE], 'w') if write_votes else None
+    debug_out = open(paths[DEBUG_FILE], 'w')
+
+    t_ns = start_ns
+    votes_written = 0
+    pipelined_rounds = 0
+    pending = simulate_round()
+    for rnd in range(first_round, first_round + rounds):
+        # Round r+1 is drawn ahead so its earliest votes can be pipelined into r
+        current, pending = pending, simulate_round()
+        advance = current['advance']
+
+        soft_on, soft_late = split_votes(current['soft'], advance, current['late_soft'])
+        cert_on, cert_late = split_votes(current['cert'], advance, current['late_cert'])
+        next_on, next_late = split_votes(current['next_votes'], current['next_advance'], current['late_next'])
+
+        pipelined_soft = pipelined_cert = 0
+        if random.random() < s['pipelined_rate']:
+            # The node trails its peers by `lag`, so r+1 votes sent in that window arrive during r
+            lag = random.uniform(0.0, min(advance, pending['advance']))
+            pipelined_soft = sum(1 for v in pending['soft'] if v[0] < lag)
+            pipelined_cert = sum(1 for v in pending['cert'] if v[0] < lag)
+            debug_out.write(f"{rnd},{rnd + 1},0,{STEP_SOFT},{MSG_PIPELINED_SOFT}\n" * pipelined_soft)
+            debug_out.write(f"{rnd},{rnd + 1},0,{STEP_CERT},{MSG_PIPELINED_CERT}\n" * pipelined_cert)
+            pipelined_rounds += 1
+
+        soft_voters = len(soft_on) + len(soft_late)
+        cert_voters = len(cert_on) + len(cert_late)
+        next_voters = len(next_on) + len(next_late)
+        messages_out.write(
+            f"{rnd},{current['proposals']},{len(soft_on)},{len(cert_on)},{len(next_on)},"
+            f"{pipelined_soft},{pipelined_cert},{len(soft_late)},{len(cert_late)},{len(next_late)},"
+            f"{len(soft_on)},{len(cert_on)},{soft_voters},{cert_voters},"
+            f"{1 if soft_on else 0},{1 if cert_on else 0},{int(advance)},"
+            f"{s['in_peers']},{s['out_peers']},{current['bundle']}\n"
+        )
+        rounds_out.write(
+            f"{rnd},{t_ns},{current['proposals']},{int(advance)},{current['bundle']},"
+            f"{s['in_peers']},{s['out_peers']},{soft_voters},{cert_voters},{next_voters},"
+            f"{sum(v[2] for v in soft_on)},{sum(v[2] for v in cert_on)},{sum(v[2] for v in next_on)}\n"
+        )
+
+        if write_votes:
+            rows = [(a, STEP_SOFT, i, w, 'false') for a, i, w in soft_on]
+            rows += [(a, STEP_SOFT, i, w, 'true') for a, i, w in soft_late]
+            rows += [(a, STEP_CERT, i, w, 'false') for a, i, w in cert_on]
+            rows += [(a, STEP_CERT, i, w, 'true') for a, i, w in cert_late]
+            rows += [(a, STEP_NEXT, i, w, 'false') for a, i, w in next_on]
+            rows += [(a, STEP_NEXT, i, w, 'true') for a, i, w in next_late]
+            rows.sort()
+            votes_out.write(''.join(
+                f"{rnd},{step},0,{addresses[i]},{w},{t_ns + int(a * 1e6)},{late}\n"
+                for a, step, i, w, late in rows
+            ))
+            votes_written += len(rows)
+
+        t_ns += int(advance * 1e6)
+
+    messages_out.close()
+    rounds_out.close()
+    debug_out.close()
+    if votes_out:
+        votes_out.close()
+    return {
+        'paths': paths,
+        'rounds': rounds,
+        'votes': votes_written,
+        'pipelined_rounds': pipelined_rounds,
+        'duration_ns': t_ns - start_ns,
+    }
+
+
+def pilot_round_ms(rounds: int = PILOT_ROUNDS) -> float:
+    """Mean round duration (ms) over a short pilot run in this process."""
+    total = sum(simulate_round()['advance'] for _ in range(rounds))
+    return total / rounds
+
+
+def generate(
+    stake_file: str,
+    out_dir: str,
+    rounds: int,
+    start_round: int = 55000000,
+    arrival_model_file: Optional[str] = None,
+    workers: Optional[int] = None,
+    chunk_rounds: int = DEFAULT_CHUNK_ROUNDS,
+    seed: int = 1,
+    advance_lag: float = DEFAULT_ADVANCE_LAG_MS,
+    late_span: float = DEFAULT_LATE_SPAN_MS,
+    pipelined_rate: float = DEFAULT_PIPELINED_RATE,
+    next_rate: float = DEFAULT_NEXT_RATE,
+    proposal_peers: int = DEFAULT_PROPOSAL_PEERS,
+    in_peers: int = 0,
+    out_peers: int = 4,
+    write_votes: bool = True
+) -> dict:
+    """Generate `rounds` rounds of synthetic logs into out_dir; returns totals."""
+    config = dict(
+        advance_lag=advance_lag,
+        late_span=late_span,
+        pipelined_rate=pipelined_rate,
+        next_rate=next_rate,
+        proposal_peers=proposal_peers,
+        in_peers=in_peers,
+        out_peers=out_peers,
+        write_votes=write_votes,
+    )
+    balances = load_snapshot(stake_file)
+    addresses = list(balances)
+    stakes = list(balances.values())
+    total_stake = sum(stakes)
+    init_args = (addresses, stakes, total_stake, arrival_model_file, config)
+
+    _init_worker(*init_args)
+    random.seed(seed)
+    round_ms = pilot_round_ms()
+
+    os.makedirs(out_dir, exist_ok=True)
+    parts_dir = os.path.join(out_dir, '.parts')
+    os.makedirs(parts_dir, exist_ok=True)
+
+    chunks = []
+    for index, offset in enumerate(range(0, rounds, chunk_rounds)):
+        n = min(chunk_rounds, rounds - offset)
+        start_ns = START_TIME_NS + int(offset * round_ms * 1e6)
+        chunks.append((index, start_round + offset, n, start_ns, seed * 1000003 + index, parts_dir))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = map(generate_chunk, chunks)
+    else:
+        pool = Pool(workers, initializer=_init_worker, initargs=init_args)
+        results = pool.imap(generate_chunk, chunks)
+
+    headers = {MESSAGES_FILE: MESSAGES_HEADER, ROUNDS_FILE: ROUNDS_HEADER, VOTES_FILE: VOTES_HEADER, DEBUG_FILE: DEBUG_HEADER}
+    if not write_votes:
+        del headers[VOTES_FILE]
+    outputs = {name: open(os.path.join(out_dir, name), 'w') for name in headers}
+    for name, header in headers.items():
+        outputs[name].write(header + '\n')
+
+    totals = {'rounds': 0, 'votes': 0, 'pipelined_rounds': 0, 'duration_ns': 0, 'round_ms': round_ms}
+    for done, r in enumerate(results, 1):
+        # imap keeps chunk order, so parts are appended in round order
+        for name, out in outputs.items():
+            with open(r['paths'][name], 'r') as part:
+                shutil.copyfileobj(part, out, 1 << 20)
+        for path in r['paths'].values():
+            if os.path.exists(path):
+                os.remove(path)
+        for key in ('rounds', 'votes', 'pipelined_rounds', 'duration_ns'):
+            totals[key] += r[key]
+        if done % 10 == 0:
+            print(f"  Chunk {done}/{len(chunks)} ({totals['rounds']:,} rounds)...")
+    if workers != 1:
+        pool.close()
+        pool.join()
+
+    for out in outputs.values():
+        out.close()
+    os.rmdir(parts_dir)
+    return totals
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate synthetic consensus logs driven by sortition")
+    parser.add_argument("stake_file", help="stake snapshot CSV (algorand-consensus-*.csv)")
+    parser.add_argument("--out-dir", default="synthetic_logs", help="directory for the generated logs")
+    parser.add_argument("--rounds", type=int, default=10000)
+    parser.add_argument("--start-round", type=int, default=55000000)
+    parser.add_argument("--arrival-model", help="arrival model JSON from arrival_model.py (default: exponential delays)")
+    parser.add_argument("--advance-lag-ms", type=float, default=DEFAULT_ADVANCE_LAG_MS,
+                        help="time from cert threshold to round advance; votes before it are on-time (placeholder default)")
+    parser.add_argument("--late-span-ms", type=float, default=DEFAULT_LATE_SPAN_MS,
+                        help="how long after advancing late votes are still logged (placeholder default; ignored with --arrival-model)")
+    parser.add_argument("--pipelined-rate", type=float, default=DEFAULT_PIPELINED_RATE,
+                        help="fraction of rounds where the node trails its peers")
+    parser.add_argument("--next-rate", type=float, default=DEFAULT_NEXT_RATE,
+                        help="fraction of rounds that also see next votes")
+    parser.add_argument("--proposal-peers", type=int, default=DEFAULT_PROPOSAL_PEERS, help="peers relaying proposals (see proposal_cutoff.py)")
+    parser.add_argument("--in-peers", type=int, default=0)
+    parser.add_argument("--out-peers", type=int, default=4)
+    parser.add_argument("--no-votes", action="store_true", help="skip consensus_votes_detail.csv")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-rounds", type=int, default=DEFAULT_CHUNK_ROUNDS)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"Generating {args.rounds:,} rounds from {args.stake_file} into {args.out_dir}/")
+    t0 = time.perf_counter()
+    totals = generate(
+        args.stake_file, args.out_dir, args.rounds,
+        start_round=args.start_round,
+        arrival_model_file=args.arrival_model,
+        workers=args.workers or None,
+        chunk_rounds=args.chunk_rounds,
+        seed=args.seed,
+        advance_lag=args.advance_lag_ms,
+        late_span=args.late_span_ms,
+        pipelined_rate=args.pipelined_rate,
+        next_rate=args.next_rate,
+        proposal_peers=args.proposal_peers,
+        in_peers=args.in_peers,
+        out_peers=args.out_peers,
+        write_votes=not args.no_votes,
+    )
+    elapsed = time.perf_counter() - t0
+
+    print(f"\n{'='*60}")
+    print("SYNTHETIC LOGS")
+    print(f"{'='*60}")
+    print(f"Rounds:               {totals['rounds']:,}")
+    print(f"Votes (detail rows):  {totals['votes']:,}")
+    print(f"Lagging rounds:       {totals['pipelined_rounds']:,} (pipelined votes possible)")
+    print(f"Mean round duration:  {totals['duration_ns'] / max(totals['rounds'], 1) / 1e6:,.0f} ms "
+          f"(pilot {totals['round_ms']:,.0f} ms)")
+    print(f"Simulated time:       {totals['duration_ns'] / 1e9 / 86400:.2f} days")
+    print(f"Wall time:            {elapsed:.1f} s ({totals['rounds'] / elapsed:,.0f} rounds/s, "
+          f"{totals['votes'] / elapsed:,.0f} votes/s)")
+    for name in (MESSAGES_FILE, ROUNDS_FILE, VOTES_FILE, DEBUG_FILE):
+        path = os.path.join(args.out_dir, name)
+        if os.path.exists(path):
+            print(f"  {path}: {os.path.getsize(path) / 1e6:,.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Estimate on-the-wire vote sizes under vpack compression (consensus_traffic.md Part V).
+
+Stateless (AV): a 2-byte header carries the optional-field bitmask; msgpack
+field names are stripped; fixed-size fields are copied and integers keep their
+msgpack uint length (1, 2, 3, 5 or 9 bytes). All optional fields present with
+9-byte integers gives MaxCompressedVoteSize = 502 bytes.
+
+Stateful (VP): each connection keeps LRU tables of recently seen values. A hit
+replaces the value with a 2-byte table reference; the round is delta-encoded
+against the previous vote on the connection. Values that repeat across votes:
+- r.snd                 sender address, repeats across steps and rounds
+- sig.p2 / sig.p2s      batch key and its signature, fixed per sender per
+                        key-dilution batch (round // KeyDilution)
+- r.prop.*              proposal value, shared by almost every vote in a step
+cred.pf, sig.p, sig.p1s and sig.s are unique per vote and never hit.
+
+Sizes are computed field by field from these rules rather than by building
+byte strings, so millions of votes can be processed per minute. Input is either
+a logged consensus_votes_detail.csv or synthetic votes drawn by sortition over
+a stake snapshot. Logged votes carry no proposal digest, so every vote in a
+(round, period, step) is taken to vote for the same proposal.
+
+Every vote carries the proposal value r.prop, proposal votes (step 0)
+included; its oper field is the period the proposal was first made in, which
+is not the vote's own period after a re-proposal. The logger does not record
+it, so logged votes read a proposal_original_period column when there is one
+and otherwise take 0. Synthetic rounds stop each step at its threshold, in a
+random arrival order, as derive_voters.py counts voters; later committee
+members are not seen.
+"""
+
+import csv
+import math
+import random
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, Iterable, Iterator, Tuple
+
+from consensus_logs import ENVELOPE_BYTES_HIGH, ENVELOPE_BYTES_LOW
+from derive_voters import ConsensusParams, parse_balance, sample_weight
+
+HEADER_BYTES = 2
+CRED_PF_BYTES = 80
+ADDR_BYTES = 32
+DIGEST_BYTES = 32
+SIG_P_PAIR_BYTES = 32 + 64  # sig.p + sig.p1s
+SIG_P2_PAIR_BYTES = 32 + 64  # sig.p2 + sig.p2s
+SIG_S_BYTES = 64
+
+STATEFUL_TABLE_SIZE = 1024
+STATEFUL_REF_BYTES = 2
+STATEFUL_HIT_MASK_BYTES = 1
+
+DEFAULT_KEY_DILUTION = 10000
+
+
+STEP_NAMES = {1: "Soft", 2: "Cert", 3: "Next"}
+
+# A vote: (round, period, step, sender_id, key_dilution, proposal original period)
+Vote = Tuple[int, int, int, int, int, int]
+
+
+def msgpack_uint_size(n: int) -> int:
+    """Bytes msgpack uses for an unsigned integer."""
+    if n < 128:
+        return 1
+    if n < 256:
+        return 2
+    if n < 65536:
+        return 3
+    if n < 4294967296:
+        return 5
+    return 9
+
+
+def proposal_bytes(original_period: int) -> int:
+    """Size of r.prop: dig + encdig + oprop, plus oper when non-zero."""
+    size = DIGEST_BYTES * 2 + ADDR_BYTES
+    if original_period:
+        size += msgpack_uint_size(original_period)
+    return size
+
+
+def stateless_size(rnd: int, period: int, step: int, original_period: int = 0) -> int:
+    """Stateless (AV) vote size; zero-valued optional fields are omitted by the bitmask."""
+    size = HEADER_BYTES + CRED_PF_BYTES + msgpack_uint_size(rnd) + ADDR_BYTES
+    size += SIG_P_PAIR_BYTES + SIG_P2_PAIR_BYTES + SIG_S_BYTES
+    if period:
+        size += msgpack_uint_size(period)
+    if step:
+        size += msgpack_uint_size(step)
+    size += proposal_bytes(original_period)
+    return size
+
+
+class LRUTable:
+    """Fixed-size LRU table of values seen on one connection."""
+
+    def __init__(self, size: int = STATEFUL_TABLE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.lookups = 0
+
+    def lookup(self, key) -> bool:
+        """Return True on a hit; insert (evicting the LRU entry) on a miss."""
+        self.lookups += 1
+        entries = self.entries
+        if key in entries:
+            entries.move_to_end(key)
+            self.hits += 1
+            return True
+        entries[key] = None
+        if len(entries) > self.size:
+            entries.popitem(last=False)
+        return False
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class StatefulConnection:
+    """Stateful (VP) encoder state for one connection."""
+
+    def __init__(self, table_size: int = STATEFUL_TABLE_SIZE):
+        self.senders = LRUTable(table_size)
+        self.batch_keys = LRUTable(table_size)
+        self.proposals = LRUTable(table_size)
+        self.last_round = 0
+
+    def size(self, vote: Vote) -> int:
+        rnd, period, step, sender, key_dilution, original_period = vote
+        size = HEADER_BYTES + STATEFUL_HIT_MASK_BYTES + CRED_PF_BYTES + SIG_P_PAIR_BYTES + SIG_S_BYTES
+
+        # Round as a zigzag delta against the previous vote on this connection
+        delta = rnd - self.last_round
+        size += msgpack_uint_size(delta * 2 if delta >= 0 else -delta * 2 - 1)
+        self.last_round = rnd
+
+        size += STATEFUL_REF_BYTES if self.senders.lookup(sender) else ADDR_BYTES
+        batch = (sender, rnd // key_dilution)
+        size += STATEFUL_REF_BYTES if self.batch_keys.lookup(batch) else SIG_P2_PAIR_BYTES
+
+        if period:
+            size += msgpack_uint_size(period)
+        if step:
+            size += msgpack_uint_size(step)
+        prop = (rnd, original_period)
+        size += STATEFUL_REF_BYTES if self.proposals.lookup(prop) else proposal_bytes(original_period)
+        return size
+
+
+def step_key(step: int) -> int:
+    return step if step < 3 else 3
+
+
+def load_key_dilution(stake_file: str) -> Tuple[list, list, Dict[str, int]]:
+    """Return (stakes, key dilutions, address -> index) from a stake snapshot."""
+    stakes = []
+    dilutions = []
+    index = {}
+    with open(stake_file, 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            balance = parse_balance(row['Balance'])
+            if balance <= 0:
+                continue
+            index[row['Address']] = len(stakes)
+            stakes.append(balance)
+            kd = row.get('Key Dilution') or ''
+            dilutions.append(int(kd) if kd.isdigit() and int(kd) > 0 else DEFAULT_KEY_DILUTION)
+    return stakes, dilutions, index
+
+
+def logged_votes(votes_file: str, addr_index: Dict[str, int], dilutions: list) -> Iterator[Vote]:
+    """Stream votes from consensus_votes_detail.csv."""
+    senders = dict(addr_index)
+    with open(votes_file, 'r') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        col = {name: i for i, name in enumerate(header)}
+        i_round = col['round']
+        i_step = col['step']
+        i_sender = col['sender']
+        i_period = col.get('period')
+        i_oper = col.get('proposal_original_period')
+        for row in reader:
+            sender = row[i_sender]
+            sid = senders.get(sender)
+            if sid is None:
+                sid = senders[sender] = len(senders)
+            kd = dilutions[sid] if sid < len(dilutions) else DEFAULT_KEY_DILUTION
+            period = int(row[i_period]) if i_period is not None else 0
+            oper = int(row[i_oper]) if i_oper is not None and row[i_oper] else 0
+            yield int(row[i_round]), period, int(row[i_step]), sid, kd, oper
+
+
+def synthetic_votes(stakes: list, dilutions: list, rounds: int, start_round: int = 55000000,
+                    include_next: bool = False, seed: int = 1) -> Iterator[Vote]:
+    """
+    Draw soft/cert (and optionally next) committees by sortition for each round.
+    Each step's votes arrive in random order and stop once their credential
+    weight reaches the step threshold.
+    """
+    random.seed(seed)
+    params = ConsensusParams()
+    total = sum(stakes)
+    committees = [(1, params.soft_committee_size, params.soft_threshold),
+                  (2, params.cert_committee_size, params.cert_threshold)]
+    if include_next:
+        committees.append((3, params.next_committee_size, params.next_threshold))
+    tables = []
+    for step, size, threshold in committees:
+        tau = size / total
+        log_not = math.log(1.0 - tau)
+        tables.append((step, tau, threshold, [1.0 - math.exp(s * log_not) for s in stakes]))
+
+    for rnd in range(start_round, start_round + rounds):
+        for step, tau, threshold, probs in tables:
+            selected = [i for i, p in enumerate(probs) if random.random() < p]
+            random.shuffle(selected)
+            cumulative = 0
+            for i in selected:
+                yield rnd, 0, step, i, dilutions[i], 0
+                # Weight is not part of the wire format; it only ends the step
+                cumulative += sample_weight(stakes[i], tau)
+                if cumulative >= threshold:
+                    break
+
+
+def measure(votes: Iterable[Vote]):
+    """Encode a vote stream on one connection; return per-step size histograms and per-round bytes."""
+    conn = StatefulConnection()
+    stateless = defaultdict(Counter)
+    stateful = defaultdict(Counter)
+    per_round = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    count = 0
+    for vote in votes:
+        rnd, period, step = vote[0], vote[1], vote[2]
+        key = step_key(step)
+        a = stateless_size(rnd, period, step, vote[5])
+        b = conn.size(vote)
+        stateless[key][a] += 1
+        stateful[key][b] += 1
+        totals = per_round[rnd][key]
+        totals[0] += a
+        totals[1] += b
+        count += 1
+    return stateless, stateful, per_round, conn, count
+
+
+def hist_stats(hist: Counter):
+    """Return (n, mean, p50, p90, p99) of a size -> count histogram."""
+    n = sum(hist.values())
+    mean = sum(k * c for k, c in hist.items()) / n
+    out = []
+    for q in (0.5, 0.9, 0.99):
+        running = 0
+        for k in sorted(hist):
+            running += hist[k]
+            if running >= q * n:
+                out.append(k)
+                break
+    return (n, mean, *out)
+
+
+def print_results(stateless, stateful, per_round, conn, count, elapsed):
+    print(f"\n{'='*72}")
+    print("VOTE SIZES ON THE WIRE (bytes)")
+    print(f"{'='*72}")
+    print(f"\n{'Step':<6} {'Votes':>10} {'AV mean':>8} {'VP mean':>8} {'VP p50':>7} "
+          f"{'VP p90':>7} {'VP p99':>7} {'Saving':>7}")
+    print("-" * 68)
+    for step in sorted(stateful):
+        n, av_mean, _, _, _ = hist_stats(stateless[step])
+        _, vp_mean, p50, p90, p99 = hist_stats(stateful[step])
+        print(f"{STEP_NAMES[step]:<6} {n:>10,} {av_mean:>8.1f} {vp_mean:>8.1f} {p50:>7} "
+              f"{p90:>7} {p99:>7} {(1 - vp_mean / av_mean) * 100:>6.1f}%")
+
+    print("\nStateful table hit rates:")
+    print(f"  Sender (r.snd):        {conn.senders.hit_rate * 100:5.1f}%")
+    print(f"  Batch key (sig.p2*):   {conn.batch_keys.hit_rate * 100:5.1f}%")
+    print(f"  Proposal (r.prop):     {conn.proposals.hit_rate * 100:5.1f}%")
+
+    rounds = len(per_round)
+    print(f"\n{'='*72}")
+    print(f"PER-ROUND TRAFFIC (mean over {rounds} rounds)")
+    print(f"{'='*72}")
+    print(f"\n{'Step':<6} {'Votes':>8} {'AV KB':>8} {'VP KB':>8} {'+Envelope KB':>14} {'Overhead':>10}")
+    print("-" * 58)
+    env_mid = (ENVELOPE_BYTES_LOW + ENVELOPE_BYTES_HIGH) / 2
+    total_av = total_vp = total_votes = 0
+    for step in sorted(stateful):
+        votes = sum(stateful[step].values()) / rounds
+        av = sum(r[step][0] for r in per_round.values() if step in r) / rounds
+        vp = sum(r[step][1] for r in per_round.values() if step in r) / rounds
+        total_av += av
+        total_vp += vp
+        total_votes += votes
+        env = votes * env_mid
+        print(f"{STEP_NAMES[step]:<6} {votes:>8.1f} {av / 1000:>8.1f} {vp / 1000:>8.1f} "
+              f"{(vp + env) / 1000:>14.1f} {(vp + env) / vp:>9.2f}x")
+    print("-" * 58)
+    env_low = total_votes * ENVELOPE_BYTES_LOW
+    env_high = total_votes * ENVELOPE_BYTES_HIGH
+    print(f"{'Total':<6} {total_votes:>8.1f} {total_av / 1000:>8.1f} {total_vp / 1000:>8.1f} "
+          f"{(total_vp + total_votes * env_mid) / 1000:>14.1f} {(total_vp + total_votes * env_mid) / total_vp:>9.2f}x")
+    print(f"\nEnvelope overhead ratio (VP + envelope) / VP: "
+          f"{(total_vp + env_low) / total_vp:.2f}x - {(total_vp + env_high) / total_vp:.2f}x "
+          f"for {ENVELOPE_BYTES_LOW}-{ENVELOPE_BYTES_HIGH} B envelopes")
+    print(f"\nProcessed {count:,} votes in {elapsed:.1f}s ({count / elapsed * 60 / 1e6:.2f}M votes/min)")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Estimate vpack stateless/stateful vote sizes")
+    parser.add_argument("stake_file", help="stake snapshot CSV (for key dilution and synthetic sortition)")
+    parser.add_argument("--votes", help="consensus_votes_detail.csv to encode (default: synthetic)")
+    parser.add_argument("--rounds", type=int, default=1000, help="synthetic rounds to generate")
+    parser.add_argument("--next", action="store_true", help="include next votes in synthetic rounds")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    stakes, dilutions, addr_index = load_key_dilution(args.stake_file)
+    if args.votes:
+        print(f"Encoding logged votes from: {args.votes}")
+        votes = logged_votes(args.votes, addr_index, dilutions)
+    else:
+        print(f"Encoding synthetic votes for {args.rounds} rounds")
+        votes = synthetic_votes(stakes, dilutions, args.rounds, include_next=args.next, seed=args.seed)
+
+    start = time.perf_counter()
+    stateless, stateful, per_round, conn, count = measure(votes)
+    elapsed = time.perf_counter() - start
+    if not count:
+        print("No votes found.")
+        return
+    print_results(stateless, stateful, per_round, conn, count, elapsed)
+
+
+if __name__ == "__main__":
+    main()